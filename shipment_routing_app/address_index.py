@@ -0,0 +1,161 @@
+import re
+from functools import lru_cache
+
+# Spelled out street tokens and the abbreviation they are normalized to
+STREET_TOKENS = {
+    'north': 'n', 'south': 's', 'east': 'e', 'west': 'w',
+    'northeast': 'ne', 'northwest': 'nw', 'southeast': 'se', 'southwest': 'sw',
+    'street': 'st', 'avenue': 'ave', 'av': 'ave', 'road': 'rd', 'boulevard': 'blvd', 'drive': 'dr', 'lane': 'ln',
+    'court': 'ct', 'place': 'pl', 'circle': 'cir', 'highway': 'hwy', 'parkway': 'pkwy', 'pky': 'pkwy',
+    'terrace': 'ter', 'square': 'sq', 'station': 'sta', 'center': 'ctr', 'centre': 'ctr',
+}
+
+# Normalized direction tokens, which have to match exactly ('500 N' and '500 S' are different streets)
+DIRECTION_TOKENS = {'n', 's', 'e', 'w', 'ne', 'nw', 'se', 'sw'}
+
+# Tokens that start a unit designator (e.g. '#104', 'Suite 5'), the unit isn't part of the street address
+UNIT_TOKENS = {'apt', 'apartment', 'ste', 'suite', 'unit', 'bldg', 'building', 'rm', 'room', 'fl', 'floor'}
+
+# Anything that isn't a letter, digit or '#' separates tokens
+SEPARATORS = re.compile(r'[^0-9a-z#]+')
+
+# Smallest trigram similarity (Dice coefficient, 0 to 1) for a fuzzy match to be accepted
+MIN_SIMILARITY = 0.6
+
+# Number of distinct input addresses whose resolved id is remembered
+CACHE_SIZE = 1 << 16
+
+
+# Normalizes an address string so that lookups are not thrown off by letter case, punctuation, stray whitespace,
+# spelled out street tokens ('South' vs 'S') or unit numbers
+# Time-Complexity: O(n) / Space-Complexity: O(n)
+# Where n is the length of the address string.
+def normalize_address(address):
+    tokens = []
+    skip_next = False
+    for token in SEPARATORS.split(address.casefold()):
+        if skip_next:
+            skip_next = False
+            continue
+        if not token:
+            continue
+        if token.startswith('#'):
+            # '#104' or '# 104', either way the unit number is dropped
+            skip_next = token == '#'
+            continue
+        if token in UNIT_TOKENS:
+            skip_next = True
+            continue
+        tokens.append(STREET_TOKENS.get(token, token))
+    return ' '.join(tokens)
+
+
+# Returns the set of character trigrams of a normalized address, padded so that the start and end count too
+# Time-Complexity: O(n) / Space-Complexity: O(n)
+def trigrams(normalized_address):
+    padded = f'  {normalized_address} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Splits a normalized address into its numbers and directions (in order) and its street name
+# Time-Complexity: O(n) / Space-Complexity: O(n)
+# '2010 w 500 s' is (('2010', 'w', '500', 's'), '') and '1060 dalton ave s' is (('1060', 's'), 'dalton ave'). A
+# misspelling can only be in the name: two addresses whose numbers or directions differ are never the same address.
+def split_address(normalized_address):
+    numbers = []
+    name = []
+    for token in normalized_address.split(' '):
+        if token.isdigit() or token in DIRECTION_TOKENS:
+            numbers.append(token)
+        else:
+            name.append(token)
+    return tuple(numbers), ' '.join(name)
+
+
+# Returns a dictionary from normalized address to address id for the rows of the address file
+# Time-Complexity: O(n * l) / Space-Complexity: O(n * l)
+# Where n is the number of addresses and l their length.
+def build_address_index(addresses):
+    address_index = {}
+    for address in addresses:
+        # Keep the first id if the same address is listed twice
+        address_index.setdefault(normalize_address(address['address']), address['address_id'])
+    return address_index
+
+
+class AddressResolver:
+
+    # Init the resolver over the known addresses (the rows of the address file)
+    # Time-Complexity: O(n * l) / Space-Complexity: O(n * l)
+    # Where n is the number of addresses and l their length. Uses the exact index from normalized address to address
+    # id (see build_address_index, a Loader passes the one it already has), and for addresses that don't match exactly
+    # the trigrams of every known address's street name, grouped by its numbers and directions (see split_address, or,
+    # for addresses without any, in an inverted trigram index: trigram -> address ids). Resolved input strings are kept
+    # in an LRU cache of cache_size entries, since the same address shows up on many packages.
+    def __init__(self, addresses, address_index=None, cache_size=CACHE_SIZE, min_similarity=MIN_SIMILARITY):
+        self.min_similarity = min_similarity
+        self.address_index = build_address_index(addresses) if address_index is None else address_index
+        self.trigram_sets = {}
+        self.number_index = {}
+        self.trigram_index = {}
+        for address in addresses:
+            if address['address_id'] in self.trigram_sets:
+                continue
+            numbers, name = split_address(normalize_address(address['address']))
+            self.trigram_sets[address['address_id']] = trigrams(name)
+            if numbers:
+                self.number_index.setdefault(numbers, []).append(address['address_id'])
+            else:
+                for trigram in self.trigram_sets[address['address_id']]:
+                    self.trigram_index.setdefault(trigram, []).append(address['address_id'])
+        self.resolve = lru_cache(maxsize=cache_size)(self.resolve_uncached)
+
+    # Returns the id of the known address closest to the given one by trigram similarity of the street names, or None
+    # if none is close enough
+    # Time-Complexity: O(c * l) / Space-Complexity: O(c)
+    # Where c is the number of candidates. Only known addresses with exactly the same house number, street numbers and
+    # directions are compared (so '4001 S 700 E' never resolves to '401 S 700 E', nor '2010 W 500 N' to '2010 W 500 S'),
+    # which are a handful even for large address files. An address without any numbers or directions is only compared
+    # to known addresses without any that it shares a trigram with, counted through the inverted trigram index. If two
+    # known addresses are equally close, the address is ambiguous and isn't resolved.
+    def fuzzy_match(self, normalized_address):
+        numbers, name = split_address(normalized_address)
+        query = trigrams(name)
+        if numbers:
+            shared_counts = {address_id: len(query & self.trigram_sets[address_id])
+                             for address_id in self.number_index.get(numbers, ())}
+        else:
+            shared_counts = {}
+            for trigram in query:
+                for address_id in self.trigram_index.get(trigram, ()):
+                    shared_counts[address_id] = shared_counts.get(address_id, 0) + 1
+
+        best_id = None
+        best_similarity = self.min_similarity
+        is_tied = False
+        for address_id, shared in shared_counts.items():
+            similarity = 2 * shared / (len(query) + len(self.trigram_sets[address_id]))
+            if similarity > best_similarity or best_id is None and similarity == best_similarity:
+                best_id, best_similarity, is_tied = address_id, similarity, False
+            elif similarity == best_similarity:
+                is_tied = True
+        return None if is_tied else best_id
+
+    # Returns the address id of an address: an exact match after normalizing, otherwise the closest fuzzy match, or
+    # None if it can't be resolved
+    # Time-Complexity: O(l) average-case for exact matches / Space-Complexity: O(l)
+    # Called through 'resolve', which caches the result per input string.
+    def resolve_uncached(self, address):
+        normalized = normalize_address(address)
+        address_id = self.address_index.get(normalized)
+        if address_id is None and normalized:
+            address_id = self.fuzzy_match(normalized)
+        return address_id
+
+    # Resolves many addresses at once, returns their address ids in the same order
+    # Time-Complexity: O(n + u * l) / Space-Complexity: O(n)
+    # Where u is the number of distinct addresses. Every distinct string is resolved once, however often it repeats.
+    def resolve_many(self, addresses):
+        resolve = self.resolve
+        resolved = {address: resolve(address) for address in dict.fromkeys(addresses)}
+        return [resolved[address] for address in addresses]
@@ -0,0 +1,210 @@
+import re
+from datetime import timedelta
+from package import parse_delivery_commitment_time
+from truck import TRUCK_CAPACITY, Truck
+
+# Patterns for the special notes in the package file
+TRUCK_NOTE = re.compile(r'can only be on truck (\d+)', re.IGNORECASE)
+DELAYED_NOTE = re.compile(r'delayed on flight.*until (\d{1,2}:\d{2}) ?([ap]m)', re.IGNORECASE)
+DELIVERED_WITH_NOTE = re.compile(r'must be delivered with ([\d,\s]+)', re.IGNORECASE)
+WRONG_ADDRESS_NOTE = re.compile(r'wrong address listed', re.IGNORECASE)
+
+
+class PackageGroup:
+    # A set of packages that has to ride on the same truck (linked by 'Must be delivered with' notes)
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __init__(self):
+        self.package_ids = []
+        self.weight = 0  # Total kilos of the packages
+        self.stops = set()
+        self.ready_time = None  # Earliest time the whole group is at the hub
+        self.latest_departure = None  # Latest hub departure that still reaches every deadline in the group
+        self.required_truck = None
+
+
+# Reads the constraints out of a package's notes
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+# Returns (required truck id, time the package is ready at the hub, ids it must be delivered with). A package with a
+# wrong address is held at the hub until address_correction_time.
+def parse_notes(notes, day_start, address_correction_time):
+    required_truck = None
+    ready_time = day_start
+    delivered_with = []
+
+    match = TRUCK_NOTE.search(notes)
+    if match:
+        required_truck = int(match.group(1))
+    match = DELAYED_NOTE.search(notes)
+    if match:
+        ready_time = max(ready_time, parse_delivery_commitment_time(f'{match.group(1)} {match.group(2)}'))
+    if WRONG_ADDRESS_NOTE.search(notes):
+        ready_time = max(ready_time, address_correction_time)
+    match = DELIVERED_WITH_NOTE.search(notes)
+    if match:
+        delivered_with = [int(package_id) for package_id in re.findall(r'\d+', match.group(1))]
+
+    return required_truck, ready_time, delivered_with
+
+
+# Finds the representative of a package in the union-find structure (with path halving)
+# Time-Complexity: O(α(n)) amortized / Space-Complexity: O(1)
+def find_group(parents, package_id):
+    while parents[package_id] != package_id:
+        parents[package_id] = parents[parents[package_id]]
+        package_id = parents[package_id]
+    return package_id
+
+
+# Builds the package groups from the notes of the given packages
+# Time-Complexity: O(n α(n)) / Space-Complexity: O(n)
+# Every constraint is read once and 'Must be delivered with' links are merged with union-find, so no pair of packages
+# is ever compared directly.
+def build_groups(packages, loader, travel_speed, day_start, address_correction_time):
+    parents = {package.id: package.id for package in packages}
+    constraints = {}
+    for package in packages:
+        required_truck, ready_time, delivered_with = parse_notes(package.notes, day_start, address_correction_time)
+        constraints[package.id] = (required_truck, ready_time)
+        for other_id in delivered_with:
+            if other_id in parents:
+                parents[find_group(parents, other_id)] = find_group(parents, package.id)
+
+    hub = loader.get_address_id(0)
+    groups = {}
+    for package in packages:
+        group = groups.setdefault(find_group(parents, package.id), PackageGroup())
+        required_truck, ready_time = constraints[package.id]
+        stop = loader.get_address_id(package.id)
+        group.package_ids.append(package.id)
+        group.weight += package.weight
+        group.stops.add(stop)
+
+        if group.ready_time is None or ready_time > group.ready_time:
+            group.ready_time = ready_time
+        if required_truck is not None:
+            if group.required_truck not in (None, required_truck):
+                raise ValueError(f'Packages delivered with package {package.id} are limited to different trucks')
+            group.required_truck = required_truck
+
+        deadline = package.delivery_commitment_time
+        if deadline is not None:
+            # The truck has to leave at least the direct travel time from the hub before the deadline
+            latest_departure = deadline - timedelta(hours=loader.distances[hub][stop] / travel_speed)
+            if group.latest_departure is None or latest_departure < group.latest_departure:
+                group.latest_departure = latest_departure
+    return list(groups.values())
+
+
+class TruckLoad:
+    # Incrementally tracked state of a truck while packages are assigned to it
+    # Time-Complexity: O(s) / Space-Complexity: O(s)
+    # Where s is the number of stops. 'nearest' holds, for every stop, the distance to the closest stop already on the
+    # truck (the hub to begin with), so the cost of adding a group is a constant time lookup per stop of the group.
+    # The package count and weight are kept as running totals, so checking whether a group fits is O(1).
+    def __init__(self, truck_id, day_start, distance_matrix, hub):
+        self.truck_id = truck_id
+        self.package_ids = []
+        self.weight = 0
+        self.stops = {hub}
+        self.departure_time = day_start
+        self.latest_departure = None
+        self.nearest = list(distance_matrix[hub])
+
+    # Returns True if the group fits the truck's capacity (packages and kilos, max_weight None for no limit), truck
+    # restriction and departure window
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def accepts(self, group, capacity, max_weight=None):
+        if len(self.package_ids) + len(group.package_ids) > capacity:
+            return False
+        if max_weight is not None and self.weight + group.weight > max_weight:
+            return False
+        if group.required_truck is not None and group.required_truck != self.truck_id:
+            return False
+        departure_time = max(self.departure_time, group.ready_time)
+        for latest_departure in (self.latest_departure, group.latest_departure):
+            if latest_departure is not None and departure_time > latest_departure:
+                return False
+        return True
+
+    # Returns the extra distance (lower bound) of adding the group's stops to the truck
+    # Time-Complexity: O(g) / Space-Complexity: O(1)
+    # Where g is the number of stops in the group.
+    def cost(self, group):
+        return sum(map(self.nearest.__getitem__, group.stops))
+
+    # Adds the group to the truck and updates the departure window and nearest-stop distances
+    # Time-Complexity: O(g * s) / Space-Complexity: O(g)
+    # Only new stops update 'nearest', so over a whole assignment each stop does this at most once per truck.
+    # Returns the stops that were new to the truck.
+    def add(self, group, distance_matrix):
+        new_stops = []
+        self.package_ids.extend(group.package_ids)
+        self.weight += group.weight
+        self.departure_time = max(self.departure_time, group.ready_time)
+        if group.latest_departure is not None and (self.latest_departure is None
+                                                   or group.latest_departure < self.latest_departure):
+            self.latest_departure = group.latest_departure
+        for stop in group.stops:
+            if stop not in self.stops:
+                self.stops.add(stop)
+                self.nearest = list(map(min, self.nearest, distance_matrix[stop]))
+                new_stops.append(stop)
+        return new_stops
+
+
+# Assigns the given packages (all packages by default) to truck_count trucks and sets their departure times
+# Time-Complexity: O(n log n + g * t + s^2 * t) / Space-Complexity: O(n + s * t)
+# Where n is the number of packages, g the number of groups, t the number of trucks and s the number of stops.
+# Greedy cheapest-insertion heuristic: groups restricted to a truck are placed first, then groups with the earliest
+# deadlines, then everything else. Each group goes to the truck that accepts it (capacity, truck restriction, arrival
+# at the hub, deadline) and is closest to the stops it already has, preferring trucks whose departure time it doesn't
+# push back. A truck leaves the hub as soon as all of its packages are there. Trucks are indexed by the stops they
+# already visit, so a single-stop group that can join such a truck at no extra distance skips the scan of all trucks.
+# capacity is the most packages and max_weight the most kilos (None for no limit) a truck carries.
+def assign_packages(loader, truck_count=3, capacity=TRUCK_CAPACITY, packages=None, travel_speed=18,
+                    day_start=timedelta(hours=8), address_correction_time=timedelta(hours=10, minutes=20),
+                    max_weight=None):
+    if packages is None:
+        # Packages whose address couldn't be resolved can't be routed, see Loader.unresolved_packages
+        packages = [loader.hashtable.lookup(package_id) for package_id, node_id in loader.package_nodes.items()
+                    if node_id is not None]
+    groups = build_groups(packages, loader, travel_speed, day_start, address_correction_time)
+    groups.sort(key=lambda group: (group.required_truck is None, group.ready_time <= day_start,
+                                   group.latest_departure if group.latest_departure is not None else timedelta.max,
+                                   -len(group.package_ids)))
+
+    hub = loader.get_address_id(0)
+    loads = [TruckLoad(truck_id, day_start, loader.distances, hub) for truck_id in range(1, truck_count + 1)]
+    loads_by_id = {load.truck_id: load for load in loads}
+    loads_by_stop = {}
+    # Trucks that still have room, full trucks are dropped so later groups don't keep checking them
+    open_loads = list(loads)
+    for group in groups:
+        if len(group.package_ids) > capacity or (max_weight is not None and group.weight > max_weight):
+            raise ValueError(f'Package group {sorted(group.package_ids)} does not fit on a single truck')
+
+        best = None
+        if len(group.stops) == 1:
+            # A truck that already stops at this address and doesn't have to wait for the group costs nothing extra
+            for load in loads_by_stop.get(next(iter(group.stops)), ()):
+                if group.ready_time <= load.departure_time and load.accepts(group, capacity, max_weight):
+                    best = load
+                    break
+
+        if best is None:
+            if group.required_truck is not None:
+                candidates = [loads_by_id[group.required_truck]] if group.required_truck in loads_by_id else []
+            else:
+                candidates = open_loads
+            candidates = [load for load in candidates if load.accepts(group, capacity, max_weight)]
+            if not candidates:
+                raise ValueError(f'No truck can take packages {sorted(group.package_ids)} within its constraints')
+            best = min(candidates, key=lambda load: (group.ready_time > load.departure_time, load.cost(group)))
+
+        for stop in best.add(group, loader.distances):
+            loads_by_stop.setdefault(stop, []).append(best)
+        if len(best.package_ids) >= capacity and best in open_loads:
+            open_loads.remove(best)
+
+    return [Truck(load.truck_id, load.package_ids, load.departure_time, capacity=capacity, max_weight=max_weight,
+                  loaded_weight=load.weight) for load in loads]
@@ -0,0 +1,216 @@
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import timedelta
+from exact_routing import EXACT_MAX_STOPS, ROUTE_COLUMNS, SOLVERS, route_report
+from instrumentation import FORMATS
+from package import format_delivery_commitment_time, parse_report_time
+from package_store import STATUS_CODES, STATUSES
+from truck import TRUCK_CAPACITY
+from truck_packing import LOADINGS
+
+# Columns of the package reports
+PACKAGE_COLUMNS = ('package_id', 'address', 'city', 'zipcode', 'weight', 'deadline', 'truck', 'status',
+                   'delivery_time')
+
+# Columns of the truck report
+TRUCK_COLUMNS = ('truck', 'departure_time', 'package_count', 'distance_traveled', 'depot', 'day', 'weight')
+
+
+# Converts a time of day in HH:MM or HH:MM:SS format into a timedelta
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+# Fleet plans run over several days, a later day is given with a prefix like the reports print it ('1 day, 9:00:00').
+def parse_time_of_day(value):
+    try:
+        return parse_report_time(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+
+# Returns a report row for a package, taking status, address and delivery time from a timeline state if one is given
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+def package_row(package, state=None):
+    if state is None:
+        address, zipcode, status, delivery_time = package.address, package.zipcode, package.status, \
+            package.delivery_time
+    else:
+        address, zipcode, status, delivery_time = state.address, state.zipcode, state.status, state.delivery_time
+    return report_row(package, address, zipcode, status, delivery_time)
+
+
+# Returns a report row for a package with the given address, status and delivery time
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+def report_row(package, address, zipcode, status, delivery_time):
+    return [package.id, address, package.city, zipcode, package.weight,
+            format_delivery_commitment_time(package.delivery_commitment_time),
+            package.assigned_truck if package.assigned_truck else '', status,
+            str(delivery_time) if delivery_time is not None else '']
+
+
+# Returns the EOD report rows for all packages, sorted by package id
+# Time-Complexity: O(n log n) / Space-Complexity: O(n)
+def eod_report(context):
+    return [package_row(package) for package in sorted(context.loader.hashtable, key=lambda package: package.id)]
+
+
+# Returns the EOD report rows for the given package ids, raising a KeyError for an unknown id
+# Time-Complexity: O(n) average-case / Space-Complexity: O(n)
+# Where n is the number of ids, one hash table lookup each.
+def package_report(context, package_ids):
+    rows = []
+    for package_id in package_ids:
+        package = context.loader.hashtable.lookup(package_id)
+        if package is None:
+            raise KeyError(f'Package ID {package_id} not found')
+        rows.append(package_row(package))
+    return rows
+
+
+# Returns snapshot rows (time followed by the package columns) for every given time, in time order
+# Time-Complexity: O(t * p + e + t log t) / Space-Complexity: O(t * p)
+# Where t is the number of times, p the number of packages in the report and e the number of events. All times are
+# computed in a single pass over the delivery timeline. Only the given package ids are reported if there are any.
+# With a package store (see Loader.build_package_store) the statuses come from a sweep over its departure and delivery
+# time columns instead of copies of the timeline's package states, only packages whose address was corrected are
+# looked up on the timeline.
+def snapshot_report(context, times, package_ids=None):
+    hashtable = context.loader.hashtable
+    if package_ids:
+        packages = []
+        for package_id in package_ids:
+            package = hashtable.lookup(package_id)
+            if package is None:
+                raise KeyError(f'Package ID {package_id} not found')
+            packages.append(package)
+    else:
+        packages = sorted(hashtable, key=lambda package: package.id)
+
+    store = context.loader.package_store
+    if store is not None:
+        return store_snapshot_report(context, store, times, packages)
+    rows = []
+    for time, states in context.timeline.snapshots(times):
+        time_label = str(time)
+        rows.extend([time_label] + package_row(package, states.get(package.id)) for package in packages)
+    return rows
+
+
+# Returns the snapshot rows of the given packages from the package store's status sweep, see snapshot_report
+# Time-Complexity: O(t * p + n log n + t log t) / Space-Complexity: O(t * p + n)
+def store_snapshot_report(context, store, times, packages):
+    times = sorted(times)
+    timeline = context.timeline
+    rows_of_packages = [None if package.id in timeline.original_addresses else store.rows.get(package.id)
+                        for package in packages]
+    delivery_times = store.delivery_times
+    delivered = STATUS_CODES['Delivered']
+    rows = []
+    for time, (_, statuses) in zip(times, store.snapshots([time.total_seconds() for time in times])):
+        time_label = str(time)
+        for package, row in zip(packages, rows_of_packages):
+            if row is None:
+                rows.append([time_label] + package_row(package, timeline.package_state(package.id, time)))
+                continue
+            status = statuses[row]
+            delivery_time = timedelta(seconds=delivery_times[row]) if status == delivered else None
+            rows.append([time_label] + report_row(package, package.address, package.zipcode, STATUSES[status],
+                                                  delivery_time))
+    return rows
+
+
+# Returns one row per truck with its departure time, package count, distance traveled, depot, day and kilos loaded
+# Time-Complexity: O(t) / Space-Complexity: O(t)
+def truck_report(context):
+    return [[truck.id, str(truck.hub_departure_time), len(truck.loaded_packages), truck.distance_traveled, truck.depot,
+             truck.day, truck.loaded_weight] for truck in context.trucks]
+
+
+# Writes report rows to the output as CSV (with a header row) or as a JSON list of objects
+# Time-Complexity: O(n) / Space-Complexity: O(n)
+# The whole report is assembled in a buffer and written with a single call.
+def write_report(rows, columns, output, output_format='csv'):
+    buffer = io.StringIO()
+    if output_format == 'json':
+        json.dump([dict(zip(columns, row)) for row in rows], buffer, indent=2)
+        buffer.write('\n')
+    else:
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(columns)
+        writer.writerows(rows)
+    output.write(buffer.getvalue())
+
+
+# Returns the argument parser for the batch reports
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+def build_parser():
+    parser = argparse.ArgumentParser(prog='main.py', description='Write WGUPS delivery reports without the TUI.')
+    parser.add_argument('--format', choices=('csv', 'json'), default='csv', help='output format (default: csv)')
+    parser.add_argument('--output', help='file to write the report to (default: standard output)')
+    parser.add_argument('--cache-dir', metavar='DIRECTORY',
+                        help='keep the parsed dataset in a cache here and read it from there on later runs')
+    parser.add_argument('--package-store', action='store_true',
+                        help='also keep the packages in typed columns that address and deadline lookups and the '
+                             'snapshot report read from')
+    routing = parser.add_argument_group('routing', 'how the routes of the sample day are solved')
+    routing.add_argument('--solver', choices=SOLVERS, default='heuristic',
+                         help='keep the heuristic routes or solve small routes exactly (default: heuristic)')
+    routing.add_argument('--exact-max-stops', type=int, default=EXACT_MAX_STOPS, metavar='N',
+                         help=f'most stops of a route solved exactly, larger ones stay heuristic '
+                              f'(default: {EXACT_MAX_STOPS})')
+    loading = parser.add_argument_group('truck loading', 'how packages are loaded onto trucks')
+    loading.add_argument('--loading', choices=LOADINGS, default='assign',
+                         help='fill the given trucks or pack onto as few trucks as possible (default: assign)')
+    loading.add_argument('--capacity', type=int, default=TRUCK_CAPACITY,
+                         help=f'packages per truck (default: {TRUCK_CAPACITY})')
+    loading.add_argument('--max-weight', type=float, metavar='KILOS', help='kilos per truck (default: no limit)')
+    fleet = parser.add_argument_group('fleet planning', 'plan several depots and days instead of the sample day')
+    fleet.add_argument('--depot', dest='depots', action='append', type=int, metavar='ADDRESS_ID',
+                       help='address ID of a depot (can be repeated)')
+    fleet.add_argument('--days', type=int, default=1, help='number of days to plan (default: 1)')
+    fleet.add_argument('--trucks', type=int, default=3, help='trucks per depot and day (default: 3)')
+    fleet.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    instrument = parser.add_argument_group('instrumentation', 'record stage timings and lookup counts of the run '
+                                                              '(also turned on by SHIPMENT_ROUTING_INSTRUMENT=FILE)')
+    instrument.add_argument('--instrument', metavar='FILE', help='file to write the timings and counters to')
+    instrument.add_argument('--instrument-format', choices=FORMATS, default='json',
+                            help='json report or chrome trace (default: json)')
+    instrument.add_argument('--profile', action='store_true', help='also profile the run with cProfile')
+    instrument.add_argument('--trace-memory', action='store_true', help='also record the peak memory of each stage')
+    reports = parser.add_subparsers(dest='report', required=True)
+    reports.add_parser('eod', help='EOD report for all packages')
+    packages = reports.add_parser('packages', help='EOD report for the given package IDs')
+    packages.add_argument('package_ids', nargs='+', type=int, metavar='ID')
+    snapshot = reports.add_parser('snapshot', help='status of the packages at one or more times')
+    snapshot.add_argument('times', nargs='+', type=parse_time_of_day, metavar='HH:MM:SS',
+                          help="time of day, prefixed with '1 day, ' and so on for later days of a fleet plan")
+    snapshot.add_argument('--package', dest='package_ids', action='append', type=int, metavar='ID',
+                          help='only report this package ID (can be repeated)')
+    reports.add_parser('trucks', help='departure time, package count and mileage per truck')
+    reports.add_parser('routes', help='solver method, distance, optimality gap and solve time per truck route')
+    return parser
+
+
+# Runs a batch report for arguments parsed with build_parser, the non-interactive counterpart to run_tui
+# Time-Complexity: depends on the report / Space-Complexity: O(n) for the report rows
+def run_batch(context, args):
+    try:
+        if args.report == 'eod':
+            rows, columns = eod_report(context), PACKAGE_COLUMNS
+        elif args.report == 'packages':
+            rows, columns = package_report(context, args.package_ids), PACKAGE_COLUMNS
+        elif args.report == 'snapshot':
+            rows, columns = snapshot_report(context, args.times, args.package_ids), ('time',) + PACKAGE_COLUMNS
+        elif args.report == 'routes':
+            rows, columns = route_report(context.trucks, context.route_solutions), ROUTE_COLUMNS
+        else:
+            rows, columns = truck_report(context), TRUCK_COLUMNS
+    except KeyError as error:
+        build_parser().error(error.args[0])
+
+    if args.output:
+        with open(args.output, 'w', newline='') as output:
+            write_report(rows, columns, output, args.format)
+    else:
+        write_report(rows, columns, sys.stdout, args.format)
@@ -0,0 +1,277 @@
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from assignment import assign_packages
+from context import RoutingContext
+from delivery_times import arrival_times, route_stops
+from exact_routing import solve_truck_routes
+from loader import DISTANCE_BACKENDS
+from main import deliver_packages
+from nearest_neighbor import calculate_deadline_first_route
+from route_optimizer import improve_truck_routes
+from time_windows import calculate_time_window_route
+from synthetic_data import default_fleet, write_dataset
+from truck_packing import pack_packages, truck_lower_bound
+
+# Manifest sizes benchmarked by default, larger ones (up to 10^6) can be given with --sizes
+DEFAULT_SIZES = (100, 1000, 10000)
+
+# Number of random single-package snapshot queries and of full snapshots timed per run
+PACKAGE_QUERY_COUNT = 10000
+SNAPSHOT_TIMES = tuple(timedelta(hours=8, minutes=30 * i) for i in range(20))
+
+
+class StageTimer:
+
+    # Collects the timing (and optionally the peak traced memory) of the stages of one benchmark run
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.stages = {}
+
+    # Runs a stage and records its time, items per second and peak memory, returns what the stage returned
+    # Time-Complexity: that of the stage / Space-Complexity: O(1)
+    # 'items' is the number of things (packages, lookups, queries) the stage processes, used for the throughput.
+    def run(self, name, items, stage, *args, **kwargs):
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = stage(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        record = {'seconds': round(seconds, 6), 'items': items,
+                  'items_per_second': round(items / seconds, 1) if seconds > 0 else None}
+        if self.trace_memory:
+            record['peak_traced_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.stages[name] = record
+        return result
+
+
+# Loads a dataset including its distance matrix (which the Loader otherwise reads lazily), returns (loader, distances)
+# Time-Complexity: O(n + m^2) / Space-Complexity: O(n + m^2)
+def load_dataset(context):
+    loader = context.loader
+    distances = loader.distances
+    return loader, distances
+
+
+# Looks up every package in the hash table, returns how many were found
+# Time-Complexity: O(n) average-case / Space-Complexity: O(1)
+def lookup_packages(loader, package_ids):
+    lookup = loader.hashtable.lookup
+    return sum(1 for package_id in package_ids if lookup(package_id) is not None)
+
+
+# Resolves the address id of every package, returns how many were resolved
+# Time-Complexity: O(n) / Space-Complexity: O(1)
+def resolve_address_ids(loader, package_ids):
+    get_address_id = loader.get_address_id
+    return sum(1 for package_id in package_ids if get_address_id(package_id) is not None)
+
+
+# Assigns the packages to trucks and marks each package with its truck
+# Time-Complexity: see assign_packages / Space-Complexity: O(n)
+def assign(loader, truck_count, capacity):
+    trucks = assign_packages(loader, truck_count=truck_count, capacity=capacity)
+    for truck in trucks:
+        for package_id in truck.loaded_packages:
+            loader.hashtable.lookup(package_id).assigned_truck = truck.id
+    return trucks
+
+
+# Builds the nearest neighbor routes of all trucks, returns (routes, total mileage)
+# Time-Complexity: O(t * (n + s^2)) / Space-Complexity: O(n)
+def route_trucks(loader, trucks):
+    routes = [calculate_deadline_first_route(truck.current_location, truck.loaded_packages, loader) for truck in trucks]
+    return [route for route, _ in routes], sum(distance for _, distance in routes)
+
+
+# Returns the number of packages the routes of the trucks deliver after their deadline
+# Time-Complexity: O(n) / Space-Complexity: O(n)
+def count_late_packages(loader, trucks, routes):
+    late_count = 0
+    for truck, route in zip(trucks, routes):
+        times = arrival_times(route_stops(route, loader), loader.distances, truck.hub_departure_time.total_seconds(),
+                              truck.travel_speed)
+        for package_id, arrival_time in zip(route[1:], times):
+            deadline = loader.hashtable.lookup(package_id).delivery_commitment_time
+            if deadline is not None and arrival_time > deadline.total_seconds():
+                late_count += 1
+    return late_count
+
+
+# Builds the deadline-aware routes of all trucks, returns (routes, total mileage, number of packages planned late)
+# Time-Complexity: O(t * (n + s^2)) / Space-Complexity: O(n)
+def route_trucks_with_time_windows(loader, trucks):
+    routes = [calculate_time_window_route(truck, loader) for truck in trucks]
+    return ([route for route, _, _ in routes], sum(distance for _, distance, _ in routes),
+            sum(len(late_packages) for _, _, late_packages in routes))
+
+
+# Solves the routes of the trucks with up to max_stops stops exactly, returns (routes, heuristic gaps of those trucks)
+# Time-Complexity: O(t * s^2 * 2^s) / Space-Complexity: O(n + s * 2^s)
+# The gaps measure how far the improved heuristic routes are from the optimum.
+def solve_exactly(loader, trucks, routes, max_stops):
+    solved_routes, solutions = solve_truck_routes(trucks, routes, loader, max_stops)
+    return solved_routes, [solution.heuristic_gap for solution in solutions if solution.heuristic_gap is not None]
+
+
+# Delivers the packages of all trucks along their routes, returns the number of packages delivered late
+# Time-Complexity: O(n) / Space-Complexity: O(n)
+def deliver(context, trucks, routes):
+    late_count = 0
+    for truck, route in zip(trucks, routes):
+        deliver_packages(context, truck, route)
+        for package_id in route[1:]:
+            package = context.loader.hashtable.lookup(package_id)
+            deadline = package.delivery_commitment_time
+            if deadline is not None and package.delivery_time > deadline:
+                late_count += 1
+    return late_count
+
+
+# Takes a full snapshot of all packages at each of the given times
+# Time-Complexity: O(t * (n + e)) / Space-Complexity: O(n)
+def take_snapshots(timeline, times):
+    for time_snapshot in times:
+        timeline.snapshot(time_snapshot)
+
+
+# Looks up the state of the given packages at the given times
+# Time-Complexity: O(q log m) / Space-Complexity: O(1)
+def query_packages(timeline, queries):
+    for package_id, time_snapshot in queries:
+        timeline.package_state(package_id, time_snapshot)
+
+
+# Runs the whole pipeline (load, lookup, assign, route, time window route, improve, deliver, query) on one synthetic
+# manifest
+# Time-Complexity: dominated by routing and route improvement / Space-Complexity: O(n + m^2)
+# The time window routes are only the starting point of the improvement pass, so the nearest neighbor baseline is
+# improved the same way ('improve_nearest_neighbor') and both are reported before and after, with their late packages.
+# The 'pack' stage packs the same packages onto as few trucks as possible (see truck_packing) and reports how many
+# trucks that takes against the lower bound from the package count. With exact_max_stops the improved routes of trucks
+# with up to that many stops are then solved exactly (the 'exact' stage), and the mileage and the heuristic's mean and
+# worst gap to the optimum are reported. The synthetic manifests don't promise that the default fleet can deliver every
+# package on time, so 'deadlines_met' says whether the delivered plan did.
+def run_benchmark(package_count, directory, seed=0, trace_memory=False, improve_time_limit=1.0,
+                  distance_backend='table', exact_max_stops=None, cache_directory=None):
+    files = write_dataset(directory, package_count, seed=seed)
+    timer = StageTimer(trace_memory)
+    context = RoutingContext(*files, cache_directory=cache_directory, distance_backend=distance_backend)
+
+    loader, distances = timer.run('load', package_count, load_dataset, context)
+    package_ids = list(range(1, package_count + 1))
+    timer.run('hash_table_lookup', package_count, lookup_packages, loader, package_ids)
+    timer.run('address_id_lookup', package_count, resolve_address_ids, loader, package_ids)
+
+    truck_count, capacity = default_fleet(package_count)
+    result = {'packages': package_count, 'addresses': len(distances), 'trucks': truck_count,
+              'truck_capacity': capacity, 'seed': seed, 'distance_backend': distance_backend}
+    try:
+        trucks = timer.run('assign', package_count, assign, loader, truck_count, capacity)
+    except ValueError as error:
+        # Report an infeasible manifest instead of losing the timings of the other sizes
+        result.update(error=str(error), stages=timer.stages)
+        return result
+    context.trucks.extend(trucks)
+    try:
+        packed_trucks = timer.run('pack', package_count, pack_packages, loader, capacity)
+        result['packing'] = {'trucks': len(packed_trucks),
+                             'truck_lower_bound': truck_lower_bound(list(loader.hashtable), capacity)}
+    except ValueError as error:
+        result['packing'] = {'error': str(error)}
+
+    nearest_neighbor_routes, nearest_neighbor_mileage = timer.run('route', package_count, route_trucks, loader, trucks)
+    nearest_neighbor_improved = timer.run('improve_nearest_neighbor', package_count, improve_truck_routes, trucks,
+                                          nearest_neighbor_routes, loader, time_limit=improve_time_limit)
+    routes, time_window_mileage, planned_late_count = timer.run('time_window_route', package_count,
+                                                                route_trucks_with_time_windows, loader, trucks)
+    improved = timer.run('improve', package_count, improve_truck_routes, trucks, routes, loader,
+                         time_limit=improve_time_limit)
+    mileage = {'nearest_neighbor': round(nearest_neighbor_mileage, 1),
+               'nearest_neighbor_improved': round(sum(distance for _, distance in nearest_neighbor_improved), 1),
+               'time_window': round(time_window_mileage, 1),
+               'improved': round(sum(distance for _, distance in improved), 1)}
+    route_late_packages = {
+        'nearest_neighbor': count_late_packages(loader, trucks, nearest_neighbor_routes),
+        'nearest_neighbor_improved': count_late_packages(loader, trucks,
+                                                         [route for route, _ in nearest_neighbor_improved]),
+        'time_window': planned_late_count,
+        'improved': count_late_packages(loader, trucks, [route for route, _ in improved])}
+    if exact_max_stops is not None:
+        improved, gaps = timer.run('exact', package_count, solve_exactly, loader, trucks, improved, exact_max_stops)
+        mileage['exact'] = round(sum(distance for _, distance in improved), 1)
+        result['exact'] = {'max_stops': exact_max_stops, 'solved_trucks': len(gaps),
+                           'mean_heuristic_gap': round(sum(gaps) / len(gaps), 4) if gaps else None,
+                           'max_heuristic_gap': round(max(gaps), 4) if gaps else None}
+    routes = [route for route, _ in improved]
+    for truck, (_, distance) in zip(trucks, improved):
+        truck.distance_traveled = round(distance, 2)
+    late_count = timer.run('deliver', package_count, deliver, context, trucks, routes)
+
+    rng = random.Random(seed)
+    queries = [(rng.choice(package_ids), rng.choice(SNAPSHOT_TIMES)) for _ in range(PACKAGE_QUERY_COUNT)]
+    timer.run('snapshot', len(SNAPSHOT_TIMES), take_snapshots, context.timeline, SNAPSHOT_TIMES)
+    timer.run('package_query', PACKAGE_QUERY_COUNT, query_packages, context.timeline, queries)
+
+    result.update(stages=timer.stages, mileage=mileage, route_late_packages=route_late_packages,
+                  planned_late_packages=planned_late_count, late_packages=late_count, deadlines_met=late_count == 0)
+    return result
+
+
+# Runs the benchmark for every size and writes the results as JSON
+# Time-Complexity: sum over the sizes / Space-Complexity: O(n + m^2) for the largest size
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark loading, assignment, routing and snapshot queries on '
+                                                 'synthetic manifests and report the results as JSON.')
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES, metavar='N',
+                        help='number of packages per run (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data (default: 0)')
+    parser.add_argument('--improve-time-limit', type=float, default=1.0, metavar='SECONDS',
+                        help='time limit of the 2-opt / Or-opt pass per truck (default: 1.0)')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='record the peak traced memory of each stage (slows every stage down)')
+    parser.add_argument('--distance-backend', choices=DISTANCE_BACKENDS, default='table',
+                        help='read distances from the table or compute them from coordinates (default: table)')
+    parser.add_argument('--exact-max-stops', type=int, metavar='N',
+                        help='also solve the routes of up to N stops exactly and report the heuristic gap')
+    parser.add_argument('--data-directory', help='keep the generated datasets here instead of a temporary directory')
+    parser.add_argument('--cache-dir', metavar='DIRECTORY',
+                        help="load the datasets through a dataset cache here, so 'load' measures reading the cache "
+                             "from the second run on (default: no cache)")
+    parser.add_argument('--output', help='file to write the JSON results to (default: standard output)')
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        for size in args.sizes:
+            directory = os.path.join(args.data_directory or temporary_directory, f'manifest_{size}')
+            result = run_benchmark(size, directory, args.seed, args.trace_memory, args.improve_time_limit,
+                                   args.distance_backend, args.exact_max_stops, args.cache_dir)
+            if 'error' in result:
+                print(f'Warning: no plan for {size} packages: {result["error"]}', file=sys.stderr)
+            elif not result['deadlines_met']:
+                print(f'Warning: the plan for {size} packages on {result["trucks"]} trucks delivers '
+                      f'{result["late_packages"]} packages after their deadline', file=sys.stderr)
+            results.append(result)
+
+    report = {'python': platform.python_version(), 'platform': platform.platform(), 'results': results,
+              'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    output = open(args.output, 'w') if args.output else sys.stdout
+    json.dump(report, output, indent=2)
+    output.write('\n')
+    if args.output:
+        output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import os
+from datetime import timedelta
+import instrumentation
+from dataset_cache import load_cached
+from loader import Loader
+from route_cache import RouteCache
+from simulation import DeliveryTimeline
+
+# Directory of the sample dataset, resolved from this file so it doesn't depend on the working directory
+DATA_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'csv')
+
+# Address corrections known ahead of planning: (time the correction comes in, package id, address, zipcode). Package 9
+# is held at the hub until its correct address comes in at 10:20.
+ADDRESS_CORRECTIONS = ((timedelta(hours=10, minutes=20), 9, '410 S State St', '84111'),)
+
+
+class RoutingContext:
+
+    # Init the context for one dataset, defaulting to the sample CSV files
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # Holds the loader, the trucks and the delivery timeline of one dataset and is passed explicitly to the functions
+    # that need them. Nothing is read from disk here: the Loader is created on first use of 'loader', so code that never
+    # touches the data doesn't pay for it, and several contexts (datasets) can live in one process without sharing
+    # state.
+    # With a cache_directory, the parsed dataset is read from (and on a miss written to) a binary cache there, see
+    # dataset_cache.load_cached. distance_backend picks where distances come from (see loader.DISTANCE_BACKENDS), the
+    # cache only holds the distance table, so it isn't used with the coordinate backend. With package_store the loader
+    # also keeps its packages in columns (see Loader.build_package_store) that routing and the snapshot report read.
+    def __init__(self, packages_file=None, addresses_file=None, distances_file=None, data_directory=DATA_DIRECTORY,
+                 cache_directory=None, distance_backend='table', package_store=False):
+        self.packages_file = packages_file or os.path.join(data_directory, 'package_data.csv')
+        self.addresses_file = addresses_file or os.path.join(data_directory, 'street_addresses.csv')
+        self.distances_file = distances_file or os.path.join(data_directory, 'distance_table.csv')
+        self.cache_directory = cache_directory
+        self.distance_backend = distance_backend
+        self.package_store = package_store
+        self.trucks = []
+        self.timeline = DeliveryTimeline()
+        self.late_packages = []  # (package id, arrival time, deadline) for packages planned to arrive late
+        self.route_solutions = []  # exact_routing.RouteSolution per truck, see main.plan_deliveries
+        self._loader = None
+        self._route_cache = None
+        self.corrections_applied = False
+
+    # Returns the Loader for this dataset, loading the packages and addresses the first time it is used
+    # Time-Complexity: O(n) on first use, O(1) afterwards / Space-Complexity: O(n)
+    # With instrumentation on, loading is recorded as the 'load' stage and the loader's lookups are counted from then
+    # on.
+    @property
+    def loader(self):
+        if self._loader is None:
+            with instrumentation.stage('load'):
+                if self.cache_directory is not None and self.distance_backend == 'table':
+                    self._loader = load_cached(self.packages_file, self.addresses_file, self.distances_file,
+                                               self.cache_directory)
+                else:
+                    self._loader = Loader(self.packages_file, self.addresses_file, self.distances_file,
+                                          self.distance_backend)
+                if self.package_store:
+                    self._loader.build_package_store()
+                instrumentation.instrument_loader(self._loader)
+        return self._loader
+
+    # Applies ADDRESS_CORRECTIONS to the packages that are in the dataset and records them on the timeline
+    # Time-Complexity: O(c) average-case / Space-Complexity: O(c)
+    # Where c is the number of corrections. Both plan_deliveries and fleet_planner.plan_fleet call this before the
+    # packages are routed, so every plan delivers to the corrected addresses. Only the first call changes anything.
+    def apply_address_corrections(self):
+        if self.corrections_applied:
+            return
+        loader = self.loader
+        for time, package_id, address, zipcode in ADDRESS_CORRECTIONS:
+            package = loader.hashtable.lookup(package_id)
+            if package is None:
+                continue
+            self.timeline.add_address_correction(time, package_id, package.address, package.zipcode, address, zipcode)
+            loader.update_package_address(package_id, address, zipcode)
+        self.corrections_applied = True
+
+    # Returns the route cache of this dataset (see route_cache.RouteCache), created the first time it is used
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # Kept for the life of the context, so planning the same loads again (what-if runs) reuses their routes.
+    @property
+    def route_cache(self):
+        if self._route_cache is None:
+            self._route_cache = RouteCache(self.loader.distances)
+        return self._route_cache
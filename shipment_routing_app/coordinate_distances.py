@@ -0,0 +1,262 @@
+from array import array
+from functools import lru_cache
+from itertools import islice
+from math import asin, cos, hypot, radians, sin, sqrt
+
+# Mean radius of the earth and the length of one degree of latitude, in miles
+EARTH_RADIUS = 3958.8
+MILES_PER_DEGREE = 69.09
+
+# Distance functions of the coordinate backend
+METRICS = ('manhattan', 'euclidean', 'haversine')
+
+# Number of address pairs whose distance is remembered
+CACHE_SIZE = 1 << 20
+
+# Average number of points per grid cell of the spatial index
+POINTS_PER_CELL = 2
+
+
+class SpatialGrid:
+
+    # Init a uniform grid over points given in miles (x, y), for nearest neighbor queries
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    # The cell size is picked so that there are about POINTS_PER_CELL points per cell. A query only looks at the cells
+    # around the query point, ring by ring, and stops once no closer point can be in the next ring, so it examines a
+    # handful of points instead of all of them. Points can be removed (e.g. stops that were already visited).
+    # The shorter side of the bounding box counts as at least the longer side over the number of points, so points on
+    # (almost) a line don't shrink the cells to nothing and leave a query thousands of empty rings to walk.
+    def __init__(self, points, metric='euclidean'):
+        self.metric = metric
+        self.points = dict(points)
+        self.cells = {}
+        if not self.points:
+            self.cell_size = 1.0
+            self.min_cell = self.max_cell = (0, 0)
+            return
+        xs = [x for x, _ in self.points.values()]
+        ys = [y for _, y in self.points.values()]
+        width, height = max(xs) - min(xs), max(ys) - min(ys)
+        shortest_side = max(width, height, 1e-9) / len(self.points)
+        area = max(width, shortest_side) * max(height, shortest_side)
+        self.cell_size = max(sqrt(area * POINTS_PER_CELL / len(self.points)), 1e-9)
+        for point_id, (x, y) in self.points.items():
+            self.cells.setdefault(self.cell_of(x, y), set()).add(point_id)
+        # Corners of the occupied cells, removals only ever make the occupied area smaller
+        self.min_cell = min(cell_x for cell_x, _ in self.cells), min(cell_y for _, cell_y in self.cells)
+        self.max_cell = max(cell_x for cell_x, _ in self.cells), max(cell_y for _, cell_y in self.cells)
+
+    # Returns the grid cell of a point
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def cell_of(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    # Removes a point from the grid
+    # Time-Complexity: O(1) average-case / Space-Complexity: O(1)
+    def remove(self, point_id):
+        x, y = self.points.pop(point_id)
+        cell = self.cells[self.cell_of(x, y)]
+        cell.discard(point_id)
+        if not cell:
+            del self.cells[self.cell_of(x, y)]
+
+    # Returns the distance between two points in miles with the grid's metric
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def distance(self, x_a, y_a, x_b, y_b):
+        if self.metric == 'manhattan':
+            return abs(x_a - x_b) + abs(y_a - y_b)
+        return hypot(x_a - x_b, y_a - y_b)
+
+    # Returns the ids of the k points closest to (x, y), closest first
+    # Time-Complexity: O(k + c) average-case / Space-Complexity: O(k)
+    # Where c is the number of points in the cells that are searched. Ring r holds the cells r steps away from the
+    # query's cell, so every point beyond it is more than r cell sizes away on some axis: once k points at most that far
+    # are found, the search is done. Ties go to the lowest id. A query outside the occupied cells starts at the first
+    # ring that reaches them, and only the part of a ring inside them is looked at.
+    def nearest(self, x, y, k=1):
+        k = min(k, len(self.points))
+        if k == 0:
+            return []
+        center_x, center_y = self.cell_of(x, y)
+        (min_x, min_y), (max_x, max_y) = self.min_cell, self.max_cell
+        found = []
+        ring = max(min_x - center_x, center_x - max_x, min_y - center_y, center_y - max_y, 0)
+        while True:
+            for cell in self.ring_cells(center_x, center_y, ring):
+                for point_id in self.cells.get(cell, ()):
+                    point_x, point_y = self.points[point_id]
+                    found.append((self.distance(x, y, point_x, point_y), point_id))
+            if len(found) >= k:
+                found.sort()
+                if len(found) == len(self.points) or found[k - 1][0] <= ring * self.cell_size:
+                    return [point_id for _, point_id in found[:k]]
+            ring += 1
+
+    # Yields the occupied-area cells that are exactly 'ring' steps (Chebyshev distance) away from a cell
+    # Time-Complexity: O(r) / Space-Complexity: O(1)
+    def ring_cells(self, center_x, center_y, ring):
+        if ring == 0:
+            yield center_x, center_y
+            return
+        (min_x, min_y), (max_x, max_y) = self.min_cell, self.max_cell
+        for cell_y in (center_y - ring, center_y + ring):
+            if min_y <= cell_y <= max_y:
+                for cell_x in range(max(center_x - ring, min_x), min(center_x + ring, max_x) + 1):
+                    yield cell_x, cell_y
+        for cell_x in (center_x - ring, center_x + ring):
+            if min_x <= cell_x <= max_x:
+                for cell_y in range(max(center_y - ring + 1, min_y), min(center_y + ring - 1, max_y) + 1):
+                    yield cell_x, cell_y
+
+
+class CoordinateRow:
+    # The distances from one address to every other address, computed on demand, so 'distances[a][b]' works like it
+    # does for the dense DistanceMatrix
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __init__(self, distances, node):
+        self.distances = distances
+        self.node = node
+
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __getitem__(self, other_node):
+        return self.distances.distance(self.node, other_node)
+
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __len__(self):
+        return self.distances.size
+
+    # Iterates over the distances to every address in order, without going through the pair cache
+    # Time-Complexity: O(n) / Space-Complexity: O(1)
+    def __iter__(self):
+        compute = self.distances.compute_distance
+        node = self.node
+        for other_node in range(self.distances.size):
+            yield compute(node, other_node)
+
+
+class CoordinateDistances:
+
+    # Distances are computed from coordinates rather than read from a table, so memoizing route totals pays off (see
+    # route_cache.route_distance_function)
+    computes_distances = True
+
+    # Init the coordinate backend from the latitude and longitude (in degrees) of each address id
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    # Instead of an n x n table, only two coordinates per address are kept and distances are computed when asked for:
+    # 'manhattan' (street grid) and 'euclidean' distances on a local flat projection of the coordinates in miles, or
+    # 'haversine' (great circle) distances. Computed pairs are kept in an LRU cache of cache_size pairs.
+    # reference_latitude (radians) is where the flat projection is true to scale, the mean latitude by default.
+    def __init__(self, latitudes, longitudes, metric='manhattan', cache_size=CACHE_SIZE, reference_latitude=None):
+        if metric not in METRICS:
+            raise ValueError(f'Unknown distance metric {metric!r}, expected one of {", ".join(METRICS)}')
+        self.latitudes = array('d', latitudes)
+        self.longitudes = array('d', longitudes)
+        self.size = len(self.latitudes)
+        self.metric = metric
+        self.cache_size = cache_size
+
+        # Local flat projection: a degree of longitude gets shorter away from the equator
+        if reference_latitude is None:
+            reference_latitude = radians(sum(self.latitudes) / self.size) if self.size else 0.0
+        self.reference_latitude = reference_latitude
+        self.xs = array('d', (longitude * MILES_PER_DEGREE * cos(self.reference_latitude)
+                              for longitude in self.longitudes))
+        self.ys = array('d', (latitude * MILES_PER_DEGREE for latitude in self.latitudes))
+        self.cached_distance = lru_cache(maxsize=cache_size)(self.compute_distance)
+        self.version = 0
+        self.changes = []  # (version, node) of every coordinate update
+
+    # Creates the backend from the addresses read by Loader.load_addresses, which must all have coordinates
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    # Address ids missing from the file get 0.0 coordinates to keep the arrays indexed by id, the projection is
+    # centered on the mean latitude of the addresses that are in it.
+    @classmethod
+    def from_addresses(cls, addresses, metric='manhattan', cache_size=CACHE_SIZE):
+        size = max(address['address_id'] for address in addresses) + 1
+        latitudes = [0.0] * size
+        longitudes = [0.0] * size
+        for address in addresses:
+            if address.get('latitude') is None:
+                raise ValueError(f'Address {address["address_id"]} has no coordinates')
+            latitudes[address['address_id']] = address['latitude']
+            longitudes[address['address_id']] = address['longitude']
+        reference_latitude = radians(sum(address['latitude'] for address in addresses) / len(addresses))
+        return cls(latitudes, longitudes, metric, cache_size, reference_latitude)
+
+    # Computes the distance between two addresses in miles
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def compute_distance(self, node_a, node_b):
+        if self.metric == 'manhattan':
+            return abs(self.xs[node_a] - self.xs[node_b]) + abs(self.ys[node_a] - self.ys[node_b])
+        if self.metric == 'euclidean':
+            return hypot(self.xs[node_a] - self.xs[node_b], self.ys[node_a] - self.ys[node_b])
+        latitude_a, latitude_b = radians(self.latitudes[node_a]), radians(self.latitudes[node_b])
+        half_chord = sin((latitude_b - latitude_a) / 2) ** 2 + cos(latitude_a) * cos(latitude_b) * \
+            sin(radians(self.longitudes[node_b] - self.longitudes[node_a]) / 2) ** 2
+        return 2 * EARTH_RADIUS * asin(min(1.0, sqrt(half_chord)))
+
+    # Returns the distance between two addresses, from the pair cache if it was computed before
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # The pair is put in order first, so (a, b) and (b, a) share a cache entry.
+    def distance(self, node_a, node_b):
+        if node_a > node_b:
+            node_a, node_b = node_b, node_a
+        return self.cached_distance(node_a, node_b)
+
+    # Moves an address to new coordinates (e.g. after geocoding it again)
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # The pair cache can't drop the pairs of one address, so it is cleared. The update raises the version and is
+    # logged like DistanceMatrix.set_distance.
+    def set_coordinates(self, node, latitude, longitude):
+        self.latitudes[node] = latitude
+        self.longitudes[node] = longitude
+        self.xs[node] = longitude * MILES_PER_DEGREE * cos(self.reference_latitude)
+        self.ys[node] = latitude * MILES_PER_DEGREE
+        self.cached_distance.cache_clear()
+        self.version += 1
+        self.changes.append((self.version, node))
+
+    # Returns the addresses whose coordinates were updated after the given version
+    # Time-Complexity: O(u) / Space-Complexity: O(u)
+    def changed_nodes(self, version):
+        nodes = set()
+        for change_version, node in reversed(self.changes):
+            if change_version <= version:
+                break
+            nodes.add(node)
+        return nodes
+
+    # Returns the distances of the consecutive legs of a route of addresses, as an iterator
+    # Time-Complexity: O(n) / Space-Complexity: O(1)
+    def leg_distances(self, nodes):
+        return map(self.distance, nodes, islice(nodes, 1, None))
+
+    # Returns the row of distances from an address, so 'distances[a][b]' works like it does for DistanceMatrix
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __getitem__(self, node):
+        return CoordinateRow(self, node)
+
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __len__(self):
+        return self.size
+
+    # Returns a spatial index over the given addresses for nearest neighbor queries, see SpatialGrid
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    # The grid works on the flat projection, for 'haversine' that's close enough within a city to find the same
+    # neighbors.
+    def spatial_index(self, nodes):
+        return SpatialGrid({node: (self.xs[node], self.ys[node]) for node in nodes},
+                           'manhattan' if self.metric == 'manhattan' else 'euclidean')
+
+    # Returns the position of an address on the flat projection, to query a spatial index with
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def position(self, node):
+        return self.xs[node], self.ys[node]
+
+    # Pickles the coordinates only (e.g. when sent to a worker process), the cache is rebuilt empty
+    # Time-Complexity: O(n + u) / Space-Complexity: O(n + u)
+    # Where u is the number of coordinate updates. The version and the update log go along, so a copy tells route
+    # caches the same thing as the original (see route_cache.RouteCache).
+    def __reduce__(self):
+        return CoordinateDistances, (self.latitudes, self.longitudes, self.metric, self.cache_size,
+                                     self.reference_latitude), {'version': self.version, 'changes': self.changes}
@@ -0,0 +1,98 @@
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import sys
+from distance_matrix import DistanceMatrix
+from hash_table import HashTable
+from loader import Loader
+
+# Bump when the layout of the cache file changes, so old cache files are rebuilt instead of misread
+CACHE_VERSION = 2
+
+# File header: magic, version, distance matrix size, matrix offset, pickled data offset, pickled data length
+HEADER = struct.Struct('<4sIQQQQ')
+MAGIC = b'SRDC'
+
+
+# Returns a hash of the contents of the given files, used as the cache key
+# Time-Complexity: O(n) / Space-Complexity: O(1)
+# Where n is the total size of the files, read in 1 MiB blocks. The cache version and byte order are hashed too since
+# the matrix is stored as native floats.
+def dataset_hash(*file_paths):
+    digest = hashlib.blake2b(f'{CACHE_VERSION}:{sys.byteorder}'.encode(), digest_size=20)
+    for file_path in file_paths:
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+# Writes a loaded dataset to a cache file
+# Time-Complexity: O(n + s^2) / Space-Complexity: O(n)
+# Where n is the number of packages and s the number of addresses. The distance matrix is written as raw 64-bit floats
+# at an 8-byte aligned offset so that it can be memory-mapped back as is. The packages, addresses, address index and
+# package-to-node map are pickled after it. The file is written under a temporary name and renamed into place, so a
+# reader never sees a half-written cache.
+def write_cache(cache_path, loader):
+    distances = loader.distances
+    payload = pickle.dumps((list(loader.hashtable), loader.addresses, loader.address_index, loader.package_nodes),
+                           protocol=pickle.HIGHEST_PROTOCOL)
+    matrix_offset = HEADER.size + (-HEADER.size % 8)
+    matrix_length = distances.size * distances.size * 8
+    payload_offset = matrix_offset + matrix_length
+
+    temporary_path = f'{cache_path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, CACHE_VERSION, distances.size, matrix_offset, payload_offset, len(payload)))
+        file.write(b'\0' * (matrix_offset - HEADER.size))
+        file.write(memoryview(distances.values).cast('B'))
+        file.write(payload)
+    os.replace(temporary_path, cache_path)
+
+
+# Reads a Loader back from a cache file, or returns None if the file isn't a valid cache
+# Time-Complexity: O(n) / Space-Complexity: O(n)
+# The distance matrix is not copied or converted: it is a view into the memory-mapped file, so only the pages that
+# routing touches are ever read from disk. The pickled packages are rebuilt into a hash table. An empty or truncated
+# file, a short header, another magic value or cache version, or a payload that doesn't unpickle all count as no cache
+# (e.g. a file left behind by a crash or an older version), so the caller rebuilds it.
+def read_cache(cache_path):
+    with open(cache_path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size < HEADER.size:
+            return None
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, size, matrix_offset, payload_offset, payload_length = HEADER.unpack_from(mapped)
+    if magic != MAGIC or version != CACHE_VERSION or matrix_offset + size * size * 8 > payload_offset or \
+            payload_offset + payload_length > len(mapped):
+        return None
+
+    try:
+        packages, addresses, address_index, package_nodes = pickle.loads(mapped[payload_offset:payload_offset +
+                                                                                payload_length])
+    except (pickle.UnpicklingError, EOFError, ValueError, TypeError, AttributeError, ImportError, IndexError):
+        return None
+    values = memoryview(mapped)[matrix_offset:matrix_offset + size * size * 8].cast('d')
+    hashtable = HashTable()
+    hashtable.insert_many(packages)
+    return Loader.from_data(hashtable, addresses, DistanceMatrix(size, values), address_index, package_nodes)
+
+
+# Returns a Loader for the three CSV files, from the cache in cache_directory if there is one for their contents
+# Time-Complexity: O(n) / Space-Complexity: O(n)
+# On a cache miss (no file, or one read_cache can't use) the CSV files are parsed as usual and the result is written to
+# the cache for the next run, replacing a broken file.
+def load_cached(packages_file, addresses_file, distances_file, cache_directory):
+    cache_path = os.path.join(cache_directory,
+                              f'{dataset_hash(packages_file, addresses_file, distances_file)}.cache')
+    if os.path.exists(cache_path):
+        loader = read_cache(cache_path)
+        if loader is not None:
+            return loader
+
+    loader = Loader(packages_file, addresses_file, distances_file)
+    os.makedirs(cache_directory, exist_ok=True)
+    write_cache(cache_path, loader)
+    return loader
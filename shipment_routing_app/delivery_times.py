@@ -0,0 +1,44 @@
+from datetime import timedelta
+from itertools import accumulate, repeat
+
+
+# Returns the stops (address ids) of a route of package ids, the first entry being the truck's current location
+# Time-Complexity: O(n) / Space-Complexity: O(n)
+# The first entry goes through get_address_id since it may be package id 0 (the hub), the rest are read from the
+# package-to-node map with one map() call.
+def route_stops(route, loader):
+    stops = [loader.get_address_id(route[0])]
+    stops.extend(map(loader.package_nodes.__getitem__, route[1:]))
+    return stops
+
+
+# Returns the arrival time at every stop after the first, in seconds since midnight
+# Time-Complexity: O(n) / Space-Complexity: O(n)
+# Instead of adding up one timedelta per leg, the leg distances are gathered from the distance provider in one call,
+# summed with accumulate() and turned into times with one multiply and add per stop, so only floats are created along
+# the way. Cheap enough to re-simulate many candidate routes.
+def arrival_times(stops, distances, departure_time, travel_speed):
+    seconds_per_mile = 3600 / travel_speed
+    return [departure_time + miles * seconds_per_mile for miles in accumulate(distances.leg_distances(stops))]
+
+
+# Returns (package id, delivery time) for every package after the first entry of a route of package ids
+# Time-Complexity: O(n) / Space-Complexity: O(n)
+# The delivery times are timedeltas since midnight like Package.delivery_time, departure_time is a timedelta too.
+def route_delivery_times(route, loader, departure_time, travel_speed):
+    times = arrival_times(route_stops(route, loader), loader.distances, departure_time.total_seconds(), travel_speed)
+    return list(zip(route[1:], map(timedelta, repeat(0), times)))
+
+
+# Returns (package id, delivery time, deadline) for every package delivered after its deadline
+# Time-Complexity: O(n) average-case / Space-Complexity: O(n)
+# delivery_times are (package id, delivery time) pairs like route_delivery_times returns, so the late packages are
+# those of the route as it is driven, after improvement and exact solving (calculate_time_window_route only knows
+# those of the route it built).
+def late_deliveries(delivery_times, loader):
+    late_packages = []
+    for package_id, delivery_time in delivery_times:
+        deadline = loader.hashtable.lookup(package_id).delivery_commitment_time
+        if deadline is not None and delivery_time > deadline:
+            late_packages.append((package_id, delivery_time, deadline))
+    return late_packages
@@ -0,0 +1,118 @@
+import csv
+from array import array
+from itertools import islice
+from operator import getitem
+from multiprocessing.shared_memory import SharedMemory
+
+
+class DistanceMatrix:
+
+    # Method for initializing a square distance matrix of the given size
+    # Time-Complexity: O(n^2) / Space-Complexity: O(n^2)
+    # Distances are kept in a single flat array of 64-bit floats (row-major) instead of a list of lists of Python
+    # floats. Each row is exposed as a memoryview slice of that array, so reading a row does not copy it.
+    # version counts the distance updates (see set_distance), so results computed from the matrix can tell whether they
+    # are still current.
+    def __init__(self, size, values=None):
+        self.size = size
+        self.values = values if values is not None else array('d', bytes(8 * size * size))
+        view = memoryview(self.values)
+        self.rows = [view[i * size:(i + 1) * size] for i in range(size)]
+        self.version = 0
+        self.changes = []  # (version, node_a, node_b) of every distance update
+
+    # Reads a (lower-triangular or full) distance table from file into a full symmetric matrix
+    # Time-Complexity: O(n^2) / Space-Complexity: O(n^2)
+    # Each cell of the file is converted once and written to both (i, j) and (j, i), so later lookups never need to
+    # sort the node ids or skip empty cells.
+    @classmethod
+    def load(cls, file_path):
+        with open(file_path, 'r') as file:
+            table = [row for row in csv.reader(file) if row]
+
+        size = len(table)
+        values = array('d', bytes(8 * size * size))
+        for i, row in enumerate(table):
+            for j, val in enumerate(row[:size]):
+                if val != '':
+                    distance = float(val)
+                    values[i * size + j] = distance
+                    values[j * size + i] = distance
+        return cls(size, values)
+
+    # Returns the distance between two nodes (address ids)
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def distance(self, node_a, node_b):
+        return self.rows[node_a][node_b]
+
+    # Returns the distances of the consecutive legs of a route of nodes, as an iterator
+    # Time-Complexity: O(n) / Space-Complexity: O(1)
+    # A gather over the row views: map() picks the row of every leg's first node and reads the second node from it
+    # with operator.getitem, so no Python-level code runs per leg.
+    def leg_distances(self, nodes):
+        return map(getitem, map(self.rows.__getitem__, nodes), islice(nodes, 1, None))
+
+    # Returns the row of distances from a node to every other node, so 'matrix[a][b]' works like the old 2D list
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __getitem__(self, node):
+        return self.rows[node]
+
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __len__(self):
+        return self.size
+
+    # Updates the distance between two nodes (e.g. a road closure) in both halves of the matrix
+    # Time-Complexity: O(1), O(n^2) the first time for a read-only matrix / Space-Complexity: O(1)
+    # A matrix mapped from the dataset cache is read-only, so it is copied into an array of its own first. Every update
+    # raises the version and is logged, see changed_nodes.
+    def set_distance(self, node_a, node_b, distance):
+        if memoryview(self.values).readonly:
+            version, changes = self.version, self.changes
+            self.__init__(self.size, array('d', self.values))
+            self.version, self.changes = version, changes
+        self.rows[node_a][node_b] = distance
+        self.rows[node_b][node_a] = distance
+        self.version += 1
+        self.changes.append((self.version, node_a, node_b))
+
+    # Returns the nodes whose distances were updated after the given version
+    # Time-Complexity: O(u) / Space-Complexity: O(u)
+    # Where u is the number of updates since that version.
+    def changed_nodes(self, version):
+        nodes = set()
+        for change_version, node_a, node_b in reversed(self.changes):
+            if change_version <= version:
+                break
+            nodes.update((node_a, node_b))
+        return nodes
+
+    # The table has no coordinates to build a spatial index from, so nearest neighbor routing scans the remaining stops
+    # (see coordinate_distances.CoordinateDistances.spatial_index for the backend that has one)
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def spatial_index(self, nodes):
+        return None
+
+    # Rebuilds the matrix from its flat values when pickled (e.g. when sent to a worker process), since the memoryview
+    # rows themselves can't be pickled
+    # Time-Complexity: O(n^2 + u) / Space-Complexity: O(n^2 + u)
+    # Where u is the number of distance updates. The version and the update log go along, so a copy tells route caches
+    # the same thing as the original (see route_cache.RouteCache).
+    def __reduce__(self):
+        values = self.values if isinstance(self.values, array) else array('d', self.values)
+        return DistanceMatrix, (self.size, values), {'version': self.version, 'changes': self.changes}
+
+    # Copies the matrix into a new block of shared memory that other processes can attach to by name
+    # Time-Complexity: O(n^2) / Space-Complexity: O(n^2) of shared memory
+    # The caller owns the block and has to close() and unlink() it once no process needs the matrix any more.
+    def to_shared_memory(self):
+        byte_count = 8 * self.size * self.size
+        shared_memory = SharedMemory(create=True, size=max(byte_count, 1))
+        shared_memory.buf[:byte_count] = memoryview(self.values).cast('B')
+        return shared_memory
+
+    # Creates a matrix backed by a block of shared memory (see to_shared_memory) without copying the distances
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    # Only the row views are created. The shared memory object must stay open for as long as the matrix is used.
+    @classmethod
+    def from_shared_memory(cls, shared_memory, size):
+        return cls(size, shared_memory.buf[:8 * size * size].cast('d'))
@@ -0,0 +1,177 @@
+import time
+from array import array
+from math import inf
+from operator import add
+from route_optimizer import EPSILON, calculate_route_distance, calculate_route_lateness, group_route_by_stop
+
+# Route solvers: 'heuristic' keeps the improved time window routes, 'exact' solves small routes with Held-Karp
+SOLVERS = ('heuristic', 'exact')
+
+# Most stops (besides the starting one) a route may have to be solved exactly, larger routes keep the heuristic route.
+# Held-Karp takes O(n^2 * 2^n) time: about 0.1 seconds at 13 stops, 0.7 at 15, and over twice as long per extra stop.
+EXACT_MAX_STOPS = 15
+
+# Columns of the route report
+ROUTE_COLUMNS = ('truck', 'stops', 'method', 'distance', 'heuristic_distance', 'lower_bound', 'gap', 'heuristic_gap',
+                 'solve_seconds')
+
+
+class RouteSolution:
+    __slots__ = ('stop_route', 'total_distance', 'method', 'heuristic_distance', 'lower_bound', 'solve_time')
+
+    # Init the outcome of solving one truck's route
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # method is 'held_karp' when the route is optimal, 'heuristic' when the heuristic route was kept (too many stops,
+    # or no route meets every deadline). lower_bound is a distance no route can beat, so for a heuristic route 'gap'
+    # bounds how far it can be from the optimum. solve_time is in seconds.
+    def __init__(self, stop_route, total_distance, method, heuristic_distance, lower_bound, solve_time):
+        self.stop_route = stop_route
+        self.total_distance = total_distance
+        self.method = method
+        self.heuristic_distance = heuristic_distance
+        self.lower_bound = lower_bound
+        self.solve_time = solve_time
+
+    # Returns the optimality gap: how much longer the route is than the lower bound, as a fraction of the lower bound
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    @property
+    def gap(self):
+        return (self.total_distance - self.lower_bound) / self.lower_bound if self.lower_bound > EPSILON else 0.0
+
+    # Returns how much longer the heuristic route is than the optimal one as a fraction, or None if it wasn't solved
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    @property
+    def heuristic_gap(self):
+        if self.method != 'held_karp' or self.total_distance <= EPSILON:
+            return None
+        return (self.heuristic_distance - self.total_distance) / self.total_distance
+
+
+# Returns a lower bound on the distance of any open route from start_stop through all the stops
+# Time-Complexity: O(n^2) / Space-Complexity: O(n)
+# Every stop is entered exactly once, from the start or from another stop, so the shortest edge into each stop adds up
+# to a distance no route can beat. Cheap, and close enough to tell a good heuristic route from a poor one.
+def route_lower_bound(start_stop, stops, distance_matrix):
+    nodes = [start_stop] + list(stops)
+    return sum(min(distance_matrix[a][b] for a in nodes if a != b) for b in nodes[1:])
+
+
+# Held-Karp dynamic programming: the shortest open route from start_stop through all the stops that meets every deadline
+# Time-Complexity: O(n^2 * 2^n) / Space-Complexity: O(n * 2^n)
+# For every set of visited stops (a bitmask) and the stop visited last, dp holds the shortest distance of a route
+# covering exactly those stops. Each set is a compact array('d') of n doubles, created only once some route reaches it,
+# and extending it by stop k is one min(map(add, ...)) over the set's array and the distances into k, so the inner
+# loop runs in C. With one travel speed and no waiting, the shortest route to a state is also the earliest arrival,
+# so a state whose last stop is reached after its deadline is dropped without losing any route that meets the
+# deadlines: the result is optimal among the routes that are on time everywhere. Returns (stop route, total distance),
+# or None if no route meets every deadline. Times and deadlines are seconds since midnight.
+def held_karp_stop_route(start_stop, stops, distance_matrix, stop_deadlines=None, departure_time=0, travel_speed=18):
+    stops = [stop for stop in dict.fromkeys(stops) if stop != start_stop]
+    n = len(stops)
+    if n == 0:
+        return [start_stop], 0
+    seconds_per_mile = 3600 / travel_speed
+    # Latest distance at which each stop can be reached, inf without a deadline
+    limits = [inf] * n
+    for k, stop in enumerate(stops):
+        deadline = stop_deadlines.get(stop) if stop_deadlines else None
+        if deadline is not None:
+            limits[k] = (deadline - departure_time) / seconds_per_mile + EPSILON
+    into = [array('d', [distance_matrix[a][b] for a in stops]) for b in stops]
+
+    dp = [None] * (1 << n)
+    for k, stop in enumerate(stops):
+        distance = distance_matrix[start_stop][stop]
+        if distance <= limits[k]:
+            dp[1 << k] = row = array('d', [inf]) * n
+            row[k] = distance
+
+    for mask in range(1, 1 << n):
+        row = dp[mask]
+        if row is None:
+            continue
+        for k in range(n):
+            bit = 1 << k
+            if mask & bit:
+                continue
+            distance = min(map(add, row, into[k]))
+            if distance <= limits[k]:
+                next_row = dp[mask | bit]
+                if next_row is None:
+                    dp[mask | bit] = next_row = array('d', [inf]) * n
+                if distance < next_row[k]:
+                    next_row[k] = distance
+
+    mask = (1 << n) - 1
+    if dp[mask] is None:
+        return None
+    total_distance = min(dp[mask])
+    last = dp[mask].index(total_distance)
+
+    # Walk back through the states: the previous stop is one whose state plus the leg into 'last' gives its distance
+    route = [stops[last]]
+    while mask != 1 << last:
+        distance = dp[mask][last]
+        mask ^= 1 << last
+        row = dp[mask]
+        last = min(range(n), key=lambda k: abs(row[k] + into[last][k] - distance))
+        route.append(stops[last])
+    route.append(start_stop)
+    route.reverse()
+    return route, total_distance
+
+
+# Solves a truck's route exactly if it is small enough, otherwise keeps the heuristic route and bounds its gap
+# Time-Complexity: O(n^2 * 2^n) up to max_stops stops, O(n^2) above / Space-Complexity: O(n * 2^n), O(n) above
+# stop_route is the heuristic route (its first stop being where the truck starts). The exact route, which meets every
+# deadline, replaces it if it is shorter or if the heuristic route is late somewhere. When no route can meet every
+# deadline the heuristic route is kept as it is. Returns a RouteSolution.
+def solve_stop_route(stop_route, distance_matrix, stop_deadlines=None, departure_time=0, travel_speed=18,
+                     max_stops=EXACT_MAX_STOPS):
+    start_time = time.perf_counter()
+    heuristic_distance = calculate_route_distance(stop_route, distance_matrix)
+    stops = stop_route[1:]
+    result = None
+    if len(stops) <= max_stops:
+        result = held_karp_stop_route(stop_route[0], stops, distance_matrix, stop_deadlines, departure_time,
+                                      travel_speed)
+    if result is None:
+        return RouteSolution(list(stop_route), heuristic_distance, 'heuristic', heuristic_distance,
+                             route_lower_bound(stop_route[0], stops, distance_matrix),
+                             time.perf_counter() - start_time)
+
+    route, total_distance = result
+    if total_distance >= heuristic_distance - EPSILON and calculate_route_lateness(
+            stop_route, distance_matrix, stop_deadlines, departure_time, travel_speed) <= EPSILON:
+        route, total_distance = list(stop_route), heuristic_distance
+    return RouteSolution(route, total_distance, 'held_karp', heuristic_distance, total_distance,
+                         time.perf_counter() - start_time)
+
+
+# Solves the routes of several trucks with solve_stop_route
+# Time-Complexity: O(t * n^2 * 2^n) / Space-Complexity: O(n * 2^n)
+# routes are the heuristic (route, total_distance) pairs per truck, as returned by improve_truck_routes, with the
+# routes given as package ids in delivery order. Returns the solved routes in the same form and a RouteSolution per
+# truck.
+def solve_truck_routes(trucks, routes, loader, max_stops=EXACT_MAX_STOPS):
+    solved_routes = []
+    solutions = []
+    for truck, (route, _) in zip(trucks, routes):
+        stop_route, packages_by_stop, stop_deadlines = group_route_by_stop(route, loader)
+        solution = solve_stop_route(stop_route, loader.distances, stop_deadlines,
+                                    truck.hub_departure_time.total_seconds(), truck.travel_speed, max_stops)
+        solved_route = [route[0]]
+        for stop in solution.stop_route:
+            solved_route.extend(packages_by_stop.get(stop, ()))
+        solved_routes.append((solved_route, solution.total_distance))
+        solutions.append(solution)
+    return solved_routes, solutions
+
+
+# Returns one row per truck with its route's solver method, distance, lower bound, gaps and solve time
+# Time-Complexity: O(t) / Space-Complexity: O(t)
+def route_report(trucks, solutions):
+    return [[truck.id, len(solution.stop_route) - 1, solution.method, round(solution.total_distance, 2),
+             round(solution.heuristic_distance, 2), round(solution.lower_bound, 2), round(solution.gap, 4),
+             None if solution.heuristic_gap is None else round(solution.heuristic_gap, 4),
+             round(solution.solve_time, 4)] for truck, solution in zip(trucks, solutions)]
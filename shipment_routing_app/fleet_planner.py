@@ -0,0 +1,182 @@
+import instrumentation
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from multiprocessing.shared_memory import SharedMemory
+from assignment import assign_packages, build_groups
+from delivery_times import late_deliveries, route_delivery_times
+from distance_matrix import DistanceMatrix
+from hash_table import HashTable
+from loader import Loader
+from route_optimizer import improve_truck_routes
+from time_windows import calculate_time_window_route
+from truck import TRUCK_CAPACITY, Truck
+from truck_packing import pack_packages
+
+# Shared memory block and distance provider of a worker process, attached once per worker by init_worker
+worker_shared_memory = None
+worker_distance_matrix = None
+
+
+# Splits the loaded packages into one sub-problem per depot and day, returns {(depot, day): [package ids]}
+# Time-Complexity: O(n α(n) + g * d + g log g) / Space-Complexity: O(n)
+# Where g is the number of package groups and d the number of depots. Packages that must be delivered together (see
+# assignment.build_groups) always end up in the same sub-problem. Each group goes to the depot with the least total
+# distance to its stops. A depot's groups are then handed out over the days: groups pinned to a day by package_days
+# (package id -> day index) first, then the rest by earliest deadline, each on the first day that still has room for
+# day_capacity packages. Raises a ValueError if the packages don't fit.
+def split_packages(loader, depots, days, day_capacity, package_days=None, travel_speed=18,
+                   day_start=timedelta(hours=8), address_correction_time=timedelta(hours=10, minutes=20)):
+    package_days = package_days or {}
+    # Packages whose address couldn't be resolved can't be routed, see Loader.unresolved_packages
+    packages = [loader.hashtable.lookup(package_id) for package_id, node_id in loader.package_nodes.items()
+                if node_id is not None]
+    groups = build_groups(packages, loader, travel_speed, day_start, address_correction_time)
+
+    groups_by_depot = {depot: [] for depot in depots}
+    for group in groups:
+        depot = min(depots, key=lambda depot: sum(map(loader.distances[depot].__getitem__, group.stops)))
+        pinned_days = {package_days[package_id] for package_id in group.package_ids if package_id in package_days}
+        if len(pinned_days) > 1:
+            raise ValueError(f'Packages {sorted(group.package_ids)} are pinned to different days')
+        groups_by_depot[depot].append((pinned_days.pop() if pinned_days else None, group))
+
+    sub_problems = {}
+    for depot, depot_groups in groups_by_depot.items():
+        depot_groups.sort(key=lambda item: (item[0] is None, item[0] or 0,
+                                            item[1].latest_departure or timedelta.max))
+        day_loads = [0] * days
+        for pinned_day, group in depot_groups:
+            size = len(group.package_ids)
+            if pinned_day is not None:
+                day = pinned_day if 0 <= pinned_day < days and day_loads[pinned_day] + size <= day_capacity else None
+            else:
+                day = next((day for day in range(days) if day_loads[day] + size <= day_capacity), None)
+            if day is None:
+                raise ValueError(f'Depot {depot} has no day with room for packages {sorted(group.package_ids)}')
+            day_loads[day] += size
+            sub_problems.setdefault((depot, day), []).extend(group.package_ids)
+    return sub_problems
+
+
+# Creates a Loader for one depot that holds only the given packages, with package id 0 standing for the depot
+# Time-Complexity: O(n) / Space-Complexity: O(n)
+# The assignment and routing functions find the hub with get_address_id(0), so making the depot the only address is
+# all it takes to run them from another hub. The distance matrix is shared, not copied.
+def build_depot_loader(depot, packages, package_nodes, distance_matrix):
+    hashtable = HashTable()
+    hashtable.insert_many(packages)
+    return Loader.from_data(hashtable, [{'address': '', 'address_id': depot}], distance_matrix, {}, package_nodes)
+
+
+# Plans one depot for one day: assigns the packages to the depot's trucks, routes them and improves the routes
+# Time-Complexity: O(n log n + t * s^2 + t * k * s^2) / Space-Complexity: O(n + s * t)
+# Returns (depot, day, truck plans, late packages) where a truck plan is (truck id, package ids, departure time, total
+# distance, delivery times, kilos loaded). Times are times of day, the caller adds the day. With loading='pack' the
+# packages go on as few trucks as possible (see truck_packing.pack_packages) rather than on truck_count trucks.
+def solve_depot_day(job, distance_matrix):
+    depot, day, packages, package_nodes, truck_count, capacity, max_weight, loading, options = job
+    loader = build_depot_loader(depot, packages, package_nodes, distance_matrix)
+    if loading == 'pack':
+        trucks = pack_packages(loader, capacity, max_weight, packages)
+    else:
+        trucks = assign_packages(loader, truck_count=truck_count, capacity=capacity, packages=packages,
+                                 max_weight=max_weight)
+
+    routes = [calculate_time_window_route(truck, loader)[0] for truck in trucks]
+
+    # The late packages are those of the improved routes, which are the ones delivered
+    truck_plans = []
+    late_packages = []
+    for truck, (route, total_distance) in zip(trucks, improve_truck_routes(trucks, routes, loader, **options)):
+        delivery_times = route_delivery_times(route, loader, truck.hub_departure_time, truck.travel_speed)
+        truck_plans.append((truck.id, truck.loaded_packages, truck.hub_departure_time, total_distance, delivery_times,
+                            truck.loaded_weight))
+        late_packages.extend(late_deliveries(delivery_times, loader))
+    return depot, day, truck_plans, late_packages
+
+
+# Attaches a worker process to the distance matrix in shared memory, or takes the given distance provider
+# Time-Complexity: O(n) / Space-Complexity: O(n)
+# The worker keeps the shared memory object for its whole life, the matrix rows are views into it. The coordinate
+# backend (see coordinate_distances) only holds two coordinates per address, so it's pickled to the worker instead.
+def init_worker(shared_memory_name, size, distances=None):
+    global worker_shared_memory, worker_distance_matrix
+    if distances is not None:
+        worker_distance_matrix = distances
+        return
+    worker_shared_memory = SharedMemory(name=shared_memory_name)
+    worker_distance_matrix = DistanceMatrix.from_shared_memory(worker_shared_memory, size)
+
+
+# Runs solve_depot_day inside a worker process
+# Time-Complexity: see solve_depot_day / Space-Complexity: see solve_depot_day
+def solve_depot_day_job(job):
+    return solve_depot_day(job, worker_distance_matrix)
+
+
+# Plans the deliveries of several depots over several days and records them on the context like plan_deliveries
+# Time-Complexity: O(n α(n) + sum of the sub-problems) / Space-Complexity: O(n + m^2)
+# The packages are split into independent (depot, day) sub-problems with split_packages, and every sub-problem is
+# assigned, routed and improved on its own. With parallel=True they are solved in a process pool: the distance matrix
+# is copied once into shared memory and every worker attaches to it, so it isn't pickled per worker or per job, and only
+# the sub-problem's packages are sent along (the coordinate backend is small enough to be pickled once per worker).
+# The results are merged back into the context: trucks get fleet-wide ids (numbered by depot, then day), packages get
+# their truck, status and delivery time (the day is added to the times, so day 1 times read '1 day, 9:00:00'), and the
+# deliveries are added to the timeline used by the reports. capacity, max_weight (kilos, None for no limit) and loading
+# are passed on to every sub-problem, see solve_depot_day. Known address corrections are applied before the packages
+# are split, like in plan_deliveries (see RoutingContext.apply_address_corrections).
+# Returns the trucks that were added.
+def plan_fleet(context, depots, days=1, truck_count=3, capacity=TRUCK_CAPACITY, package_days=None, parallel=True,
+               max_workers=None, max_weight=None, loading='assign', **options):
+    loader = context.loader
+    context.apply_address_corrections()
+    with instrumentation.stage('split', len(loader.package_nodes)):
+        sub_problems = split_packages(loader, depots, days, truck_count * capacity, package_days)
+
+    jobs = []
+    for (depot, day), package_ids in sorted(sub_problems.items()):
+        packages = [loader.hashtable.lookup(package_id) for package_id in package_ids]
+        package_nodes = {package_id: loader.package_nodes[package_id] for package_id in package_ids}
+        jobs.append((depot, day, packages, package_nodes, truck_count, capacity, max_weight, loading, options))
+
+    with instrumentation.stage('solve', len(jobs)):
+        if parallel and len(jobs) > 1 and not hasattr(loader.distances, 'to_shared_memory'):
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                                     initargs=(None, 0, loader.distances)) as executor:
+                results = list(executor.map(solve_depot_day_job, jobs))
+        elif parallel and len(jobs) > 1:
+            distance_matrix = loader.distances
+            shared_memory = distance_matrix.to_shared_memory()
+            try:
+                with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                                         initargs=(shared_memory.name, distance_matrix.size)) as executor:
+                    results = list(executor.map(solve_depot_day_job, jobs))
+            finally:
+                shared_memory.close()
+                shared_memory.unlink()
+        else:
+            results = [solve_depot_day(job, loader.distances) for job in jobs]
+
+    trucks = []
+    for depot, day, truck_plans, late_packages in results:
+        day_offset = timedelta(days=day)
+        for _, package_ids, departure_time, total_distance, delivery_times, loaded_weight in truck_plans:
+            truck = Truck(len(context.trucks) + 1, package_ids, departure_time + day_offset, depot, day, capacity,
+                          max_weight, loaded_weight)
+            truck.distance_traveled = round(total_distance, 2)
+            for package_id in package_ids:
+                package = loader.hashtable.lookup(package_id)
+                package.assigned_truck = truck.id
+                package.status = 'En Route'
+            for package_id, delivery_time in delivery_times:
+                package = loader.hashtable.lookup(package_id)
+                package.delivery_time = delivery_time + day_offset
+                package.status = 'Delivered'
+            context.trucks.append(truck)
+            context.timeline.add_truck(truck, loader)
+            if loader.package_store is not None:
+                loader.package_store.add_truck(truck, loader.hashtable)
+            trucks.append(truck)
+        context.late_packages.extend((package_id, arrival_time + day_offset, deadline + day_offset)
+                                     for package_id, arrival_time, deadline in late_packages)
+    return trucks
@@ -1,47 +1,132 @@
-from typing import List
-from package import Package
-
-
-class HashTable:
-
-    # Method for initializing an empty hash table which will store our packages
-    # Time-Complexity: O(n) / Space-Complexity: O(n)
-    # Time and space complexity is proportional to table size (creating n empty lists)
-    def __init__(self, table_size=41):
-        self.table = [[] for _ in range(table_size)]
-
-    # Modulo Hash Method which uses the remainder from division of the key
-    # Time-Complexity: O(1) / Space-Complexity: O(1)
-    # Constant time and space complexity due to a single modulo operation
-    def hash(self, key):
-        return key % len(self.table)
-
-    # Method for inserting package objects into the hash table
-    # Time-Complexity: O(n) / Space-Complexity: O(n)
-    # Worst case is linear time complexity due to key collisions, space complexity increases with added elements
-    def insert(self, package: Package):
-        hash_index = self.hash(package.id)
-        bucket: List[Package] = self.table[hash_index]
-
-        # Find if a package with the same id is already in the bucket
-        for i, existing_package in enumerate(bucket):
-            # If yes, we will overwrite it with the new package
-            if package.id == existing_package.id:
-                bucket[i] = package
-                break
-        else:
-            # If not, append the new package to the bucket
-            bucket.append(package)
-
-    # Method to lookup a package object by its id
-    # Time-Complexity: O(n) / Space-Complexity: O(1)
-    # Worst case is linear time complexity due to key collisions, no additional space required for the lookup
-    def lookup(self, package_id):
-        hash_index = self.hash(package_id)
-        bucket: List[Package] = self.table[hash_index]
-
-        # Finding the package
-        for existing_package in bucket:
-            if package_id == existing_package.id:
-                return existing_package
-        return None
+from package import Package
+
+# Marker left in a key slot when a package is deleted, so that lookups keep probing past it
+DELETED = object()
+
+# The table grows once live and deleted slots make up more than this share of the table
+MAX_LOAD_FACTOR = 0.7
+
+
+class HashTable:
+
+    # Method for initializing an empty hash table which will store our packages
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    # Time and space complexity is proportional to table size (creating the two slot arrays).
+    # Uses open addressing with linear probing: keys and packages are kept in parallel arrays instead of a list of
+    # buckets, and the table doubles in size when it gets too full, so lookups stay O(1) on average at any size.
+    def __init__(self, table_size=41):
+        self.keys = [None] * table_size
+        self.slots = [None] * table_size
+        self.size = 0  # Number of packages in the table
+        self.filled = 0  # Number of packages plus deleted markers
+
+    # Modulo Hash Method which uses the remainder from division of the key
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # Constant time and space complexity due to a single modulo operation
+    def hash(self, key):
+        return key % len(self.keys)
+
+    # Finds the slot index for a key: either the slot holding the key, or the slot where it should be inserted
+    # Time-Complexity: O(1) average-case, O(n) worst-case / Space-Complexity: O(1)
+    # Probes from the hash index until the key or an empty slot is found. Returns (index, found).
+    def find_slot(self, key):
+        keys = self.keys
+        capacity = len(keys)
+        index = self.hash(key)
+        first_deleted = None
+        while True:
+            existing_key = keys[index]
+            if existing_key is None:
+                # The key isn't in the table, reuse the first deleted slot on the way if there was one
+                return (first_deleted if first_deleted is not None else index), False
+            if existing_key is DELETED:
+                if first_deleted is None:
+                    first_deleted = index
+            elif existing_key == key:
+                return index, True
+            index += 1
+            if index == capacity:
+                index = 0
+
+    # Rebuilds the table with a new size, dropping deleted markers
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    def resize(self, table_size):
+        old_keys = self.keys
+        old_slots = self.slots
+        self.keys = [None] * table_size
+        self.slots = [None] * table_size
+        self.filled = self.size
+        for key, package in zip(old_keys, old_slots):
+            if key is not None and key is not DELETED:
+                index, _ = self.find_slot(key)
+                self.keys[index] = key
+                self.slots[index] = package
+
+    # Makes sure that 'count' more packages fit without going over the load factor
+    # Time-Complexity: O(n) when the table is rebuilt, O(1) otherwise / Space-Complexity: O(n)
+    # The table doubles until the packages fit. If it is only full of deleted markers it is rebuilt at the same size.
+    def reserve(self, count):
+        table_size = len(self.keys)
+        if self.filled + count <= table_size * MAX_LOAD_FACTOR:
+            return
+        while self.size + count > table_size * MAX_LOAD_FACTOR:
+            table_size *= 2
+        self.resize(table_size)
+
+    # Method for inserting package objects into the hash table
+    # Time-Complexity: O(1) amortized / Space-Complexity: O(1) amortized
+    # A package with the same id as an existing one overwrites it. Doubling the table keeps the amortized cost constant.
+    def insert(self, package: Package):
+        self.reserve(1)
+        index, found = self.find_slot(package.id)
+        if not found:
+            if self.keys[index] is None:
+                self.filled += 1
+            self.keys[index] = package.id
+            self.size += 1
+        self.slots[index] = package
+
+    # Method for inserting many package objects at once
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    # When the number of packages is known the table is grown once up front instead of repeatedly while inserting.
+    def insert_many(self, packages):
+        if hasattr(packages, '__len__'):
+            self.reserve(len(packages))
+        for package in packages:
+            self.insert(package)
+
+    # Method to lookup a package object by its id
+    # Time-Complexity: O(1) average-case, O(n) worst-case / Space-Complexity: O(1)
+    # No additional space required for the lookup
+    def lookup(self, package_id):
+        index, found = self.find_slot(package_id)
+        return self.slots[index] if found else None
+
+    # Method to delete a package object by its id, returns the deleted package (or None if it wasn't in the table)
+    # Time-Complexity: O(1) average-case / Space-Complexity: O(1)
+    # The slot is marked as deleted rather than emptied so that lookups for keys further along the probe keep working.
+    def delete(self, package_id):
+        index, found = self.find_slot(package_id)
+        if not found:
+            return None
+        package = self.slots[index]
+        self.keys[index] = DELETED
+        self.slots[index] = None
+        self.size -= 1
+        return package
+
+    # Returns the number of packages in the table
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __len__(self):
+        return self.size
+
+    # Iterates over all packages in the table (in slot order)
+    # Time-Complexity: O(n) / Space-Complexity: O(1)
+    def __iter__(self):
+        for key, package in zip(self.keys, self.slots):
+            if key is not None and key is not DELETED:
+                yield package
+
+    # Time-Complexity: O(1) average-case / Space-Complexity: O(1)
+    def __contains__(self, package_id):
+        return self.find_slot(package_id)[1]
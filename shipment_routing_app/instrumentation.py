@@ -0,0 +1,310 @@
+import cProfile
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+# Environment variables that turn instrumentation on without the command line flags (see settings_from_environment)
+OUTPUT_VARIABLE = 'SHIPMENT_ROUTING_INSTRUMENT'
+FORMAT_VARIABLE = 'SHIPMENT_ROUTING_INSTRUMENT_FORMAT'
+PROFILE_VARIABLE = 'SHIPMENT_ROUTING_PROFILE'
+TRACE_MEMORY_VARIABLE = 'SHIPMENT_ROUTING_TRACE_MEMORY'
+
+# Formats the results can be written in: a JSON report, or the Chrome trace event format (chrome://tracing, Perfetto)
+FORMATS = ('json', 'chrome')
+
+# Number of functions listed in the profile part of the JSON report
+PROFILE_FUNCTION_COUNT = 30
+
+# The running instrumentation, None when it is turned off. The hooks below only check this, so they cost one global
+# lookup and comparison when instrumentation is off.
+active = None
+
+# Shared no-op context manager returned by stage() when instrumentation is off
+NO_STAGE = nullcontext()
+
+
+class Instrumentation:
+
+    # Init the instrumentation of one run
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # Stages are recorded as (name, start, seconds, items, counter deltas, peak memory) in the order they finish, with
+    # times in seconds since the instrumentation started. Counters are plain totals. With profile=True the whole run
+    # is also profiled with cProfile, with trace_memory=True every stage records its peak traced memory (which slows
+    # everything down noticeably, so it's off by default).
+    def __init__(self, profile=False, trace_memory=False):
+        self.origin = time.perf_counter()
+        self.stages = []
+        self.counters = {}
+        self.profiler = cProfile.Profile() if profile else None
+        self.trace_memory = trace_memory
+        self.memory_peaks = []  # Highest peak seen by the nested stages of each running stage
+        self.depth = 0
+
+    # Starts the profiler and memory tracing, if they were asked for
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def start(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    # Stops the profiler and memory tracing
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.trace_memory:
+            tracemalloc.stop()
+
+    # Adds to a counter
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    # Context manager that times a stage and records how much every counter went up during it
+    # Time-Complexity: O(c) / Space-Complexity: O(c)
+    # Where c is the number of counters. Stages can be nested, an inner stage's counts and memory are part of the outer
+    # stage's too. items is the number of things the stage worked on (packages, trucks), so rates can be derived.
+    @contextmanager
+    def stage(self, name, items=None):
+        counters = dict(self.counters)
+        if self.trace_memory:
+            if self.memory_peaks:
+                self.memory_peaks[-1] = max(self.memory_peaks[-1], tracemalloc.get_traced_memory()[1])
+            self.memory_peaks.append(0)
+            tracemalloc.reset_peak()
+        self.depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.depth -= 1
+            peak = None
+            if self.trace_memory:
+                peak = max(self.memory_peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if self.memory_peaks:
+                    self.memory_peaks[-1] = max(self.memory_peaks[-1], peak)
+            deltas = {counter: total - counters.get(counter, 0) for counter, total in self.counters.items()
+                      if total != counters.get(counter, 0)}
+            self.stages.append((name, start - self.origin, seconds, items, deltas, peak, self.depth))
+
+    # Returns the results as a dictionary for the JSON report
+    # Time-Complexity: O(s * c + p log p) / Space-Complexity: O(s * c + p)
+    # Where s is the number of stages and p the number of profiled functions. Each stage lists its counters, and per
+    # item (e.g. distance lookups per truck route) when it knows its item count. The profile part lists the functions
+    # with the most cumulative time.
+    def report(self):
+        stages = []
+        for name, start, seconds, items, deltas, peak, depth in self.stages:
+            stage = {'name': name, 'start': round(start, 6), 'seconds': round(seconds, 6), 'depth': depth,
+                     'counters': deltas}
+            if items:
+                stage['items'] = items
+                stage['items_per_second'] = round(items / seconds, 1) if seconds > 0 else None
+                stage['counters_per_item'] = {counter: round(value / items, 2) for counter, value in deltas.items()}
+            if peak is not None:
+                stage['peak_memory_bytes'] = peak
+            stages.append(stage)
+        report = {'stages': stages, 'counters': dict(self.counters)}
+        if self.profiler is not None:
+            report['profile'] = self.profile_functions()
+        return report
+
+    # Returns the functions with the most cumulative time from the profiler
+    # Time-Complexity: O(p log p) / Space-Complexity: O(p)
+    def profile_functions(self, count=PROFILE_FUNCTION_COUNT):
+        statistics = pstats.Stats(self.profiler).stats
+        functions = sorted(statistics.items(), key=lambda item: item[1][3], reverse=True)[:count]
+        return [{'function': f'{file_name}:{line}({function_name})', 'calls': calls, 'total_seconds': round(total, 6),
+                 'cumulative_seconds': round(cumulative, 6)}
+                for (file_name, line, function_name), (_, calls, total, cumulative, _) in functions]
+
+    # Returns the stages and counters as Chrome trace events
+    # Time-Complexity: O(s * c) / Space-Complexity: O(s * c)
+    # Every stage is a complete ('X') event with its counters as arguments, and the counter totals at the end of every
+    # stage are counter ('C') events, so the trace viewer draws them as graphs under the stages. Times are in
+    # microseconds.
+    def chrome_trace(self):
+        process_id = os.getpid()
+        events = []
+        totals = {}
+        for name, start, seconds, items, deltas, peak, _ in sorted(self.stages, key=lambda stage: stage[1]):
+            arguments = dict(deltas)
+            if items:
+                arguments['items'] = items
+            if peak is not None:
+                arguments['peak_memory_bytes'] = peak
+            events.append({'name': name, 'cat': 'stage', 'ph': 'X', 'ts': round(start * 1e6, 3),
+                           'dur': round(seconds * 1e6, 3), 'pid': process_id, 'tid': 0, 'args': arguments})
+        for name, start, seconds, _, deltas, _, depth in sorted(self.stages, key=lambda stage: stage[1] + stage[2]):
+            if depth == 0 and deltas:
+                for counter, value in deltas.items():
+                    totals[counter] = totals.get(counter, 0) + value
+                events.append({'name': 'counters', 'ph': 'C', 'ts': round((start + seconds) * 1e6, 3),
+                               'pid': process_id, 'tid': 0, 'args': dict(totals)})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    # Writes the results to a file in one of FORMATS
+    # Time-Complexity: see report and chrome_trace / Space-Complexity: see report and chrome_trace
+    def write(self, file_path, output_format='json'):
+        results = self.chrome_trace() if output_format == 'chrome' else self.report()
+        with open(file_path, 'w') as file:
+            json.dump(results, file, indent=2)
+            file.write('\n')
+
+
+class CountingRow:
+    # A row of distances that counts its lookups, see CountingDistances
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __init__(self, row, instrumentation):
+        self.row = row
+        self.instrumentation = instrumentation
+
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __getitem__(self, node):
+        self.instrumentation.count('distance_lookups')
+        return self.row[node]
+
+    # Counts a full row read (e.g. list(matrix[hub])) as one lookup per distance
+    # Time-Complexity: O(n) / Space-Complexity: O(1)
+    def __iter__(self):
+        self.instrumentation.count('distance_lookups', len(self.row))
+        return iter(self.row)
+
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __len__(self):
+        return len(self.row)
+
+
+class CountingDistances:
+    # Wraps a distance provider (DistanceMatrix or CoordinateDistances) and counts every distance that is looked up
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # Only used while instrumentation is on, so the providers themselves stay free of counting code. Anything else
+    # (size, spatial_index, to_shared_memory, ...) is passed through to the provider.
+    def __init__(self, distances, instrumentation):
+        self.distances = distances
+        self.instrumentation = instrumentation
+
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __getitem__(self, node):
+        return CountingRow(self.distances[node], self.instrumentation)
+
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def distance(self, node_a, node_b):
+        self.instrumentation.count('distance_lookups')
+        return self.distances.distance(node_a, node_b)
+
+    # Time-Complexity: O(n) / Space-Complexity: O(1)
+    def leg_distances(self, nodes):
+        self.instrumentation.count('distance_lookups', max(len(nodes) - 1, 0))
+        return self.distances.leg_distances(nodes)
+
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __len__(self):
+        return len(self.distances)
+
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __getattr__(self, name):
+        return getattr(self.distances, name)
+
+    # Worker processes get the plain provider, the counts of other processes aren't collected
+    # Time-Complexity: see the provider's __reduce__ / Space-Complexity: see the provider's __reduce__
+    def __reduce__(self):
+        return self.distances.__reduce__()
+
+
+class CountingHashTable:
+    # Wraps the package hash table and counts lookups and the slots they probe
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # The probe count is the distance from the key's home slot to the slot the lookup ended at, which is exactly how
+    # many slots linear probing looked at. Everything else is passed through to the table.
+    def __init__(self, hashtable, instrumentation):
+        self.hashtable = hashtable
+        self.instrumentation = instrumentation
+
+    # Time-Complexity: O(1) average-case / Space-Complexity: O(1)
+    def lookup(self, package_id):
+        hashtable = self.hashtable
+        index, found = hashtable.find_slot(package_id)
+        capacity = len(hashtable.keys)
+        self.instrumentation.count('hash_lookups')
+        self.instrumentation.count('hash_probes', (index - hashtable.hash(package_id)) % capacity + 1)
+        return hashtable.slots[index] if found else None
+
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __len__(self):
+        return len(self.hashtable)
+
+    # Time-Complexity: O(n) / Space-Complexity: O(1)
+    def __iter__(self):
+        return iter(self.hashtable)
+
+    # Time-Complexity: O(1) average-case / Space-Complexity: O(1)
+    def __contains__(self, package_id):
+        return package_id in self.hashtable
+
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __getattr__(self, name):
+        return getattr(self.hashtable, name)
+
+
+# Turns instrumentation on for the rest of the run and returns it
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+def enable(profile=False, trace_memory=False):
+    global active
+    active = Instrumentation(profile, trace_memory)
+    active.start()
+    return active
+
+
+# Turns instrumentation off and returns what it recorded (or None if it wasn't on)
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+def disable():
+    global active
+    instrumentation, active = active, None
+    if instrumentation is not None:
+        instrumentation.stop()
+    return instrumentation
+
+
+# Returns a context manager that records a stage if instrumentation is on, see Instrumentation.stage
+# Time-Complexity: O(1) when off / Space-Complexity: O(1)
+def stage(name, items=None):
+    if active is None:
+        return NO_STAGE
+    return active.stage(name, items)
+
+
+# Adds to a counter if instrumentation is on
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+# Meant for per-stage or per-route counts: counting inside the innermost loops is done by the wrappers above instead.
+def count(name, amount=1):
+    if active is not None:
+        active.count(name, amount)
+
+
+# Wraps a loader's hash table and distances so that lookups are counted, if instrumentation is on
+# Time-Complexity: O(1), or the cost of loading the distances / Space-Complexity: O(1)
+# The distances are loaded here rather than on first use, so their loading time is part of the loading stage.
+def instrument_loader(loader):
+    if active is None or isinstance(loader.hashtable, CountingHashTable):
+        return
+    loader.hashtable = CountingHashTable(loader.hashtable, active)
+    loader._distances = CountingDistances(loader.distances, active)
+
+
+# Returns the instrumentation settings (output file, format, profile, trace_memory) from the environment
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+# Instrumentation is on when SHIPMENT_ROUTING_INSTRUMENT names the file to write the results to, the other variables
+# are on when set to anything but '' or '0'.
+def settings_from_environment(environment=os.environ):
+    output_format = environment.get(FORMAT_VARIABLE, 'json')
+    if output_format not in FORMATS:
+        raise ValueError(f'{FORMAT_VARIABLE} must be one of {", ".join(FORMATS)}, not {output_format!r}')
+    return (environment.get(OUTPUT_VARIABLE) or None, output_format,
+            environment.get(PROFILE_VARIABLE, '0') not in ('', '0'),
+            environment.get(TRACE_MEMORY_VARIABLE, '0') not in ('', '0'))
@@ -0,0 +1,291 @@
+from bisect import bisect_right
+from datetime import timedelta
+from math import inf
+from route_cache import route_distance_function
+from time_windows import TimeWindowRoute
+
+# Seconds in a day, trucks of later days of a fleet plan count their times from the plan's first day
+SECONDS_PER_DAY = 86400
+
+
+class TruckRoute:
+    # The plan of one truck: its stops with arrival times and slacks, and the list of packages delivered at each stop
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # 'packages' runs parallel to route.stops. An address can be on the route twice if the truck has to come back.
+    # The first stop is the truck's depot, a later stop there (with no packages) is the truck coming back to pick up
+    # new packages, see pickup_position.
+    def __init__(self, truck, route, packages):
+        self.truck = truck
+        self.route = route
+        self.packages = packages
+
+    # Returns the first position after which stops can still be added or changed at the given time
+    # Time-Complexity: O(log n) / Space-Complexity: O(1)
+    # Before the truck leaves the hub, that's the hub itself. Once it's out, every stop it has reached is done and the
+    # stop it is driving to can't be changed either, so changes go after that stop.
+    def first_open_position(self, time):
+        seconds = time.total_seconds()
+        if seconds < self.route.arrivals[0]:
+            return 0
+        return min(bisect_right(self.route.arrivals, seconds), len(self.route.stops) - 1)
+
+    # Returns the position of the stop a package is delivered at
+    # Time-Complexity: O(n) / Space-Complexity: O(1)
+    def position_of(self, package_id):
+        for i, stop_packages in enumerate(self.packages):
+            if package_id in stop_packages:
+                return i
+        raise ValueError(f'Package {package_id} is not on truck {self.truck.id}')
+
+    # Returns the position of a stop the truck still has to make at the given address, or None
+    # Time-Complexity: O(n) / Space-Complexity: O(1)
+    def open_position_of(self, stop, first_position):
+        for i in range(first_position + 1, len(self.route.stops)):
+            if self.route.stops[i] == stop:
+                return i
+        return None
+
+    # Returns a package's deadline in seconds like the route's times, or inf for EOD
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # Deadlines are times of day, a truck on a later day of a fleet plan (see fleet_planner) has to meet them that day.
+    def deadline_of(self, package):
+        if package.delivery_commitment_time is None:
+            return inf
+        return package.delivery_commitment_time.total_seconds() + self.truck.day * SECONDS_PER_DAY
+
+    # Returns the earliest deadline of the packages at a position (see deadline_of)
+    # Time-Complexity: O(p) / Space-Complexity: O(1)
+    # Where p is the number of packages at the stop.
+    def stop_deadline(self, i, loader):
+        deadline = inf
+        for package_id in self.packages[i]:
+            deadline = min(deadline, self.deadline_of(loader.hashtable.lookup(package_id)))
+        return deadline
+
+    # Returns (position after which a package that is at the hub at the given time can be delivered, position a stop at
+    # the hub has to be inserted after, or None)
+    # Time-Complexity: O(n) / Space-Complexity: O(1)
+    # Before the truck leaves, the package just goes on it. Once the truck is out it has to come back to its depot for
+    # the package first: to a stop there it still has to make, or else to one inserted where the detour costs the
+    # least (see TimeWindowRoute.best_insertion).
+    def pickup_position(self, time):
+        first_position = self.first_open_position(time)
+        if first_position == 0:
+            return 0, None
+        depot = self.route.stops[0]
+        position = self.open_position_of(depot, first_position)
+        if position is not None:
+            return position, None
+        position = self.route.best_insertion(depot, inf, allow_late=True, first_position=first_position)
+        return position + 1, position
+
+    # Returns True if the truck has room for the package when it picks it up at the given time (see pickup_position)
+    # Time-Complexity: O(n) / Space-Complexity: O(1)
+    # A truck that hasn't left has room if Truck.fits says so. A truck that comes back to its depot for the package has
+    # dropped off everything before that stop, so only the packages (and kilos) it still carries from there count.
+    def has_room(self, package, time, loader):
+        first_position, depot_position = self.pickup_position(time)
+        truck = self.truck
+        if first_position == 0:
+            return truck.fits(1, package.weight)
+        carried = [loader.hashtable.lookup(package_id)
+                   for stop_packages in self.packages[first_position + (depot_position is None):]
+                   for package_id in stop_packages]
+        if len(carried) + 1 > truck.capacity:
+            return False
+        return truck.max_weight is None or sum(carried_package.weight for carried_package in carried) + \
+            package.weight <= truck.max_weight
+
+
+class LiveRouter:
+
+    # Init the router from a context whose trucks have been planned and delivered (see plan_deliveries and plan_fleet)
+    # Time-Complexity: O(n log n) / Space-Complexity: O(n)
+    # Each truck's route is rebuilt from the planned delivery times of its packages, starting at the truck's depot, so
+    # the planner doesn't have to hand it over. Consecutive packages at the same address are delivered at the same stop.
+    # Every update recomputes its truck's mileage, which route_distance memoizes in blocks of stops when distances are
+    # computed from coordinates.
+    def __init__(self, context):
+        self.context = context
+        self.loader = context.loader
+        self.routes = {}
+        self.route_distance = route_distance_function(self.loader.distances)
+        for truck in context.trucks:
+            stops = [truck.depot]
+            packages = [[]]
+            for package in sorted((self.loader.hashtable.lookup(package_id) for package_id in truck.loaded_packages),
+                                  key=lambda package: package.delivery_time):
+                stop = self.loader.get_address_id(package.id)
+                if stop != stops[-1]:
+                    stops.append(stop)
+                    packages.append([])
+                packages[-1].append(package.id)
+            truck_route = TruckRoute(truck, None, packages)
+            deadlines = [truck_route.stop_deadline(i, self.loader) for i in range(len(stops))]
+            truck_route.route = TimeWindowRoute.from_stops(stops, deadlines, truck.hub_departure_time.total_seconds(),
+                                                           truck.travel_speed, self.loader.distances)
+            self.routes[truck.id] = truck_route
+
+    # Finds the truck route that delivers a package
+    # Time-Complexity: O(1) average-case / Space-Complexity: O(1)
+    def route_of(self, package_id):
+        package = self.loader.hashtable.lookup(package_id)
+        if package is None or package.assigned_truck not in self.routes:
+            raise ValueError(f'Package {package_id} is not on a planned truck')
+        return self.routes[package.assigned_truck]
+
+    # Takes a package off its stop, dropping the stop if no other package is delivered there
+    # Time-Complexity: O(n) / Space-Complexity: O(1)
+    # Returns the position the route changed at. Raises a ValueError if the truck is already past or on its way to
+    # the stop at the given time.
+    def detach(self, truck_route, package_id, time):
+        position = truck_route.position_of(package_id)
+        if position <= truck_route.first_open_position(time):
+            raise ValueError(f'Package {package_id} is already delivered or out for delivery at {time}')
+
+        truck_route.packages[position].remove(package_id)
+        if truck_route.packages[position]:
+            truck_route.route.set_deadline(position, truck_route.stop_deadline(position, self.loader))
+        else:
+            del truck_route.packages[position]
+            truck_route.route.remove(position)
+        return position
+
+    # Puts a package on the truck's route: at its stop if the truck still has to go there, otherwise at the cheapest
+    # position that keeps the deadlines (or where it is the least late)
+    # Time-Complexity: O(n) / Space-Complexity: O(1)
+    # Only positions after first_position (first_open_position by default) are considered. Returns the position the
+    # route changed at.
+    def attach(self, truck_route, package_id, time, first_position=None):
+        route = truck_route.route
+        stop = self.loader.get_address_id(package_id)
+        if first_position is None:
+            first_position = truck_route.first_open_position(time)
+
+        position = truck_route.open_position_of(stop, first_position)
+        if position is not None:
+            truck_route.packages[position].append(package_id)
+            route.set_deadline(position, truck_route.stop_deadline(position, self.loader))
+            return position
+
+        deadline = truck_route.deadline_of(self.loader.hashtable.lookup(package_id))
+        i = route.best_insertion(stop, deadline, first_position=first_position)
+        if i is None:
+            i = route.best_insertion(stop, deadline, allow_late=True, first_position=first_position)
+        route.insert(i, stop, deadline)
+        truck_route.packages.insert(i + 1, [package_id])
+        return i + 1
+
+    # Writes the new arrival times from position on to the packages and the timeline, returns them as ETAs
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    # Returns {package id: delivery time} for every package at or after the changed position.
+    def publish(self, truck_route, position):
+        route = truck_route.route
+        truck_route.truck.distance_traveled = round(self.route_distance(route.stops), 2)
+        etas = {}
+        for i in range(position, len(route.stops)):
+            delivery_time = timedelta(seconds=route.arrivals[i])
+            for package_id in truck_route.packages[i]:
+                package = self.loader.hashtable.lookup(package_id)
+                if package.delivery_time != delivery_time:
+                    package.delivery_time = delivery_time
+                    self.context.timeline.reschedule_delivery(package_id, delivery_time)
+                etas[package_id] = delivery_time
+        return etas
+
+    # Changes the address of a package that hasn't been delivered yet and repairs its truck's route
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    # Where n is the number of stops of the truck. The package leaves its old stop and is inserted into the rest of the
+    # route from the truck's position at the given time, nothing else is re-planned. The correction is recorded on the
+    # timeline. Returns the new ETAs (see publish).
+    def change_address(self, time, package_id, address, zipcode=None, city=None, state=None):
+        truck_route = self.route_of(package_id)
+        if self.loader.resolve_address(address) is None:
+            raise ValueError(f'Address {address!r} is not in the address file')
+        package = self.loader.hashtable.lookup(package_id)
+        old_address, old_zipcode = package.address, package.zipcode
+
+        position = self.detach(truck_route, package_id, time)
+        self.loader.update_package_address(package_id, address, zipcode, city, state)
+        self.context.timeline.add_address_correction(time, package_id, old_address, old_zipcode, package.address,
+                                                     package.zipcode)
+        position = min(position, self.attach(truck_route, package_id, time))
+        return self.publish(truck_route, position)
+
+    # Adds a new package to a truck (the given one, or the one it adds the fewest miles to) and returns the new ETAs
+    # Time-Complexity: O(t * n) / Space-Complexity: O(n)
+    # Where t is the number of trucks. The package is at the hub, so a truck that has already left comes back to its
+    # depot for it (see TruckRoute.pickup_position) and the package is only inserted after that stop. Only trucks with
+    # room for the package (see TruckRoute.has_room) are considered.
+    def add_package(self, time, package, truck_id=None):
+        if package.id in self.loader.hashtable:
+            raise ValueError(f'Package {package.id} already exists')
+        stop = self.loader.resolve_address(package.address)
+        if stop is None:
+            raise ValueError(f'Address {package.address!r} is not in the address file')
+
+        if truck_id is None:
+            candidates = [candidate for candidate, truck_route in self.routes.items()
+                          if truck_route.has_room(package, time, self.loader)]
+            if not candidates:
+                raise ValueError(f'No truck has room for package {package.id}')
+            truck_id = min(candidates, key=lambda candidate: self.insertion_cost(self.routes[candidate], stop,
+                                                                                 package, time))
+        truck_route = self.routes[truck_id]
+        if not truck_route.has_room(package, time, self.loader):
+            raise ValueError(f'Truck {truck_id} has no room for package {package.id}')
+
+        self.loader.hashtable.insert(package)
+        self.loader.package_nodes[package.id] = stop
+        package.assigned_truck = truck_id
+        package.status = 'Delivered'  # Like the planned packages, the package carries its planned delivery
+        truck_route.truck.load(package)
+        package.delivery_time = None
+
+        # A truck that is out drives back to its depot for the package, which leaves the hub when the truck does
+        first_position, depot_position = truck_route.pickup_position(time)
+        position = len(truck_route.route.stops)
+        if depot_position is not None:
+            truck_route.route.insert(depot_position, truck_route.route.stops[0], inf)
+            truck_route.packages.insert(first_position, [])
+            position = first_position
+        if first_position == 0:
+            pickup_time = max(time, truck_route.truck.hub_departure_time)
+        else:
+            pickup_time = timedelta(seconds=truck_route.route.arrivals[first_position])
+        self.context.timeline.add_package(package, pickup_time)
+        position = min(position, self.attach(truck_route, package.id, time, first_position))
+        return self.publish(truck_route, position)
+
+    # Returns (misses a deadline, seconds late, extra miles) of the best place for a new package on a truck's open route
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    # Includes the detour back to the depot if the truck has to pick the package up there, see add_package.
+    def insertion_cost(self, truck_route, stop, package, time):
+        route = truck_route.route
+        deadline = truck_route.deadline_of(package)
+        first_position, depot_position = truck_route.pickup_position(time)
+        lateness = added_distance = 0
+        if depot_position is not None:
+            depot = route.stops[0]
+            depot_lateness, later_lateness, added_distance = route.insertion_cost(depot_position, depot, inf)
+            lateness = depot_lateness + later_lateness
+            route = route.copy()
+            route.insert(depot_position, depot, inf)
+        if stop not in route.stops[first_position + 1:]:
+            i = route.best_insertion(stop, deadline, allow_late=True, first_position=first_position)
+            stop_lateness, later_lateness, stop_distance = route.insertion_cost(i, stop, deadline)
+            lateness += stop_lateness + later_lateness
+            added_distance += stop_distance
+        return lateness > 0, lateness, added_distance
+
+    # Cancels a package that hasn't been delivered yet and shortens its truck's route, returns the new ETAs
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    # The package is removed from the hash table and the timeline as well.
+    def remove_package(self, time, package_id):
+        truck_route = self.route_of(package_id)
+        position = self.detach(truck_route, package_id, time)
+        truck_route.truck.unload(self.loader.hashtable.lookup(package_id))
+        self.loader.hashtable.delete(package_id)
+        self.loader.package_nodes.pop(package_id, None)
+        self.context.timeline.remove_package(package_id)
+        return self.publish(truck_route, position)
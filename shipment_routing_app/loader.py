@@ -1,110 +1,262 @@
-import csv
-from hash_table import HashTable
-from package import Package
-
-# Creating the hash table
-# Time-Complexity: O(1) / Space-Complexity: O(n)
-hashtable = HashTable()
-
-
-class Loader:
-
-    # Init the Loader with three files for packages, addresses and distances
-    # Time-Complexity: O(n) / Space-Complexity: O(n)
-    # Time and space complexity of this constructor depends on the three load methods called,
-    # each of which scales linearly with the size of the input files.
-    def __init__(self, packages_file, addresses_file, distances_file):
-        self.hashtable = Loader.load_packages(packages_file)
-        self.addresses = Loader.load_addresses(addresses_file)
-        self.distances = Loader.load_distances(distances_file)
-
-    # Reads package data from file and inserts package objects into a hash table.
-    # Time-Complexity: O(n) / Space-Complexity: O(n)
-    # Reads each package once from the file, creates a package object, and inserts it into the hash table.
-    # Time complexity scales linearly with the number of packages. Stores all the package objects in a hash table,
-    # resulting in space complexity that also scales linearly with the number of packages.
-    @staticmethod
-    def load_packages(file_path):
-        # Open the file
-        with open(file_path, 'r') as file:
-            reader = csv.reader(file)
-            # Read each row in the file
-            for row in reader:
-                # Get the package details from the row
-                package_id = int(row[0])
-                address = row[1]
-                city = row[2]
-                state = row[3]
-                zipcode = row[4]
-                delivery_commitment_time = row[5]
-                weight = row[6]
-                notes = row[7]
-                assigned_truck = 0
-                # Determine status based on notes
-                if 'Delayed on flight---will not arrive to depot until 9:05 am' in notes:
-                    status = 'Delayed'
-                else:
-                    status = 'At Hub'
-                delivery_time = None
-                # Create a new package object
-                package = Package(package_id, address, city, state, zipcode, delivery_commitment_time, weight, notes,
-                                  assigned_truck, status, delivery_time)
-                # Insert the package into the hash table
-                hashtable.insert(package)
-        return hashtable
-
-    # Reads address data from file and stores them in a list
-    # Time-Complexity: O(n) / Space-Complexity: O(n)
-    # Reads the file once, creating a dictionary for each address and adding it to the list.So, time complexity scales
-    # linearly with num of addresses. Stores all the address dictionaries in a list, resulting in space complexity that
-    # scales linearly with the number of addresses.
-    @staticmethod
-    def load_addresses(file_path):
-        # Initialize empty list for addresses
-        addresses = []
-        with open(file_path, 'r') as file:
-            reader = csv.reader(file)
-            # For each row, get the address and its id
-            for row in reader:
-                address_id = row[0]
-                address = row[2]
-                # Add the address to the list
-                addresses.append({'address': address, 'address_id': address_id})
-        return addresses
-
-    # Reads distance data from file and stores them in a 2D list (table)
-    # Time-Complexity: O(n) / Space-Complexity: O(n)
-    # Goes through each cell in the file once, scaling linearly with the total number of distance entries in the file.
-    # Stores all the distances in a 2D list, so space complexity also scales linearly with the num of distance entries.
-    @staticmethod
-    def load_distances(file_path):
-        # Initialize the table for distances
-        distance_table = []
-        with open(file_path, 'r') as file:
-            reader = csv.reader(file)
-            # For each row in the file, get the distance
-            for row in reader:
-                distance_row = []
-                for val in row:
-                    if val == '':
-                        distance_row.append(None)
-                    else:
-                        # Convert the value to float before adding to distance_row
-                        distance_row.append(float(val))
-                # Add the row of distances to the table
-                distance_table.append(distance_row)
-        return distance_table
-
-    # Returns id of the address that matches the given package's address
-    # Time-Complexity: O(n) / Space-Complexity: O(1)
-    # In worst-case scenario, iterates over all addresses to find match. Scales linearly with the num of addresses.
-    # Does not use any additional space that grows with the input size, space complexity is constant.
-    def get_address_id(self, package_id):
-        # Lookup the package by id
-        matching_package = self.hashtable.lookup(package_id)
-        # For each address, if the address matches the package address, return the address id
-        for address in self.addresses:
-            if package_id == 0:
-                return address['address_id']
-            elif address['address'] == matching_package.address:
-                return address['address_id']
+import csv
+from itertools import islice
+from address_index import AddressResolver, build_address_index, normalize_address
+from coordinate_distances import METRICS, CoordinateDistances
+from distance_matrix import DistanceMatrix
+from hash_table import HashTable
+from package_store import PackageStore
+from package import Package, initial_status, parse_delivery_commitment_time, parse_weight
+
+
+# Number of columns in the package file: id, address, city, state, zipcode, delivery commitment time, weight and notes
+PACKAGE_COLUMN_COUNT = 8
+
+# Where distances come from: the distance table file, or one of the coordinate metrics (see coordinate_distances)
+DISTANCE_BACKENDS = ('table',) + METRICS
+
+
+# Number of packages that go through the loading pipeline at a time
+CHUNK_SIZE = 10000
+
+
+# Pipeline stage that reads the package file and yields its rows in chunks of chunk_size
+# Time-Complexity: O(n) / Space-Complexity: O(c)
+# Where c is the chunk size, only one chunk of raw rows is held at a time.
+def read_package_rows(file_path, chunk_size=CHUNK_SIZE):
+    with open(file_path, 'r', newline='') as file:
+        reader = csv.reader(file)
+        while True:
+            chunk = list(islice(reader, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+
+# Pipeline stage that turns chunks of rows into chunks of package objects
+# Time-Complexity: O(n) / Space-Complexity: O(c)
+# Empty lines are skipped, a row with too few columns or a value that can't be converted raises a ValueError.
+def parse_package_rows(chunks):
+    # Converters for the non-text columns, bound to locals once since they run for every row
+    convert_id = int
+    convert_deadline = parse_delivery_commitment_time
+    convert_weight = parse_weight
+    for chunk in chunks:
+        packages = []
+        for row in chunk:
+            if not row:
+                continue
+            if len(row) < PACKAGE_COLUMN_COUNT:
+                raise ValueError(f'Package row has {len(row)} columns, expected {PACKAGE_COLUMN_COUNT}: {row}')
+            package_id, address, city, state, zipcode, deadline, weight, notes = row[:PACKAGE_COLUMN_COUNT]
+            packages.append(Package(convert_id(package_id), address, city, state, zipcode, convert_deadline(deadline),
+                                    convert_weight(weight), notes, 0, initial_status(notes), None))
+        yield packages
+
+
+# Pipeline stage that checks the packages of each chunk before they are indexed
+# Time-Complexity: O(n) / Space-Complexity: O(1)
+# Raises a ValueError for a package without a positive id, an address or a valid weight.
+def validate_packages(chunks):
+    for chunk in chunks:
+        for package in chunk:
+            if package.id <= 0:
+                raise ValueError(f'Package id {package.id} is not a positive number')
+            if not package.address.strip():
+                raise ValueError(f'Package {package.id} has no address')
+            if package.weight < 0:
+                raise ValueError(f'Package {package.id} has a negative weight')
+        yield chunk
+
+
+class Loader:
+
+    # Init the Loader with three files for packages, addresses and distances
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    # Time and space complexity of this constructor depends on the three load methods called,
+    # each of which scales linearly with the size of the input files.
+    # The packages go through stream_packages, with packages_file=None only the addresses are loaded and the packages
+    # can be streamed in afterwards. The distance table is only read the first time 'distances' is used (see below).
+    # distance_backend is one of DISTANCE_BACKENDS: 'table' reads distances_file, the others compute distances from
+    # the coordinates in the address file.
+    def __init__(self, packages_file, addresses_file, distances_file, distance_backend='table'):
+        if distance_backend not in DISTANCE_BACKENDS:
+            raise ValueError(f'Unknown distance backend {distance_backend!r}, expected one of '
+                             f'{", ".join(DISTANCE_BACKENDS)}')
+        self.addresses = Loader.load_addresses(addresses_file)
+        self.distances_file = distances_file
+        self.distance_backend = distance_backend
+        self._distances = None
+        self._address_resolver = None
+        # Address and package indexes are built once here so that routing lookups don't scan the address list
+        self.address_index = build_address_index(self.addresses)
+        self.package_nodes = {}
+        self.package_store = None
+        self.hashtable = HashTable()
+        if packages_file is not None:
+            self.load_packages(packages_file)
+
+    # Creates a Loader from data that is already parsed (e.g. read from the dataset cache) instead of from the CSV files
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    @classmethod
+    def from_data(cls, hashtable, addresses, distances, address_index, package_nodes, distance_backend='table'):
+        loader = cls.__new__(cls)
+        loader.hashtable = hashtable
+        loader.addresses = addresses
+        loader.distances_file = None
+        loader.distance_backend = distance_backend
+        loader._distances = distances
+        loader._address_resolver = None
+        loader.address_index = address_index
+        loader.package_nodes = package_nodes
+        loader.package_store = None
+        return loader
+
+    # Returns the distance provider, reading the distance table (or setting up the coordinate backend) the first time
+    # it is needed
+    # Time-Complexity: O(n) on first use, O(1) afterwards / Space-Complexity: O(n)
+    # Package lookups and reports don't need distances, so they don't pay for loading them. Both providers answer
+    # 'distances[a][b]', distance(a, b) and spatial_index(nodes), so the routing code works with either.
+    @property
+    def distances(self):
+        if self._distances is None:
+            if self.distance_backend == 'table':
+                self._distances = Loader.load_distances(self.distances_file)
+            else:
+                self._distances = CoordinateDistances.from_addresses(self.addresses, self.distance_backend)
+        return self._distances
+
+    # Reads package data from file and inserts package objects into the hash table.
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    # Reads each package once from the file, creates a package object, and inserts it into the hash table.
+    # Time complexity scales linearly with the number of packages. Stores all the package objects in a hash table,
+    # resulting in space complexity that also scales linearly with the number of packages. Drains stream_packages, for
+    # callers that want the whole file before they start.
+    def load_packages(self, file_path, chunk_size=CHUNK_SIZE):
+        for _ in self.stream_packages(file_path, chunk_size):
+            pass
+        return self.hashtable
+
+    # Reads, validates and indexes packages from file in chunks, yielding each chunk once it is in the hash table
+    # Time-Complexity: O(n) / Space-Complexity: O(c)
+    # A generator pipeline: rows are read (read_package_rows), parsed (parse_package_rows), validated
+    # (validate_packages), resolved to address ids (resolve_package_nodes) and inserted, one chunk of chunk_size
+    # packages at a time. Only the current chunk is held by the pipeline, so the caller can start on the packages of
+    # the first chunks (e.g. route a region) while later ones are still being read.
+    def stream_packages(self, file_path, chunk_size=CHUNK_SIZE):
+        chunks = validate_packages(parse_package_rows(read_package_rows(file_path, chunk_size)))
+        for chunk in self.resolve_package_nodes(chunks):
+            self.hashtable.insert_many(chunk)
+            yield chunk
+
+    # Reads address data from file and stores them in a list
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    # Reads the file once, creating a dictionary for each address and adding it to the list.So, time complexity scales
+    # linearly with num of addresses. Stores all the address dictionaries in a list, resulting in space complexity that
+    # scales linearly with the number of addresses.
+    # Rows may carry a latitude and longitude after the street address, which the coordinate backend uses.
+    @staticmethod
+    def load_addresses(file_path):
+        # Initialize empty list for addresses
+        addresses = []
+        with open(file_path, 'r') as file:
+            reader = csv.reader(file)
+            # For each row, get the address and its id
+            for row in reader:
+                address_id = int(row[0])
+                address = row[2]
+                # Add the address to the list
+                addresses.append({'address': address, 'address_id': address_id})
+                if len(row) >= 5 and row[3] and row[4]:
+                    addresses[-1]['latitude'] = float(row[3])
+                    addresses[-1]['longitude'] = float(row[4])
+        return addresses
+
+    # Reads distance data from file and stores them in a full symmetric distance matrix
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    # Goes through each cell in the file once, scaling linearly with the total number of distance entries in the file.
+    # The matrix is stored in a flat array of floats with both halves filled, see DistanceMatrix.load.
+    @staticmethod
+    def load_distances(file_path):
+        return DistanceMatrix.load(file_path)
+
+    # Returns the resolver that maps (possibly misspelled) addresses to address ids, building it the first time
+    # Time-Complexity: O(n) on first use, O(1) afterwards / Space-Complexity: O(n)
+    # See address_index.AddressResolver.
+    @property
+    def address_resolver(self):
+        if self._address_resolver is None:
+            self._address_resolver = AddressResolver(self.addresses, self.address_index)
+        return self._address_resolver
+
+    # Returns the address id (node id) of an address, or None if it isn't a known address
+    # Time-Complexity: O(1) average-case / Space-Complexity: O(1)
+    # Exact matches (after normalizing) are a dictionary access. Anything else goes to the resolver, which also accepts
+    # close misspellings and caches what it resolved.
+    def resolve_address(self, address):
+        address_id = self.address_index.get(normalize_address(address))
+        if address_id is None:
+            address_id = self.address_resolver.resolve(address)
+        return address_id
+
+    # Pipeline stage that maps the packages of each chunk to the node id of their delivery address
+    # Time-Complexity: O(n) / Space-Complexity: O(c)
+    # The addresses of a whole chunk are resolved in one batch (see AddressResolver.resolve_many), so an address that
+    # repeats within it is resolved once.
+    def resolve_package_nodes(self, chunks):
+        resolve_many = self.address_resolver.resolve_many
+        for chunk in chunks:
+            for package, node_id in zip(chunk, resolve_many([package.address for package in chunk])):
+                self.package_nodes[package.id] = node_id
+            yield chunk
+
+    # Returns the ids of the packages whose address couldn't be resolved to a known address
+    # Time-Complexity: O(n) / Space-Complexity: O(u)
+    def unresolved_packages(self):
+        return [package_id for package_id, node_id in self.package_nodes.items() if node_id is None]
+
+    # Updates a package's address and keeps the package-to-node map in sync (e.g. for a corrected address)
+    # Time-Complexity: O(1) average-case / Space-Complexity: O(1)
+    # A hash table lookup and a dictionary access for the new address.
+    def update_package_address(self, package_id, address, zipcode=None, city=None, state=None):
+        package = self.hashtable.lookup(package_id)
+        package.address = address
+        if zipcode is not None:
+            package.zipcode = zipcode
+        if city is not None:
+            package.city = city
+        if state is not None:
+            package.state = state
+        self.package_nodes[package_id] = self.resolve_address(address)
+        if self.package_store is not None and package_id in self.package_store.rows:
+            self.package_store.set_node_id(package_id, self.package_nodes[package_id])
+        return package
+
+    # Builds a columnar copy of the loaded packages (see PackageStore) that address id and deadline lookups and the
+    # snapshot report read from from then on
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    # Turned on with RoutingContext(package_store=True) ('--package-store'). Address corrections made through
+    # update_package_address are written to the store as well.
+    def build_package_store(self):
+        self.package_store = PackageStore.from_packages(self.hashtable, self.package_nodes)
+        return self.package_store
+
+    # Returns id of the address that matches the given package's address
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # The package-to-node map is built at load time, so this is a single dictionary access.
+    # Package id 0 stands for the hub, which is the first address in the address file. With a package store the node
+    # id column is read instead, packages added after it was built (e.g. by live_updates) are still in the map.
+    def get_address_id(self, package_id):
+        if package_id == 0:
+            return self.addresses[0]['address_id']
+        if self.package_store is not None and package_id in self.package_store.rows:
+            return self.package_store.node_id(package_id)
+        return self.package_nodes.get(package_id)
+
+    # Returns the delivery commitment time of a package in seconds since midnight, or None for EOD
+    # Time-Complexity: O(1) average-case / Space-Complexity: O(1)
+    # Read from the deadline column of the package store if there is one, otherwise from the package object.
+    def get_deadline(self, package_id):
+        if self.package_store is not None and package_id in self.package_store.rows:
+            return self.package_store.deadline(package_id)
+        deadline = self.hashtable.lookup(package_id).delivery_commitment_time
+        return None if deadline is None else deadline.total_seconds()
@@ -1,92 +1,165 @@
-import datetime
-from globals import loader, trucks
-from truck import Truck
-from nearest_neighbor import calculate_shortest_route, get_distance_between_nodes
-from tui import run_tui
-
-
-# Time-Complexity: O(n) / Space-Complexity: O(1)
-# The time complexity is generally linear with the number of packages to be delivered (n), and the space complexity is
-# constant since it only creates a few variables and does not depend on the input size.
-
-# *Note: A poor hash function or a highly skewed dataset that leads to a high collision rate could theoretically cause
-# the time complexity to degrade to O(n^2). However, this scenario is unlikely with a well thought out hash function and
-# a balanced dataset.
-def deliver_packages(truck, route):
-    current_time = truck.hub_departure_time
-
-    # Set status of all packages in the truck to "En Route"
-    for package_id in truck.loaded_packages:
-        package = loader.hashtable.lookup(package_id)
-        package.status = 'En Route'
-
-    for i in range(len(route) - 1):
-        distance = get_distance_between_nodes(loader.get_address_id(route[i]), loader.get_address_id(route[i + 1]),
-                                              loader.distances)
-        travel_time = datetime.timedelta(hours=distance / truck.travel_speed)
-        current_time += travel_time
-
-        # Get the package from the hash table and update its delivery time and status
-        delivered_package = loader.hashtable.lookup(route[i + 1])
-        delivered_package.delivery_time = current_time
-        delivered_package.status = 'Delivered'
-
-
-# Time-Complexity: O(n^2) / Space-Complexity: O(n)
-# Time complexity is mainly dictated by calculate_shortest_route function which uses a nearest neighbor approach.
-# This approach has a quadratic time complexity because it iterates over the list of packages for every package (n^2).
-# Space complexity is linear because it depends on the num of packages and the num of trucks.
-def main():
-    # Create trucks and manually load packages
-    truck1 = Truck(1, [1, 7, 13, 14, 15, 16, 19, 20, 21, 29, 30, 34, 37, 39, 40], datetime.timedelta(hours=8))
-    truck2 = Truck(2, [3, 5, 6, 18, 25, 26, 28, 31, 32, 36, 38],
-                   datetime.timedelta(hours=9, minutes=5))
-    truck3 = Truck(3, [2, 4, 8, 9, 10, 11, 12, 17, 22, 23, 24, 27, 33, 35], datetime.timedelta(hours=10, minutes=20))
-
-    trucks.append(truck1)
-    trucks.append(truck2)
-    trucks.append(truck3)
-
-    # Assign truck number to each package
-    for truck in trucks:
-        for loaded_package in truck.loaded_packages:
-            package = loader.hashtable.lookup(loaded_package)
-            package.assigned_truck = truck.id
-
-    # Calculate shortest route for Truck 1 and Truck 2 and keep track of combined distance traveled
-
-    route1, total_distance = calculate_shortest_route(truck1.current_location, truck1.loaded_packages)
-    truck1.distance_traveled = round(total_distance, 2)
-
-    route2, total_distance = calculate_shortest_route(truck2.current_location, truck2.loaded_packages)
-    truck2.distance_traveled = round(total_distance, 2)
-
-    # Truck 1 and Truck 2 deliver their loaded packages
-    deliver_packages(truck1, route1)
-    deliver_packages(truck2, route2)
-
-    # Truck 1's driver finishes delivering loaded packages and will return to the hub to begin delivering
-    # Truck 3's loaded packages at 10:20:00.
-
-    # Package 9's address is updated
-    package_to_update = loader.hashtable.lookup(9)
-    package_to_update.address = '410 S State St'
-    package_to_update.zipcode = '84111'
-
-    # Calculate shortest route for Truck 3
-    route3, total_distance = calculate_shortest_route(truck3.current_location, truck3.loaded_packages)
-    truck3.distance_traveled = round(total_distance, 2)
-
-    # Truck 3 delivers its loaded packages
-    deliver_packages(truck3, route3)
-
-    # Just some print statements for checking address routes and distances traveled for each individual truck
-    # print(route1, 'Truck 1 Distance: ', truck1.distance_traveled)
-    # print(route2, 'Truck 2 Distance: ', truck2.distance_traveled)
-    # print(route3, 'Truck 3 Distance: ', truck3.distance_traveled)
-
-    run_tui()
-
-
-if __name__ == '__main__':
-    main()
+import datetime
+import sys
+import instrumentation
+from assignment import assign_packages
+from batch_report import build_parser, run_batch
+from context import RoutingContext
+from delivery_times import arrival_times, late_deliveries, route_delivery_times, route_stops
+from exact_routing import EXACT_MAX_STOPS, solve_truck_routes
+from fleet_planner import plan_fleet
+from route_optimizer import improve_truck_routes
+from time_windows import calculate_time_window_route
+from truck import TRUCK_CAPACITY
+from truck_packing import pack_packages
+from tui import run_tui
+
+
+# Time-Complexity: O(n) / Space-Complexity: O(n)
+# The time complexity is generally linear with the number of packages to be delivered (n). The arrival times of the
+# whole route are computed in one batch by arrival_times (the leg distances are gathered and summed without a
+# Python-level loop per leg), then written to the packages, each of which is looked up in the hash table once.
+
+# *Note: A poor hash function or a highly skewed dataset that leads to a high collision rate could theoretically cause
+# the time complexity to degrade to O(n^2). However, this scenario is unlikely with a well thought out hash function and
+# a balanced dataset.
+def deliver_packages(context, truck, route):
+    loader = context.loader
+    lookup = loader.hashtable.lookup
+
+    # Set status of all packages in the truck to "En Route"
+    for package_id in truck.loaded_packages:
+        lookup(package_id).status = 'En Route'
+
+    # Update the delivery time and status of every package on the route
+    times = arrival_times(route_stops(route, loader), loader.distances, truck.hub_departure_time.total_seconds(),
+                          truck.travel_speed)
+    for package_id, delivery_time in zip(route[1:], times):
+        delivered_package = lookup(package_id)
+        delivered_package.delivery_time = datetime.timedelta(seconds=delivery_time)
+        delivered_package.status = 'Delivered'
+
+    # Record the departure and deliveries on the timeline used for the time snapshot reports, and in the package store
+    context.timeline.add_truck(truck, loader)
+    if loader.package_store is not None:
+        loader.package_store.add_truck(truck, loader.hashtable)
+
+
+# Time-Complexity: O(n^2) / Space-Complexity: O(n)
+# Time complexity is mainly dictated by calculate_time_window_route, which inserts every stop into the route after
+# checking each position of the route (n^2).
+# Space complexity is linear because it depends on the num of packages and the num of trucks.
+# With solver='exact' the routes of trucks with up to exact_max_stops stops are then solved optimally with Held-Karp
+# (O(n^2 * 2^n) per truck), see exact_routing.solve_truck_routes. Either way context.route_solutions records the method,
+# optimality gap and solve time of every truck's route.
+# With loading='pack' the packages are packed onto as few trucks as the capacity (packages) and max_weight (kilos)
+# allow instead of being spread over the three trucks, see truck_packing.pack_packages.
+def plan_deliveries(context, solver='heuristic', exact_max_stops=EXACT_MAX_STOPS, loading='assign',
+                    capacity=TRUCK_CAPACITY, max_weight=None):
+    loader = context.loader
+    trucks = context.trucks
+
+    # Let the assignment engine load the trucks from the package notes, deadlines and truck capacity. Each truck
+    # departs once all of its packages are at the hub (delayed packages at 9:05, the corrected address at 10:20).
+    with instrumentation.stage('assign', len(loader.hashtable)):
+        if loading == 'pack':
+            trucks.extend(pack_packages(loader, capacity, max_weight))
+        else:
+            trucks.extend(assign_packages(loader, truck_count=3, capacity=capacity, max_weight=max_weight))
+
+    # Assign truck number to each package
+    for truck in trucks:
+        for loaded_package in truck.loaded_packages:
+            package = loader.hashtable.lookup(loaded_package)
+            package.assigned_truck = truck.id
+
+    # Package 9's address is updated. The package is held at the hub until the correction comes in at 10:20, so the
+    # corrected address is known before its truck's route is calculated (see RoutingContext.apply_address_corrections).
+    context.apply_address_corrections()
+
+    # Calculate a route for each truck that meets the delivery deadlines given its speed and departure time
+    routes = []
+    with instrumentation.stage('route', len(trucks)):
+        for truck in trucks:
+            route, _, _ = calculate_time_window_route(truck, loader, route_cache=context.route_cache)
+            routes.append(route)
+
+    # Shorten the time window routes with 2-opt / Or-opt moves that don't make any on-time delivery late
+    with instrumentation.stage('improve', len(trucks)):
+        routes = improve_truck_routes(trucks, routes, loader, route_cache=context.route_cache)
+
+    # Solve the small routes exactly, or just bound the gap of the heuristic routes
+    with instrumentation.stage('exact', len(trucks)):
+        routes, context.route_solutions = solve_truck_routes(trucks, routes, loader,
+                                                             exact_max_stops if solver == 'exact' else 0)
+
+    # Keep track of the packages the final routes deliver late, whichever step built them
+    for truck, (route, _) in zip(trucks, routes):
+        delivery_times = route_delivery_times(route, loader, truck.hub_departure_time, truck.travel_speed)
+        context.late_packages.extend(late_deliveries(delivery_times, loader))
+
+    # Each truck delivers its loaded packages
+    with instrumentation.stage('deliver', len(trucks)):
+        for truck, (route, total_distance) in zip(trucks, routes):
+            truck.distance_traveled = round(total_distance, 2)
+            deliver_packages(context, truck, route)
+
+    # Just a print statement for checking address routes and distances traveled for each individual truck
+    # for truck, (route, total_distance) in zip(trucks, routes):
+    #     print(route, f'Truck {truck.id} Distance: ', truck.distance_traveled)
+
+
+# Plans the day's deliveries, then runs the TUI, or a batch report if command line arguments are given
+# Time-Complexity: O(n^2) / Space-Complexity: O(n)
+# Dominated by plan_deliveries, see above. Arguments are checked before planning so that a typo fails right away.
+# With --depot the packages are planned over the given depots and days with plan_fleet instead. Instrumentation is
+# turned on by --instrument or the SHIPMENT_ROUTING_INSTRUMENT environment variable, see instrumentation.py, and its
+# results are written once the run is over.
+def main(context=None, argv=None):
+    args = build_parser().parse_args(argv) if argv else None
+    output_file, output_format, profile, trace_memory = instrumentation.settings_from_environment()
+    if args is not None and args.instrument:
+        output_file, output_format = args.instrument, args.instrument_format
+        profile, trace_memory = profile or args.profile, trace_memory or args.trace_memory
+    if output_file is None:
+        run(context, args)
+        return
+
+    recorder = instrumentation.enable(profile, trace_memory)
+    try:
+        with recorder.stage('run'):
+            run(context, args)
+    finally:
+        instrumentation.disable()
+        recorder.write(output_file, output_format)
+
+
+# Plans the deliveries and shows the results, see main
+# Time-Complexity: O(n^2) / Space-Complexity: O(n)
+def run(context, args):
+    if context is None:
+        context = RoutingContext() if args is None else RoutingContext(cache_directory=args.cache_dir,
+                                                                       package_store=args.package_store)
+    if args is not None and args.depots:
+        plan_fleet(context, args.depots, days=args.days, truck_count=args.trucks, capacity=args.capacity,
+                   max_weight=args.max_weight, loading=args.loading, max_workers=args.workers)
+    elif args is not None:
+        plan_deliveries(context, args.solver, args.exact_max_stops, args.loading, args.capacity, args.max_weight)
+    else:
+        plan_deliveries(context)
+    for package_id in context.loader.unresolved_packages():
+        package = context.loader.hashtable.lookup(package_id)
+        print(f'Warning: package {package_id} was not planned, its address {package.address!r} is unknown',
+              file=sys.stderr)
+    for package_id, arrival_time, deadline in context.late_packages:
+        print(f'Warning: package {package_id} is planned to arrive at {arrival_time}, after its {deadline} deadline',
+              file=sys.stderr)
+
+    if args is not None:
+        with instrumentation.stage('report'):
+            run_batch(context, args)
+    else:
+        run_tui(context)
+
+
+if __name__ == '__main__':
+    main(argv=sys.argv[1:])
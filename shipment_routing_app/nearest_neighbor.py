@@ -1,54 +1,112 @@
-from globals import loader
-
-
-# Function to get the distance between two nodes (addresses)
-# Time-Complexity: O(1) / Space-Complexity: 0(1)
-# Involves a few simple operations (comparisons, assignments, array access) - no scaling with size of input.
-# Uses a fixed amount of space that also does not scale with size of input.
-def get_distance_between_nodes(node_a, node_b, distance_table):
-    node_a = int(node_a)
-    node_b = int(node_b)
-    # Sort nodes to make sure the indices fit the distance table
-    if node_b > node_a:
-        node_a, node_b = node_b, node_a
-    return distance_table[node_a][node_b]
-
-
-# Nearest Neighbor Algorithm
-# Time-Complexity: O(n^3)
-# N is the number of nodes. In the worst-case scenario, the function iterates over all the nodes (n) in the list and
-# for each node, get_address_id() function is called which has a time-complexity of O(n), leading to complexity o(n^2).
-# With the recursive call, it may do this up to (n) times, contributing to n^3 complexity.
-# Space-Complexity: O(n) Stores shortest path to every node in 'shortest_route' list, which can have n elements in
-# worst-case scenario (all nodes visited).
-def calculate_shortest_route(current_node, nodes, shortest_route=None, total_distance=0):
-    # Initialize the route
-    if shortest_route is None:
-        shortest_route = []
-
-    shortest_route.append(current_node)
-
-    # If there are no unvisited nodes left, return the route and the total distance
-    if not nodes:
-        return shortest_route, total_distance
-
-    # Initially set shortest_distance infinite so that the first checked node will be closer
-    shortest_distance = float('inf')
-    next_node = None
-
-    # Now we loop over all the unvisited nodes
-    for node in nodes:
-        node_address_id = loader.get_address_id(node)
-        distance = get_distance_between_nodes(loader.get_address_id(current_node), node_address_id, loader.distances)
-
-        # Greedy choice: if this node is closer than the current closest, update shortest_distance and next_node
-        if distance < shortest_distance:
-            shortest_distance = distance
-            # print(shortest_distance)
-            next_node = node
-
-    total_distance += shortest_distance
-    nodes.remove(next_node)
-
-    # Recursive call to the function for the next node
-    return calculate_shortest_route(next_node, nodes, shortest_route, total_distance)
+# Function to get the distance between two nodes (addresses)
+# Time-Complexity: O(1) / Space-Complexity: 0(1)
+# Involves a few simple operations (comparisons, assignments, array access) - no scaling with size of input.
+# Uses a fixed amount of space that also does not scale with size of input.
+# The distance matrix is filled on both sides of the diagonal, so the nodes no longer need to be sorted.
+# Works with any distance provider: the dense DistanceMatrix or the coordinate backend (see coordinate_distances).
+def get_distance_between_nodes(node_a, node_b, distance_table):
+    return distance_table.distance(node_a, node_b)
+
+
+# Returns the closest of the remaining stops (address ids) to the current stop
+# Time-Complexity: O(n) / Space-Complexity: O(1)
+# A single min() over the remaining stops, keyed directly on the current stop's row of the distance matrix, so the
+# scan runs inside the interpreter's builtins rather than as a Python-level loop. Ties go to the earliest stop.
+def find_nearest_stop(current_stop, remaining_stops, distance_matrix):
+    return min(remaining_stops, key=distance_matrix[current_stop].__getitem__)
+
+
+# Nearest Neighbor Algorithm over stops (address ids) instead of package ids
+# Time-Complexity: O(n^2) / Space-Complexity: O(n)
+# N is the number of stops. Each step picks the nearest remaining stop with find_nearest_stop (O(n)) and drops it from
+# the remaining stops, which are kept in an insertion-ordered dictionary so removal is O(1).
+# If the distance provider has a spatial index (the coordinate backend), the stops are routed with
+# calculate_indexed_stop_route instead.
+def calculate_shortest_stop_route(start_stop, stops, distance_matrix):
+    route = [start_stop]
+    total_distance = 0
+    remaining_stops = dict.fromkeys(stops)
+    remaining_stops.pop(start_stop, None)
+
+    spatial_index = distance_matrix.spatial_index(remaining_stops)
+    if spatial_index is not None:
+        return calculate_indexed_stop_route(start_stop, spatial_index, distance_matrix)
+
+    current_stop = start_stop
+    while remaining_stops:
+        next_stop = find_nearest_stop(current_stop, remaining_stops, distance_matrix)
+        total_distance += distance_matrix[current_stop][next_stop]
+        del remaining_stops[next_stop]
+        route.append(next_stop)
+        current_stop = next_stop
+
+    return route, total_distance
+
+
+# Nearest Neighbor Algorithm over the stops held by a spatial index (see coordinate_distances.SpatialGrid)
+# Time-Complexity: O(n * c) average-case / Space-Complexity: O(n)
+# Where c is the number of stops in the grid cells around the current stop. Instead of scanning every remaining stop,
+# each step asks the index for the nearest one and removes it from the index, so routing thousands of stops doesn't
+# take n^2 distance computations.
+def calculate_indexed_stop_route(start_stop, spatial_index, distance_matrix):
+    route = [start_stop]
+    total_distance = 0
+
+    current_stop = start_stop
+    while spatial_index.points:
+        next_stop = spatial_index.nearest(*distance_matrix.position(current_stop))[0]
+        total_distance += distance_matrix.distance(current_stop, next_stop)
+        spatial_index.remove(next_stop)
+        route.append(next_stop)
+        current_stop = next_stop
+
+    return route, total_distance
+
+
+# Nearest Neighbor Algorithm
+# Time-Complexity: O(n + s^2) / Space-Complexity: O(n)
+# N is the number of packages and s the number of distinct stops (addresses). Packages that share an address are grouped
+# into one stop in a single pass, then the stops are ordered iteratively by calculate_shortest_stop_route, so there is
+# no recursion depth limit and no list removals. Space is linear for the grouped stops and the returned route.
+# Returns the same (route, total_distance) pair as before: the route starts with current_node and lists package ids in
+# delivery order. The 'nodes' list passed in is left unchanged. With a route_cache (see route_cache.RouteCache) a load
+# whose stops were routed before reuses that stop order instead of starting from scratch.
+def calculate_shortest_route(current_node, nodes, loader, route_cache=None):
+    # Group package ids by the address id (stop) they are delivered to, keeping their original order
+    packages_by_stop = {}
+    for node in nodes:
+        packages_by_stop.setdefault(loader.get_address_id(node), []).append(node)
+
+    start_stop = loader.get_address_id(current_node)
+    if route_cache is None:
+        stop_route, total_distance = calculate_shortest_stop_route(start_stop, packages_by_stop, loader.distances)
+    else:
+        stop_route, total_distance = route_cache.get_or_calculate(
+            start_stop, packages_by_stop, ('nearest_neighbor',),
+            lambda start_stop, stops: calculate_shortest_stop_route(start_stop, stops, loader.distances))
+
+    # Expand the stops back into package ids, packages at the starting address are delivered first
+    shortest_route = [current_node]
+    for stop in stop_route:
+        shortest_route.extend(packages_by_stop.get(stop, ()))
+
+    return shortest_route, total_distance
+
+
+# Nearest Neighbor Algorithm that delivers the packages with a deadline first
+# Time-Complexity: O(n + s^2) / Space-Complexity: O(n)
+# Splits the packages into those with a delivery commitment time and those due at EOD, routes the first group with
+# calculate_shortest_route and then continues from its last stop with the rest. Used for loads built by the assignment
+# engine, which aren't hand-tuned so that plain nearest neighbor happens to meet every deadline.
+def calculate_deadline_first_route(current_node, nodes, loader):
+    urgent_nodes = []
+    other_nodes = []
+    for node in nodes:
+        if loader.get_deadline(node) is not None:
+            urgent_nodes.append(node)
+        else:
+            other_nodes.append(node)
+
+    urgent_route, urgent_distance = calculate_shortest_route(current_node, urgent_nodes, loader)
+    other_route, other_distance = calculate_shortest_route(urgent_route[-1], other_nodes, loader)
+    return urgent_route + other_route[1:], urgent_distance + other_distance
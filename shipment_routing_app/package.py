@@ -1,27 +1,94 @@
-class Package:
-    # Method for initializing instances of the Package class
-    # Time-Complexity: O(1) / Space-Complexity: O(1)
-    def __init__(self, id, address, city, state, zipcode, delivery_commitment_time, weight, notes, assigned_truck,
-                 status, delivery_time):
-        self.id = id
-        self.address = address
-        self.city = city
-        self.state = state
-        self.zipcode = zipcode
-        self.delivery_commitment_time = delivery_commitment_time
-        self.weight = weight
-        self.notes = notes
-        self.assigned_truck = assigned_truck
-        self.status = status
-        self.delivery_time = delivery_time
-
-    # Time-Complexity: O(1) / Space-Complexity: O(1)
-    def __str__(self):
-        return f'Package({self.id}, {self.address}, {self.city}, {self.state}, {self.zipcode},' \
-               f' {self.delivery_commitment_time}, {self.weight}, {self.notes}, {self.assigned_truck},' \
-               f' {self.status}, {self.delivery_time}) '
-
-    # Method to generate an unambiguous string representation of the Package object that can be used for debugging
-    # Time-Complexity: O(1) / Space-Complexity: O(1)
-    def __repr__(self):
-        return self.__str__()
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+# A time as the reports print it: HH:MM[:SS], for days after the first with a '1 day, ' / '2 days, ' prefix
+REPORT_TIME = re.compile(r'(?:(\d+) days?, *)?(\d{1,2}):(\d{2})(?::(\d{2}))?')
+
+
+# Converts a delivery commitment time such as '10:30 AM' into a time of day, 'EOD' (end of day) has no deadline
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+# Results are cached since a manifest only uses a handful of distinct deadlines and strptime is comparatively slow.
+@lru_cache(maxsize=256)
+def parse_delivery_commitment_time(value):
+    if value is None or value.strip().upper() == 'EOD':
+        return None
+    parsed = datetime.strptime(value.strip().upper(), '%I:%M %p')
+    return timedelta(hours=parsed.hour, minutes=parsed.minute)
+
+
+# Converts a parsed delivery commitment time back to the way it is written in the package file ('10:30 AM', 'EOD')
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+def format_delivery_commitment_time(deadline):
+    if deadline is None:
+        return 'EOD'
+    hours, seconds = divmod(int(deadline.total_seconds()), 3600)
+    return f'{(hours - 1) % 12 + 1}:{seconds // 60:02d} {"AM" if hours < 12 else "PM"}'
+
+
+# Converts a time as the reports print it ('9:05:00', '1 day, 9:05:00' for the next day) into a timedelta
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+# Raises a ValueError for anything else, including hours, minutes or seconds out of range.
+def parse_report_time(value):
+    match = REPORT_TIME.fullmatch(value.strip())
+    if match is None:
+        raise ValueError(f'invalid time {value!r}, expected HH:MM:SS or D days, HH:MM:SS')
+    days, h, m, s = (int(part or 0) for part in match.groups())
+    if not (h < 24 and m < 60 and s < 60):
+        raise ValueError(f'invalid time {value!r}, expected HH:MM:SS or D days, HH:MM:SS')
+    return timedelta(days=days, hours=h, minutes=m, seconds=s)
+
+
+# Converts a package weight in kilos from the package file into a number
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+def parse_weight(value):
+    try:
+        return float(value)
+    except ValueError:
+        # A blank weight counts as zero, anything else is an error
+        if value.strip():
+            raise
+        return 0.0
+
+
+# Returns the status a package starts with at the hub, based on its notes
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+def initial_status(notes):
+    if 'Delayed on flight---will not arrive to depot until 9:05 am' in notes:
+        return 'Delayed'
+    return 'At Hub'
+
+
+class Package:
+    # Fixed attribute slots instead of a per-object __dict__, which keeps large manifests much smaller in memory
+    __slots__ = ('id', 'address', 'city', 'state', 'zipcode', 'delivery_commitment_time', 'weight', 'notes',
+                 'assigned_truck', 'status', 'delivery_time')
+
+    # Method for initializing instances of the Package class
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # The delivery commitment time is a timedelta (time of day) or None for EOD, and the weight is a float in kilos.
+    def __init__(self, id, address, city, state, zipcode, delivery_commitment_time, weight, notes, assigned_truck,
+                 status, delivery_time):
+        self.id = id
+        self.address = address
+        self.city = city
+        self.state = state
+        self.zipcode = zipcode
+        self.delivery_commitment_time = delivery_commitment_time
+        self.weight = weight
+        self.notes = notes
+        self.assigned_truck = assigned_truck
+        self.status = status
+        self.delivery_time = delivery_time
+
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __str__(self):
+        return f'Package({self.id}, {self.address}, {self.city}, {self.state}, {self.zipcode},' \
+               f' {format_delivery_commitment_time(self.delivery_commitment_time)}, {self.weight:g}, {self.notes},' \
+               f' {self.assigned_truck},' \
+               f' {self.status}, {self.delivery_time}) '
+
+    # Method to generate an unambiguous string representation of the Package object that can be used for debugging
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __repr__(self):
+        return self.__str__()
@@ -0,0 +1,119 @@
+from array import array
+from bisect import bisect_right
+from math import inf, isnan, nan
+
+# Package statuses and the codes they are stored as in the status columns
+STATUSES = ('At Hub', 'Delayed', 'En Route', 'Delivered')
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+# Node id stored for packages whose address isn't a known address
+UNKNOWN_NODE = -1
+
+
+class PackageStore:
+
+    # Method for initializing an empty columnar (struct-of-arrays) package store
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # Instead of one Package object per package, every field that routing and reporting need is kept in its own typed
+    # array (8 bytes per value, 1 byte per status), so millions of packages don't need millions of Python objects.
+    # Times are seconds since midnight: deadlines are inf for EOD, departure and delivery times are nan until the
+    # package leaves the hub or is delivered. initial_statuses is the status a package has before its truck leaves.
+    def __init__(self):
+        self.ids = array('q')
+        self.node_ids = array('q')
+        self.deadlines = array('d')
+        self.weights = array('d')
+        self.initial_statuses = array('b')
+        self.statuses = array('b')
+        self.departure_times = array('d')
+        self.delivery_times = array('d')
+        self.rows = {}  # Package id to row index
+
+    # Adds a package to the end of every column
+    # Time-Complexity: O(1) amortized / Space-Complexity: O(1) amortized
+    def append(self, package_id, node_id, deadline, weight, status):
+        self.rows[package_id] = len(self.ids)
+        self.ids.append(package_id)
+        self.node_ids.append(UNKNOWN_NODE if node_id is None else node_id)
+        self.deadlines.append(inf if deadline is None else deadline.total_seconds())
+        self.weights.append(weight)
+        self.initial_statuses.append(STATUS_CODES[status])
+        self.statuses.append(STATUS_CODES[status])
+        self.departure_times.append(nan)
+        self.delivery_times.append(nan)
+
+    # Builds a store from existing Package objects and a package id to node id map
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    @classmethod
+    def from_packages(cls, packages, package_nodes):
+        store = cls()
+        for package in packages:
+            store.append(package.id, package_nodes.get(package.id), package.delivery_commitment_time, package.weight,
+                         package.status)
+        return store
+
+    # Returns the node id of a package's address, or None if the address isn't known
+    # Time-Complexity: O(1) average-case / Space-Complexity: O(1)
+    def node_id(self, package_id):
+        node_id = self.node_ids[self.rows[package_id]]
+        return None if node_id == UNKNOWN_NODE else node_id
+
+    # Moves a package to another address (e.g. after an address correction)
+    # Time-Complexity: O(1) average-case / Space-Complexity: O(1)
+    def set_node_id(self, package_id, node_id):
+        self.node_ids[self.rows[package_id]] = UNKNOWN_NODE if node_id is None else node_id
+
+    # Returns the delivery commitment time of a package in seconds since midnight, or None for EOD
+    # Time-Complexity: O(1) average-case / Space-Complexity: O(1)
+    def deadline(self, package_id):
+        deadline = self.deadlines[self.rows[package_id]]
+        return None if deadline == inf else deadline
+
+    # Marks a package as delivered at the given time (seconds since midnight)
+    # Time-Complexity: O(1) average-case / Space-Complexity: O(1)
+    def set_delivered(self, package_id, delivery_time):
+        row = self.rows[package_id]
+        self.statuses[row] = STATUS_CODES['Delivered']
+        self.delivery_times[row] = delivery_time
+
+    # Records a truck that left the hub with its packages, and the delivery time of each package that has one
+    # Time-Complexity: O(n) average-case / Space-Complexity: O(1)
+    # The column counterpart of DeliveryTimeline.add_truck, called wherever a planned truck is put on the timeline.
+    def add_truck(self, truck, hashtable):
+        departure_time = truck.hub_departure_time.total_seconds()
+        for package_id in truck.loaded_packages:
+            row = self.rows[package_id]
+            self.departure_times[row] = departure_time
+            self.statuses[row] = STATUS_CODES['En Route']
+            delivery_time = hashtable.lookup(package_id).delivery_time
+            if delivery_time is not None:
+                self.set_delivered(package_id, delivery_time.total_seconds())
+
+    # Yields (time, status codes) for each of the given times (seconds since midnight) in order, in one sweep
+    # Time-Complexity: O(n log n + t log t) plus the caller's work per time / Space-Complexity: O(n)
+    # Where t is the number of times. The rows are sorted by departure and by delivery time once, then the status
+    # column of the sweep is advanced from one time to the next, so a time only touches the packages that left or were
+    # delivered since the last one. Like DeliveryTimeline.snapshots, a package counts as gone or delivered at exactly
+    # its time. The yielded array is updated in place, so it is only valid until the next time is requested; a
+    # package's delivery time applies once its code is 'Delivered'.
+    def snapshots(self, times):
+        statuses = array('b', self.initial_statuses)
+        departures = sorted((time, row) for row, time in enumerate(self.departure_times) if not isnan(time))
+        deliveries = sorted((time, row) for row, time in enumerate(self.delivery_times) if not isnan(time))
+        en_route, delivered = STATUS_CODES['En Route'], STATUS_CODES['Delivered']
+        departed = arrived = 0
+        for time in sorted(times):
+            # Bisect past every event at or before the time, (time, inf) sorts after all rows at that time
+            next_departed = bisect_right(departures, (time, inf), departed)
+            next_arrived = bisect_right(deliveries, (time, inf), arrived)
+            for _, row in departures[departed:next_departed]:
+                if statuses[row] != delivered:
+                    statuses[row] = en_route
+            for _, row in deliveries[arrived:next_arrived]:
+                statuses[row] = delivered
+            departed, arrived = next_departed, next_arrived
+            yield time, statuses
+
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __len__(self):
+        return len(self.ids)
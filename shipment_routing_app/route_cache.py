@@ -0,0 +1,159 @@
+from collections import OrderedDict
+
+# Number of routes the route cache keeps before evicting the least recently used one
+ROUTE_CACHE_SIZE = 4096
+
+# Number of consecutive stops whose distance SegmentDistances memoizes as one block, and how many blocks it keeps
+SEGMENT_SIZE = 8
+SEGMENT_CACHE_SIZE = 1 << 16
+
+
+class RouteCache:
+
+    # Init an empty route cache for one distance provider
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # Routes are keyed by (start stop, frozenset of the stops, distance version, options): the same truck load routed
+    # again with the same algorithm and options is a dictionary hit, whatever order its packages come in. options is a
+    # hashable tuple naming the algorithm and everything else its result depends on (deadlines, departure time, ...).
+    # Entries are kept in an OrderedDict in least recently used order and the oldest are evicted beyond maxsize.
+    # Address corrections need no special handling: a package that moves to another stop changes the stop set, so its
+    # truck's load simply maps to a different key.
+    def __init__(self, distances, maxsize=ROUTE_CACHE_SIZE):
+        self.distances = distances
+        self.maxsize = maxsize
+        self.version = distances.version
+        self.routes = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # Brings the cache up to the provider's current distance version
+    # Time-Complexity: O(c * s) when the distances changed, O(1) otherwise / Space-Complexity: O(c)
+    # Where c is the number of cached routes. Routes that start at or visit a node whose distances changed are dropped,
+    # the others are still correct and are carried over to the new version.
+    def synchronize(self):
+        version = self.distances.version
+        if version == self.version:
+            return
+        changed_nodes = self.distances.changed_nodes(self.version)
+        routes = OrderedDict()
+        for (start_stop, stops, _, options), result in self.routes.items():
+            if start_stop not in changed_nodes and stops.isdisjoint(changed_nodes):
+                routes[start_stop, stops, version, options] = result
+        self.routes = routes
+        self.version = version
+
+    # Returns the key of a route
+    # Time-Complexity: O(s) / Space-Complexity: O(s)
+    def key(self, start_stop, stops, options):
+        return start_stop, frozenset(stops), self.version, options
+
+    # Returns the cached (stop route, total distance) of a route, or None
+    # Time-Complexity: O(s) / Space-Complexity: O(s)
+    def get(self, start_stop, stops, options=()):
+        self.synchronize()
+        key = self.key(start_stop, stops, options)
+        result = self.routes.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.routes.move_to_end(key)
+        return result
+
+    # Caches the (stop route, total distance) of a route, evicting the least recently used routes beyond maxsize
+    # Time-Complexity: O(s) / Space-Complexity: O(s)
+    # The stop route is stored as a tuple, so callers can't change a cached route by changing the list they got back.
+    def put(self, start_stop, stops, options, stop_route, total_distance):
+        self.synchronize()
+        key = self.key(start_stop, stops, options)
+        self.routes[key] = (tuple(stop_route), total_distance)
+        self.routes.move_to_end(key)
+        while len(self.routes) > self.maxsize:
+            self.routes.popitem(last=False)
+
+    # Returns the cached route, or calculates it with calculate_route(start_stop, stops) and caches it
+    # Time-Complexity: O(s) on a hit, plus calculate_route on a miss / Space-Complexity: O(s)
+    # Returns (stop route as a list, total distance) like the routing functions do.
+    def get_or_calculate(self, start_stop, stops, options, calculate_route):
+        result = self.get(start_stop, stops, options)
+        if result is None:
+            result = calculate_route(start_stop, stops)
+            self.put(start_stop, stops, options, *result)
+        return list(result[0]), result[1]
+
+    # Drops every cached route
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def clear(self):
+        self.routes.clear()
+
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __len__(self):
+        return len(self.routes)
+
+
+class SegmentDistances:
+
+    # Init memoized route totals for one distance provider
+    # Time-Complexity: O(m) / Space-Complexity: O(m)
+    # Where m is the number of addresses. A route's distance is split into blocks of consecutive stops plus the legs
+    # joining them, and each block's distance is memoized by its stops. Blocks end after a 'boundary' stop (about one
+    # address in segment_size, picked by a hash of its id) rather than at fixed positions, so inserting or removing a
+    # stop only changes the block around it and the rest of an edited route still hits the memo. Evaluating many routes
+    # that share long runs of stops (a route being edited stop by stop, the same loads planned again) then mostly adds
+    # up cached blocks. The memo is bounded and cleared when the provider's distance version changes.
+    def __init__(self, distances, segment_size=SEGMENT_SIZE, maxsize=SEGMENT_CACHE_SIZE):
+        self.distances = distances
+        self.max_segment_size = 4 * segment_size
+        self.maxsize = maxsize
+        self.version = distances.version
+        # Multiplicative (Fibonacci) hashing: the low 32 bits of id * 2654435761 scatter consecutive ids over the whole
+        # 32-bit range, so comparing the hash against 2^32 / segment_size keeps about one id in segment_size without
+        # the boundaries falling on every segment_size-th id (taking the hash modulo segment_size would do just that)
+        self.boundaries = {node for node in range(len(distances))
+                           if (node * 2654435761) & 0xFFFFFFFF < (1 << 32) // segment_size}
+        self.segments = {}
+
+    # Returns the distance of a block of consecutive stops, from the memo if it was computed before
+    # Time-Complexity: O(b) / Space-Complexity: O(b)
+    # Where b is the block size. Once the memo is full it is emptied and refilled, which is cheaper than tracking use.
+    def segment_distance(self, segment):
+        distance = self.segments.get(segment)
+        if distance is None:
+            if len(self.segments) >= self.maxsize:
+                self.segments.clear()
+            distance = self.segments[segment] = sum(self.distances.leg_distances(segment))
+        return distance
+
+    # Returns the total distance of an open route of stops
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    # Blocks longer than 4 * segment_size are cut, so a run without boundary stops doesn't make one huge block.
+    def route_distance(self, stops):
+        if self.distances.version != self.version:
+            self.segments.clear()
+            self.version = self.distances.version
+        stops = tuple(stops)
+        boundaries = self.boundaries
+        total = 0
+        start = 0
+        for end in [i + 1 for i, stop in enumerate(stops) if stop in boundaries] + [len(stops)]:
+            while end - start > self.max_segment_size:
+                total += self.segment_distance(stops[start:start + self.max_segment_size])
+                total += self.distances.distance(stops[start + self.max_segment_size - 1],
+                                                 stops[start + self.max_segment_size])
+                start += self.max_segment_size
+            if end > start:
+                total += self.segment_distance(stops[start:end])
+                if end < len(stops):
+                    total += self.distances.distance(stops[end - 1], stops[end])
+                start = end
+        return total
+
+
+# Returns a function that gives the total distance of a route of stops, memoized with SegmentDistances if that pays off
+# Time-Complexity: O(1), O(m) with memoization / Space-Complexity: O(1), O(m) with memoization
+# Reading a leg from the distance table is a single gathered array access, cheaper than hashing the blocks, so only
+# providers that compute their distances (computes_distances, e.g. the coordinate backend) get the memo.
+def route_distance_function(distances):
+    if getattr(distances, 'computes_distances', False):
+        return SegmentDistances(distances).route_distance
+    return lambda stops: sum(distances.leg_distances(stops))
@@ -0,0 +1,232 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from delivery_times import arrival_times
+
+# Smallest change in miles or seconds that counts as an actual improvement (guards against floating point noise)
+EPSILON = 1e-9
+
+# Longest segment of consecutive stops that an Or-opt move relocates
+OR_OPT_MAX_SEGMENT = 3
+
+# Distance matrix used by worker processes, set once per worker by init_worker so it's not pickled for every truck
+worker_distance_matrix = None
+
+
+# Returns the total distance of an open route (trucks are not routed back to the hub)
+# Time-Complexity: O(n) / Space-Complexity: O(1)
+def calculate_route_distance(stop_route, distance_matrix):
+    return sum(distance_matrix[a][b] for a, b in zip(stop_route, stop_route[1:]))
+
+
+# Returns the total lateness in seconds of a route, summed over all stops that are reached after their deadline
+# Time-Complexity: O(n) / Space-Complexity: O(1)
+# The arrival times are computed in one batch with arrival_times, then only the stops with a deadline are checked. Times
+# and deadlines are seconds since midnight and the travel speed is in miles per hour.
+def calculate_route_lateness(stop_route, distance_matrix, stop_deadlines, departure_time, travel_speed):
+    if not stop_deadlines:
+        return 0
+    lateness = 0
+    for stop, arrival in zip(stop_route[1:], arrival_times(stop_route, distance_matrix, departure_time, travel_speed)):
+        deadline = stop_deadlines.get(stop)
+        if deadline is not None and arrival > deadline:
+            lateness += arrival - deadline
+    return lateness
+
+
+# Returns the total lateness in seconds of a route and the stops that are reached after their deadline
+# Time-Complexity: O(n) / Space-Complexity: O(n)
+# Like calculate_route_lateness, for checking that a changed route doesn't make any stop late that was on time.
+def calculate_late_stops(stop_route, distance_matrix, stop_deadlines, departure_time, travel_speed):
+    if not stop_deadlines:
+        return 0, frozenset()
+    lateness = 0
+    late_stops = []
+    for stop, arrival in zip(stop_route[1:], arrival_times(stop_route, distance_matrix, departure_time, travel_speed)):
+        deadline = stop_deadlines.get(stop)
+        if deadline is not None and arrival > deadline:
+            lateness += arrival - deadline
+            late_stops.append(stop)
+    return lateness, frozenset(late_stops)
+
+
+# Returns True once the time limit of a search has passed
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+def out_of_time(end_time):
+    return end_time is not None and time.perf_counter() > end_time
+
+
+# Yields the routes produced by every distance-reducing 2-opt move (reversing the stops between i and j)
+# Time-Complexity: O(n^2) to scan every move / Space-Complexity: O(n) per yielded route
+# The change in distance is checked in O(1) from the two edges that are replaced, since the matrix is symmetric the
+# reversed segment itself keeps its length. A new route is only built for moves that shorten the route. The scan ends
+# early once end_time (a time.perf_counter() value) has passed, checked once per row of O(n) moves.
+def two_opt_moves(route, distance_matrix, end_time=None):
+    n = len(route)
+    for i in range(1, n - 1):
+        if out_of_time(end_time):
+            return
+        row_a = distance_matrix[route[i - 1]]
+        row_b = distance_matrix[route[i]]
+        removed_ab = row_a[route[i]]
+        for j in range(i + 1, n):
+            c = route[j]
+            if j + 1 < n:
+                e = route[j + 1]
+                delta = row_a[c] + row_b[e] - removed_ab - distance_matrix[c][e]
+            else:
+                delta = row_a[c] - removed_ab
+            if delta < -EPSILON:
+                yield route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+
+
+# Yields the routes produced by every distance-reducing Or-opt move (moving a run of 1 to 3 stops elsewhere)
+# Time-Complexity: O(n^2) to scan every move / Space-Complexity: O(n) per yielded route
+# The change in distance is checked in O(1): the gain from closing the gap the segment leaves behind against the cost
+# of opening the edge (u, v) it is moved into. Like two_opt_moves, the scan ends early once end_time has passed.
+def or_opt_moves(route, distance_matrix, end_time=None):
+    n = len(route)
+    for k in range(1, OR_OPT_MAX_SEGMENT + 1):
+        for i in range(1, n - k + 1):
+            if out_of_time(end_time):
+                return
+            prev = route[i - 1]
+            first = route[i]
+            last = route[i + k - 1]
+            removal_gain = distance_matrix[prev][first]
+            if i + k < n:
+                nxt = route[i + k]
+                removal_gain += distance_matrix[last][nxt] - distance_matrix[prev][nxt]
+
+            for p in chain(range(0, i - 1), range(i + k, n)):
+                u = route[p]
+                insertion_cost = distance_matrix[u][first]
+                if p + 1 < n:
+                    v = route[p + 1]
+                    insertion_cost += distance_matrix[last][v] - distance_matrix[u][v]
+                if insertion_cost - removal_gain < -EPSILON:
+                    segment = route[i:i + k]
+                    remainder = route[:i] + route[i + k:]
+                    position = p + 1 if p < i else p + 1 - k
+                    yield remainder[:position] + segment + remainder[position:]
+
+
+# Improves a truck's route (e.g. a time window route) with 2-opt and Or-opt local search
+# Time-Complexity: O(k * n^2) / Space-Complexity: O(n)
+# Where k is the number of accepted moves (bounded by max_iterations) and n is the number of stops. Each pass scans the
+# moves until the first one that shortens the route without adding lateness, then starts again from the new route.
+# The first stop is where the truck starts and never moves. A move is rejected if it makes any stop late that was on
+# time, or the route later in total against the stop deadlines than it already is, so no delivery commitment that the
+# route met is broken (a late stop may still get less late). The search stops when no move improves the route, after
+# max_iterations accepted moves, or after time_limit seconds, which the move scans check as they go.
+def improve_stop_route(stop_route, distance_matrix, stop_deadlines=None, departure_time=0, travel_speed=18,
+                       max_iterations=1000, time_limit=None):
+    route = list(stop_route)
+    lateness, late_stops = calculate_late_stops(route, distance_matrix, stop_deadlines, departure_time, travel_speed)
+    end_time = None if time_limit is None else time.perf_counter() + time_limit
+
+    iterations = 0
+    improved = True
+    while improved and iterations < max_iterations:
+        improved = False
+        for candidate in chain(two_opt_moves(route, distance_matrix, end_time),
+                               or_opt_moves(route, distance_matrix, end_time)):
+            if out_of_time(end_time):
+                break
+            candidate_lateness, candidate_late_stops = calculate_late_stops(candidate, distance_matrix, stop_deadlines,
+                                                                            departure_time, travel_speed)
+            if candidate_lateness <= lateness + EPSILON and candidate_late_stops <= late_stops:
+                route, lateness, late_stops = candidate, candidate_lateness, candidate_late_stops
+                iterations += 1
+                improved = True
+                break
+
+    return route, calculate_route_distance(route, distance_matrix)
+
+
+# Sets the distance matrix for a worker process
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+def init_worker(distance_matrix):
+    global worker_distance_matrix
+    worker_distance_matrix = distance_matrix
+
+
+# Runs improve_stop_route for a single truck inside a worker process
+# Time-Complexity: O(k * n^2) / Space-Complexity: O(n)
+def improve_stop_route_job(job):
+    stop_route, stop_deadlines, departure_time, travel_speed, options = job
+    return improve_stop_route(stop_route, worker_distance_matrix, stop_deadlines, departure_time, travel_speed,
+                              **options)
+
+
+# Splits a package route (as returned by calculate_shortest_route) into its stops and the earliest deadline per stop
+# Time-Complexity: O(n) / Space-Complexity: O(n)
+def group_route_by_stop(route, loader):
+    start_stop = loader.get_address_id(route[0])
+    packages_by_stop = {start_stop: []}
+    stop_deadlines = {}
+    for package_id in route[1:]:
+        stop = loader.get_address_id(package_id)
+        packages_by_stop.setdefault(stop, []).append(package_id)
+        deadline = loader.get_deadline(package_id)
+        if deadline is not None:
+            if stop not in stop_deadlines or deadline < stop_deadlines[stop]:
+                stop_deadlines[stop] = deadline
+    return list(packages_by_stop), packages_by_stop, stop_deadlines
+
+
+# Improves the routes of several trucks, optionally one truck per worker process
+# Time-Complexity: O(t * k * n^2) / Space-Complexity: O(t * n)
+# Where t is the number of trucks. With parallel=True the trucks are improved in a process pool that receives the
+# distance matrix once per worker. For a handful of small routes starting the pool costs more than it saves, so
+# routes are improved in this process by default. Returns a (route, total_distance) pair per truck, with the routes
+# given as package ids in delivery order like calculate_shortest_route. With a route_cache (see route_cache.RouteCache)
+# trucks whose stops, deadlines, departure time and speed were improved before, starting from the same route, get the
+# cached route, only the others are searched. The local search result depends on the order it starts from, so the
+# starting order is part of the key: a cached route is never one improved from another order (and possibly worse than
+# the route given).
+def improve_truck_routes(trucks, routes, loader, parallel=False, max_workers=None, route_cache=None, **options):
+    jobs = []
+    grouped_routes = []
+    cache_keys = []
+    results = []
+    for truck, route in zip(trucks, routes):
+        stop_route, packages_by_stop, stop_deadlines = group_route_by_stop(route, loader)
+        grouped_routes.append((route[0], packages_by_stop))
+        job = (stop_route, stop_deadlines, truck.hub_departure_time.total_seconds(), truck.travel_speed, options)
+        cache_key = None
+        result = None
+        if route_cache is not None:
+            cache_key = (stop_route[0], stop_route[1:], ('improve', tuple(stop_route), job[2], job[3],
+                                                         frozenset(stop_deadlines.items()),
+                                                         tuple(sorted(options.items()))))
+            result = route_cache.get(*cache_key)
+        if result is None:
+            jobs.append(job)
+            cache_keys.append(cache_key)
+        results.append(result)
+
+    if parallel and jobs:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                                 initargs=(loader.distances,)) as executor:
+            improved = list(executor.map(improve_stop_route_job, jobs))
+    else:
+        improved = [improve_stop_route(stop_route, loader.distances, stop_deadlines, departure_time, travel_speed,
+                                       **job_options)
+                    for stop_route, stop_deadlines, departure_time, travel_speed, job_options in jobs]
+
+    # Fill in the trucks that weren't cached, in order, and cache their routes
+    improved = iter(zip(improved, cache_keys))
+    for i, result in enumerate(results):
+        if result is None:
+            results[i], cache_key = next(improved)
+            if cache_key is not None:
+                route_cache.put(*cache_key, *results[i])
+
+    improved_routes = []
+    for (start_node, packages_by_stop), (stop_route, total_distance) in zip(grouped_routes, results):
+        route = [start_node]
+        for stop in stop_route:
+            route.extend(packages_by_stop.get(stop, ()))
+        improved_routes.append((route, total_distance))
+    return improved_routes
@@ -0,0 +1,179 @@
+from bisect import bisect_right
+from package import initial_status
+
+# Kinds of events on the delivery timeline
+DEPARTED = 'departed'
+DELIVERED = 'delivered'
+ADDRESS_CORRECTED = 'address corrected'
+
+
+class PackageState:
+    # The state of a single package at some point in time
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def __init__(self, status, address, zipcode, delivery_time=None):
+        self.status = status
+        self.address = address
+        self.zipcode = zipcode
+        self.delivery_time = delivery_time  # Only set once the package is delivered
+
+    # Returns a copy of the state so that applying events doesn't change the initial state
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def copy(self):
+        return PackageState(self.status, self.address, self.zipcode, self.delivery_time)
+
+    # Updates the state with a single event
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def apply(self, kind, value):
+        if kind == DEPARTED:
+            self.status = 'En Route'
+        elif kind == DELIVERED:
+            self.status = 'Delivered'
+            self.delivery_time = value
+        elif kind == ADDRESS_CORRECTED:
+            self.address, self.zipcode = value
+
+
+class DeliveryTimeline:
+
+    # Method for initializing an empty timeline
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # Events are kept in parallel arrays (times, events) sorted by time, plus the same arrays per package, so that
+    # queries are a bisect on the times. Events can be added in any order, the arrays are sorted on the first query.
+    def __init__(self):
+        self.times = []
+        self.events = []
+        self.package_times = {}
+        self.package_events = {}
+        self.initial_states = {}
+        self.original_addresses = {}
+        self.is_sorted = True
+        self.needs_rebuild = False  # Set when a package's events were changed after they were added
+
+    # Adds an event for a package
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def add_event(self, time, package_id, kind, value=None):
+        self.times.append(time)
+        self.events.append((package_id, kind, value))
+        self.package_times.setdefault(package_id, []).append(time)
+        self.package_events.setdefault(package_id, []).append((kind, value))
+        self.is_sorted = False
+
+    # Records an address correction, the package shows its old address in snapshots before the given time
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def add_address_correction(self, time, package_id, old_address, old_zipcode, new_address, new_zipcode):
+        self.original_addresses.setdefault(package_id, (old_address, old_zipcode))
+        if package_id in self.initial_states:
+            self.initial_states[package_id].address, self.initial_states[package_id].zipcode = \
+                self.original_addresses[package_id]
+        self.add_event(time, package_id, ADDRESS_CORRECTED, (new_address, new_zipcode))
+
+    # Adds a package that leaves the hub at departure_time, with its delivery event if it has a delivery time
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def add_package(self, package, departure_time):
+        address, zipcode = self.original_addresses.get(package.id, (package.address, package.zipcode))
+        self.initial_states[package.id] = PackageState(initial_status(package.notes), address, zipcode)
+
+        self.add_event(departure_time, package.id, DEPARTED)
+        if package.delivery_time is not None:
+            self.add_event(package.delivery_time, package.id, DELIVERED, package.delivery_time)
+
+    # Adds the departure and delivery events for every package on a truck that has delivered its packages
+    # Time-Complexity: O(n) average-case / Space-Complexity: O(n)
+    # One hash table lookup per loaded package.
+    def add_truck(self, truck, loader):
+        for package_id in truck.loaded_packages:
+            self.add_package(loader.hashtable.lookup(package_id), truck.hub_departure_time)
+
+    # Moves a package's delivery event to a new time (e.g. after its route was changed)
+    # Time-Complexity: O(m) / Space-Complexity: O(1)
+    # Where m is the number of events of the package. Only the package's own arrays are changed here, the combined
+    # arrays are rebuilt from them on the next query.
+    def reschedule_delivery(self, package_id, delivery_time):
+        times = self.package_times[package_id]
+        events = self.package_events[package_id]
+        for i in range(len(events) - 1, -1, -1):
+            if events[i][0] == DELIVERED:
+                del times[i], events[i]
+        times.append(delivery_time)
+        events.append((DELIVERED, delivery_time))
+        self.needs_rebuild = True
+        self.is_sorted = False
+
+    # Removes a package and all of its events from the timeline (e.g. a cancelled package)
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # The combined arrays are rebuilt without it on the next query.
+    def remove_package(self, package_id):
+        self.initial_states.pop(package_id, None)
+        self.original_addresses.pop(package_id, None)
+        self.package_times.pop(package_id, None)
+        self.package_events.pop(package_id, None)
+        self.needs_rebuild = True
+        self.is_sorted = False
+
+    # Sorts the event arrays by time (stable, so events at the same time keep the order they were added in)
+    # Time-Complexity: O(e log e) / Space-Complexity: O(e)
+    # Where e is the number of events. Only runs once after events were added. If packages' events were changed, the
+    # combined arrays are first rebuilt from the per-package arrays (events of one package keep their order).
+    def sort(self):
+        if self.is_sorted:
+            return
+        if self.needs_rebuild:
+            self.times = []
+            self.events = []
+            for package_id, times in self.package_times.items():
+                self.times.extend(times)
+                self.events.extend((package_id, kind, value) for kind, value in self.package_events[package_id])
+            self.needs_rebuild = False
+        order = sorted(range(len(self.times)), key=self.times.__getitem__)
+        self.times = [self.times[i] for i in order]
+        self.events = [self.events[i] for i in order]
+        for package_id, times in self.package_times.items():
+            package_order = sorted(range(len(times)), key=times.__getitem__)
+            self.package_times[package_id] = [times[i] for i in package_order]
+            self.package_events[package_id] = [self.package_events[package_id][i] for i in package_order]
+        self.is_sorted = True
+
+    # Returns the state of a single package at the given time, or None if the package isn't on the timeline
+    # Time-Complexity: O(log m + m) / Space-Complexity: O(1)
+    # Where m is the number of events for the package (a few), found with a bisect on the package's event times.
+    def package_state(self, package_id, time):
+        initial_state = self.initial_states.get(package_id)
+        if initial_state is None:
+            return None
+        self.sort()
+        state = initial_state.copy()
+        package_events = self.package_events[package_id]
+        for i in range(bisect_right(self.package_times[package_id], time)):
+            state.apply(*package_events[i])
+        return state
+
+    # Returns a dictionary of package id to package state for every package on the timeline at the given time
+    # Time-Complexity: O(n + log e + k) / Space-Complexity: O(n)
+    # Where n is the number of packages and k the number of events up to the given time. A bisect finds how many events
+    # have happened, and only those are applied to copies of the initial states. Packages are never modified.
+    def snapshot(self, time):
+        self.sort()
+        states = {package_id: state.copy() for package_id, state in self.initial_states.items()}
+        for i in range(bisect_right(self.times, time)):
+            package_id, kind, value = self.events[i]
+            if package_id in states:
+                states[package_id].apply(kind, value)
+        return states
+
+    # Yields (time, states) for each of the given times in order, computing all of them in one pass over the events
+    # Time-Complexity: O(n + e + t log t) plus the caller's work per time / Space-Complexity: O(n)
+    # Where t is the number of times. The times are sorted and the events are applied once, advancing from one time to
+    # the next, instead of starting a new snapshot for each time. The yielded states dictionary is updated in place, so
+    # it is only valid until the next time is requested.
+    def snapshots(self, times):
+        self.sort()
+        states = {package_id: state.copy() for package_id, state in self.initial_states.items()}
+        event_count = len(self.times)
+        i = 0
+        for time in sorted(times):
+            while i < event_count and self.times[i] <= time:
+                package_id, kind, value = self.events[i]
+                if package_id in states:
+                    states[package_id].apply(kind, value)
+                i += 1
+            yield time, states
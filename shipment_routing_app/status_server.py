@@ -0,0 +1,331 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+from batch_report import PACKAGE_COLUMNS, TRUCK_COLUMNS, package_row, parse_time_of_day, truck_report
+from context import DATA_DIRECTORY, RoutingContext
+from fleet_planner import plan_fleet
+from main import plan_deliveries
+from truck import TRUCK_CAPACITY
+from truck_packing import LOADINGS
+
+# Longest request line or header line the server reads, anything longer is rejected
+MAX_LINE_LENGTH = 8192
+
+# Number of snapshot times whose package states a StatusSnapshot keeps around
+SNAPSHOT_CACHE_SIZE = 64
+
+# Reason phrases of the status codes the server sends
+REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           500: 'Internal Server Error'}
+
+
+class StatusSnapshot:
+
+    # Init a read-only view of one planned day: its packages, delivery timeline and trucks
+    # Time-Complexity: O(n log n) / Space-Complexity: O(n)
+    # Nothing in a snapshot changes after it is built (the timeline is sorted here, so queries don't sort it either),
+    # which is what lets any number of queries read it while a new plan is being computed. generation counts the plans
+    # the server has published.
+    def __init__(self, packages, timeline, truck_rows, generation=0):
+        self.packages = packages
+        self.timeline = timeline
+        self.truck_rows = truck_rows
+        self.generation = generation
+        self.created = time.time()
+        self.timeline.sort()
+        self.snapshot_cache = {}
+
+    # Creates a snapshot from a context whose deliveries have been planned
+    # Time-Complexity: O(n log n) / Space-Complexity: O(n)
+    @classmethod
+    def from_context(cls, context, generation=0):
+        packages = {package.id: package for package in context.loader.hashtable}
+        truck_rows = [dict(zip(TRUCK_COLUMNS, row)) for row in truck_report(context)]
+        return cls(packages, context.timeline, truck_rows, generation)
+
+    # Returns a package as a dictionary of the report columns, as it was at the given time (or at EOD), or None
+    # Time-Complexity: O(log m + m) / Space-Complexity: O(1)
+    # Where m is the number of timeline events of the package, see DeliveryTimeline.package_state.
+    def package(self, package_id, at_time=None):
+        package = self.packages.get(package_id)
+        if package is None:
+            return None
+        state = None if at_time is None else self.timeline.package_state(package_id, at_time)
+        return dict(zip(PACKAGE_COLUMNS, package_row(package, state)))
+
+    # Returns every package (or the given ones) as dictionaries of the report columns, as they were at the given time
+    # Time-Complexity: O(n + e) the first time for a time, O(p) afterwards / Space-Complexity: O(n)
+    # The states of the last SNAPSHOT_CACHE_SIZE times are kept, since the same times (the top of the hour, the end of
+    # the day) are asked for over and over. Raises a KeyError for an unknown package id.
+    def snapshot(self, at_time, package_ids=None):
+        states = self.snapshot_cache.get(at_time)
+        if states is None:
+            if len(self.snapshot_cache) >= SNAPSHOT_CACHE_SIZE:
+                del self.snapshot_cache[next(iter(self.snapshot_cache))]
+            states = self.snapshot_cache[at_time] = self.timeline.snapshot(at_time)
+        if package_ids is None:
+            package_ids = sorted(self.packages)
+        rows = []
+        for package_id in package_ids:
+            package = self.packages.get(package_id)
+            if package is None:
+                raise KeyError(f'Package ID {package_id} not found')
+            rows.append(dict(zip(PACKAGE_COLUMNS, package_row(package, states.get(package_id)))))
+        return rows
+
+
+# Plans the deliveries of a dataset from scratch and returns them as a snapshot, run in a worker process
+# Time-Complexity: see plan_deliveries and plan_fleet / Space-Complexity: O(n)
+# Only the snapshot is sent back, the worker's loader and caches stay in the worker. With depots the dataset is planned
+# with plan_fleet (in the worker, without a nested process pool), otherwise like the sample day. With a
+# cache_directory the dataset is read through the dataset cache (see dataset_cache.load_cached), which is keyed by the
+# contents of the files, so a replan after the files changed parses them again.
+def plan_snapshot(files, generation, depots=None, fleet_options=None, cache_directory=None):
+    context = RoutingContext(*files, cache_directory=cache_directory)
+    if depots:
+        plan_fleet(context, depots, parallel=False, **(fleet_options or {}))
+    else:
+        plan_deliveries(context)
+    return StatusSnapshot.from_context(context, generation)
+
+
+class StatusServer:
+
+    # Init the server over a first snapshot
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # Queries are answered from self.snapshot. A replan runs plan_snapshot in a process pool and, once it is done,
+    # replaces self.snapshot with the new one in a single assignment on the event loop, so a query sees either the old
+    # or the new plan, never a mix, and never waits for the planning. files and the planning options are what a
+    # replan plans, cache_directory is passed on to plan_snapshot. The pool starts its workers with 'spawn' rather
+    # than fork: a forked worker would inherit the listening socket and every open connection, keeping them open
+    # after the server closed them.
+    def __init__(self, snapshot, files, depots=None, fleet_options=None, max_workers=1, cache_directory=None):
+        self.snapshot = snapshot
+        self.files = files
+        self.depots = depots
+        self.fleet_options = fleet_options
+        self.cache_directory = cache_directory
+        self.max_workers = max_workers
+        self.executor = None
+        self.replan_task = None
+        self.pending_generation = snapshot.generation
+        self.replan_error = None
+        self.server = None
+        self.connections = {}  # Writer of every open connection, by the task serving it
+
+    # Starts listening, by default on the loopback interface only
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # Port 0 picks a free port, see 'port'.
+    async def start(self, host='127.0.0.1', port=8080):
+        self.server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_LINE_LENGTH)
+        return self.server
+
+    # Returns the port the server listens on
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    # Stops listening, closes the open connections, waits for a running replan and shuts the worker pool down
+    # Time-Complexity: O(c) plus the running replan / Space-Complexity: O(1)
+    # Where c is the number of open connections. Closing them lets their tasks see the end of the stream and finish
+    # rather than being cancelled with the event loop.
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for writer in self.connections.values():
+            writer.close()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        if self.replan_task is not None:
+            await asyncio.gather(self.replan_task, return_exceptions=True)
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    # Starts planning a new snapshot in the worker pool, unless one is already being planned
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # Returns the generation the new snapshot will have.
+    def replan(self):
+        if self.replan_task is None or self.replan_task.done():
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+            self.pending_generation = self.snapshot.generation + 1
+            self.replan_task = asyncio.get_running_loop().create_task(self.run_replan(self.pending_generation))
+        return self.pending_generation
+
+    # Plans a new snapshot in the worker pool and swaps it in
+    # Time-Complexity: see plan_snapshot / Space-Complexity: O(n)
+    # If planning fails (e.g. the dataset on disk was left invalid) the current snapshot stays and the error is reported
+    # by /status.
+    async def run_replan(self, generation):
+        try:
+            snapshot = await asyncio.get_running_loop().run_in_executor(self.executor, plan_snapshot, self.files,
+                                                                        generation, self.depots, self.fleet_options,
+                                                                        self.cache_directory)
+        except Exception as error:
+            self.replan_error = f'{type(error).__name__}: {error}'
+        else:
+            self.snapshot = snapshot
+            self.replan_error = None
+
+    # Serves the requests of one connection, keeping it open between requests (HTTP/1.1 keep-alive)
+    # Time-Complexity: O(r) times the cost of the requests / Space-Complexity: O(1)
+    # Where r is the number of requests on the connection. Clients that send many queries can reuse one connection
+    # instead of paying for a new one per query. A request that can't be parsed (a malformed request line or header,
+    # a line longer than MAX_LINE_LENGTH) is answered with a 400 and the connection is closed, since there is no telling
+    # where the next request would start.
+    async def handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections[task] = writer
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except ValueError as error:
+                    await self.send_response(writer, 400, {'error': f'Malformed request: {error}'}, False)
+                    break
+                if request is None:
+                    break
+                method, target, version, headers = request
+                status, body = self.respond(method, target)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                await self.send_response(writer, status, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            del self.connections[task]
+            writer.close()
+
+    # Writes one response with a JSON body
+    # Time-Complexity: O(l) / Space-Complexity: O(l)
+    # Where l is the length of the body.
+    @staticmethod
+    async def send_response(writer, status, body, keep_alive):
+        payload = json.dumps(body).encode()
+        writer.write(f'HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n'
+                     f'Content-Length: {len(payload)}\r\n'
+                     f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode() + payload)
+        await writer.drain()
+
+    # Reads one request, returns (method, target, version, headers) or None once the client is done
+    # Time-Complexity: O(l) / Space-Complexity: O(l)
+    # Where l is the length of the request. A request body (Content-Length) is read and ignored, the API has none.
+    # Raises a ValueError for a request that isn't HTTP/1.x or a line longer than MAX_LINE_LENGTH (from readline).
+    @staticmethod
+    async def read_request(reader):
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        parts = request_line.decode('latin-1').split()
+        if len(parts) != 3 or not parts[2].startswith('HTTP/1.'):
+            raise ValueError(f'invalid request line {request_line.decode("latin-1").strip()!r}')
+        method, target, version = parts
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, separator, value = line.decode('latin-1').partition(':')
+            if not separator:
+                raise ValueError(f'invalid header line {line.decode("latin-1").strip()!r}')
+            headers[name.strip().lower()] = value.strip()
+        content_length = headers.get('content-length', '0')
+        if not content_length.isdigit():
+            raise ValueError(f'invalid Content-Length {content_length!r}')
+        if int(content_length):
+            await reader.readexactly(int(content_length))
+        return method, target, version, headers
+
+    # Answers a request, returns (status code, JSON body)
+    # Time-Complexity: O(1) for a package, O(n) for a snapshot / Space-Complexity: O(n) for a snapshot
+    # GET /packages/<id>[?time=HH:MM:SS]   one package, at EOD or at the given time
+    # GET /snapshot?time=HH:MM:SS[&package=<id>...]   every package (or the given ones) at the given time
+    # GET /trucks   departure time, package count and mileage per truck
+    # GET /status   generation and age of the current plan, whether a replan is running and why the last one failed
+    # POST /replan  plans again in the worker pool and swaps the result in once it's done
+    # Every query reads the snapshot reference once, so it is answered from a single plan even if a replan finishes
+    # in between.
+    def respond(self, method, target):
+        snapshot = self.snapshot
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        parts = [part for part in url.path.split('/') if part]
+        try:
+            at_time = parse_time_of_day(query['time'][0]) if 'time' in query else None
+            if method == 'POST' and parts == ['replan']:
+                return 202, {'generation': self.replan()}
+            if method != 'GET':
+                return 405, {'error': f'{method} is not supported'}
+            if len(parts) == 2 and parts[0] == 'packages':
+                package = snapshot.package(int(parts[1]), at_time)
+                if package is None:
+                    return 404, {'error': f'Package ID {parts[1]} not found'}
+                return 200, package
+            if parts == ['snapshot']:
+                if at_time is None:
+                    return 400, {'error': 'time is required'}
+                package_ids = [int(package_id) for package_id in query['package']] if 'package' in query else None
+                return 200, {'time': str(at_time), 'packages': snapshot.snapshot(at_time, package_ids)}
+            if parts == ['trucks']:
+                return 200, snapshot.truck_rows
+            if parts == ['status']:
+                return 200, {'generation': snapshot.generation, 'age_seconds': round(time.time() - snapshot.created, 3),
+                             'replanning': self.replan_task is not None and not self.replan_task.done(),
+                             'replan_error': self.replan_error}
+            return 404, {'error': f'{url.path} not found'}
+        except KeyError as error:
+            return 404, {'error': error.args[0]}
+        except (ValueError, argparse.ArgumentTypeError) as error:
+            return 400, {'error': str(error)}
+
+
+# Plans the first snapshot and serves queries until interrupted
+# Time-Complexity: see plan_snapshot / Space-Complexity: O(n)
+async def serve(args):
+    files = RoutingContext(data_directory=args.data_directory)
+    files = (files.packages_file, files.addresses_file, files.distances_file)
+    fleet_options = {'days': args.days, 'truck_count': args.trucks, 'capacity': args.capacity,
+                     'max_weight': args.max_weight, 'loading': args.loading}
+    server = StatusServer(plan_snapshot(files, 0, args.depots, fleet_options, args.cache_dir), files, args.depots,
+                          fleet_options, args.workers, args.cache_dir)
+    await server.start(args.host, args.port)
+    print(f'Serving package status on http://{args.host}:{server.port}')
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Answer package status queries over HTTP/JSON.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on (default: 8080)')
+    parser.add_argument('--data-directory', default=DATA_DIRECTORY, help='directory of the dataset (default: csv)')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes for replanning (default: 1)')
+    parser.add_argument('--cache-dir', metavar='DIRECTORY',
+                        help='keep the parsed dataset in a cache here and read it from there on later runs')
+    fleet = parser.add_argument_group('fleet planning', 'plan several depots and days instead of the sample day')
+    fleet.add_argument('--depot', dest='depots', action='append', type=int, metavar='ADDRESS_ID',
+                       help='address ID of a depot (can be repeated)')
+    fleet.add_argument('--days', type=int, default=1, help='number of days to plan (default: 1)')
+    fleet.add_argument('--trucks', type=int, default=3, help='trucks per depot and day (default: 3)')
+    fleet.add_argument('--capacity', type=int, default=TRUCK_CAPACITY,
+                       help=f'packages per truck (default: {TRUCK_CAPACITY})')
+    fleet.add_argument('--max-weight', type=float, metavar='KILOS', help='kilos per truck (default: no limit)')
+    fleet.add_argument('--loading', choices=LOADINGS, default='assign',
+                       help='fill the given trucks or pack onto as few trucks as possible (default: assign)')
+    try:
+        asyncio.run(serve(parser.parse_args(argv)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+import csv
+import math
+import os
+import random
+from collections import deque
+from coordinate_distances import MILES_PER_DEGREE
+
+# Street names and suffixes that synthetic addresses are built from
+STREET_NAMES = ('Main St', 'State St', 'S 500 E', 'W 2100 S', 'Canyon Rd', 'Parkway Blvd', 'S 900 W', 'E 900 S',
+                'Lester St', 'Valley Central Station', 'Taylorsville Blvd', 'S 2700 W', 'W Price Ave', 'Dalton Ave S',
+                'S 1300 E', 'S 2300 E', 'W Oakland Ave', 'S 700 E', 'W 500 S', 'Wasatch Blvd')
+CITIES = (('Salt Lake City', '84115'), ('West Valley City', '84119'), ('Millcreek', '84117'), ('Murray', '84107'),
+          ('Holladay', '84117'), ('Taylorsville', '84118'))
+
+# Deadlines and how often they are drawn, the rest of the packages are due at EOD
+DEADLINES = (('9:00 AM', 0.02), ('10:30 AM', 0.2))
+
+# How often each kind of special note is drawn
+TRUCK_NOTE_RATE = 0.02
+DELAYED_NOTE_RATE = 0.05
+WRONG_ADDRESS_RATE = 0.005
+DELIVERED_WITH_RATE = 0.02
+
+# Size of the synthetic city in miles (addresses are spread over a square of this side length). Every address is at
+# most CITY_SIZE miles of street grid from the hub in the middle, which a truck leaving at 8:00 covers before 9:00.
+CITY_SIZE = 16.0
+
+# Latitude and longitude of the hub, the synthetic city is laid out around it
+HUB_LATITUDE = 40.6855
+HUB_LONGITUDE = -111.8703
+
+
+# Returns a reasonable number of addresses for a manifest of the given size
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+# Grows with the number of packages but is capped, since the distance table grows with the square of it.
+def default_address_count(package_count):
+    return max(27, min(package_count // 20, 2000))
+
+
+# Generates addresses with coordinates (in miles) spread over the synthetic city, the hub is address 0 in the middle
+# Time-Complexity: O(n) / Space-Complexity: O(n)
+def generate_addresses(address_count, rng):
+    addresses = [(0, 'Hub', '4001 South 700 East', CITY_SIZE / 2, CITY_SIZE / 2)]
+    used_streets = {'4001 South 700 East'}
+    while len(addresses) < address_count:
+        street = f'{rng.randint(100, 9999)} {rng.choice(STREET_NAMES)}'
+        if street in used_streets:
+            continue
+        used_streets.add(street)
+        addresses.append((len(addresses), f'Location {len(addresses)}', street, rng.uniform(0, CITY_SIZE),
+                          rng.uniform(0, CITY_SIZE)))
+    return addresses
+
+
+# Converts a position in the synthetic city (miles east and north of its corner) to latitude and longitude
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+# Uses the same flat projection as the coordinate backend, so its 'manhattan' metric gives back the street grid
+# distances of the distance table.
+def to_coordinates(x, y):
+    latitude = HUB_LATITUDE + (y - CITY_SIZE / 2) / MILES_PER_DEGREE
+    longitude = HUB_LONGITUDE + (x - CITY_SIZE / 2) / (MILES_PER_DEGREE * math.cos(math.radians(HUB_LATITUDE)))
+    return latitude, longitude
+
+
+# Writes the addresses file (id, name, street address, latitude, longitude)
+# Time-Complexity: O(n) / Space-Complexity: O(1)
+# The two coordinate columns come after the three columns of the sample file, so the file still loads the same way.
+def write_addresses(file_path, addresses):
+    with open(file_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        for address_id, name, street, x, y in addresses:
+            latitude, longitude = to_coordinates(x, y)
+            writer.writerow([address_id, name, street, f'{latitude:.6f}', f'{longitude:.6f}'])
+
+
+# Writes the lower-triangular distance table, using the street grid (Manhattan) distance between addresses
+# Time-Complexity: O(n^2) / Space-Complexity: O(n)
+# Written one row at a time so that large tables are never held in memory.
+def write_distances(file_path, addresses):
+    count = len(addresses)
+    with open(file_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        for i, (_, _, _, x_i, y_i) in enumerate(addresses):
+            row = [f'{abs(x_i - x_j) + abs(y_i - y_j):.1f}' for _, _, _, x_j, y_j in addresses[:i]]
+            row.append('0.0')
+            row.extend([''] * (count - i - 1))
+            writer.writerow(row)
+
+
+# Draws the notes for a package. Packages with a note are kept at EOD, so no package has a deadline it can't make.
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+# Every package can be on time on its own, but nothing here sizes the deadlines to the fleet: the trucks that wait for
+# delayed or corrected packages leave late, and the default fleet doesn't always deliver every deadline on time (the
+# benchmark reports the late packages and 'deadlines_met').
+# Truck restrictions are spread over all trucks of the default fleet so that no single truck runs out of room.
+# 'Must be delivered with' notes only link to earlier packages without notes or deadlines ('plain_ids'), so that a
+# group never mixes a delayed package with one that has to leave the hub early.
+def generate_notes(truck_count, plain_ids, rng):
+    draw = rng.random()
+    if draw < TRUCK_NOTE_RATE:
+        return f'Can only be on truck {rng.randint(1, truck_count)}'
+    draw -= TRUCK_NOTE_RATE
+    if draw < DELAYED_NOTE_RATE:
+        return 'Delayed on flight---will not arrive to depot until 9:05 am'
+    draw -= DELAYED_NOTE_RATE
+    if draw < WRONG_ADDRESS_RATE:
+        return 'Wrong address listed'
+    draw -= WRONG_ADDRESS_RATE
+    if draw < DELIVERED_WITH_RATE and len(plain_ids) >= 2:
+        return 'Must be delivered with ' + ', '.join(str(other) for other in rng.sample(plain_ids, 2))
+    return ''
+
+
+# Writes the package manifest in the same column layout as the sample package file
+# Time-Complexity: O(n) / Space-Complexity: O(1)
+def write_packages(file_path, package_count, addresses, rng):
+    truck_count, _ = default_fleet(package_count)
+    plain_ids = deque(maxlen=4)  # The last few packages without notes or deadlines, to link new groups to
+    with open(file_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        for package_id in range(1, package_count + 1):
+            _, _, street, _, _ = addresses[rng.randrange(1, len(addresses))]
+            city, zipcode = rng.choice(CITIES)
+            notes = generate_notes(truck_count, list(plain_ids), rng)
+            deadline = 'EOD'
+            if not notes:
+                draw = rng.random()
+                for value, rate in DEADLINES:
+                    if draw < rate:
+                        deadline = value
+                        break
+                    draw -= rate
+                if deadline == 'EOD':
+                    plain_ids.append(package_id)
+            writer.writerow([package_id, street, city, 'UT', zipcode, deadline, rng.randint(1, 90), notes])
+
+
+# Writes a complete synthetic dataset (packages, addresses, distances) to a directory and returns the three paths
+# Time-Complexity: O(n + m^2) / Space-Complexity: O(m)
+# Where n is the number of packages and m the number of addresses. The same seed always gives the same files.
+def write_dataset(directory, package_count, address_count=None, seed=0):
+    if address_count is None:
+        address_count = default_address_count(package_count)
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    packages_file = os.path.join(directory, 'package_data.csv')
+    addresses_file = os.path.join(directory, 'street_addresses.csv')
+    distances_file = os.path.join(directory, 'distance_table.csv')
+
+    addresses = generate_addresses(address_count, rng)
+    write_addresses(addresses_file, addresses)
+    write_distances(distances_file, addresses)
+    write_packages(packages_file, package_count, addresses, rng)
+    return packages_file, addresses_file, distances_file
+
+
+# Returns the number of trucks and the per-truck capacity to use for a manifest of the given size
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+# At least three trucks, about 400 packages per truck for large manifests, with some spare capacity. The fleet is
+# sized for the package count only, not for the deadlines, see generate_notes.
+def default_fleet(package_count):
+    truck_count = max(3, math.ceil(package_count / 400))
+    return truck_count, max(16, math.ceil(package_count * 1.25 / truck_count))
@@ -0,0 +1,148 @@
+import unittest
+from datetime import timedelta
+from context import RoutingContext
+from live_updates import LiveRouter
+from main import plan_deliveries
+from package import Package
+
+# Times of the sample day: every truck is still at the hub, and truck 3 (out at 8:00) is on its route
+BEFORE_DEPARTURE = timedelta(hours=7, minutes=30)
+MORNING = timedelta(hours=9)
+
+
+# Returns a new package for the sample day, at the hub and not on a truck yet
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+def new_package(package_id, address='1060 Dalton Ave S', zipcode='84104', deadline=None, weight=5.0):
+    return Package(package_id, address, 'Salt Lake City', 'UT', zipcode, deadline, weight, '', None, 'At Hub', None)
+
+
+class LiveRouterTest(unittest.TestCase):
+
+    # Plans the sample day again for every test, since the router changes the plan in place
+    def setUp(self):
+        self.context = RoutingContext()
+        plan_deliveries(self.context)
+        self.loader = self.context.loader
+        self.router = LiveRouter(self.context)
+
+    # Checks that every package on a truck's route has the arrival time of its stop, on the package and the timeline,
+    # that the ETAs are those of every package from the first changed stop on, and that the mileage is the route's
+    def assert_published(self, truck_route, etas):
+        route = truck_route.route
+        end_of_day = self.context.timeline.snapshot(timedelta(hours=23))
+        changed = False
+        for i, stop_packages in enumerate(truck_route.packages):
+            for package_id in stop_packages:
+                package = self.loader.hashtable.lookup(package_id)
+                self.assertAlmostEqual(package.delivery_time.total_seconds(), route.arrivals[i], places=3)
+                self.assertEqual(end_of_day[package_id].delivery_time, package.delivery_time)
+                changed = changed or package_id in etas
+                if changed:
+                    self.assertEqual(etas[package_id], package.delivery_time)
+        self.assertEqual(truck_route.truck.distance_traveled, round(self.router.route_distance(route.stops), 2))
+
+    # The routes rebuilt from the plan arrive at every stop when the plan delivers its packages
+    def test_rebuilt_arrival_times(self):
+        for truck_route in self.router.routes.values():
+            self.assertEqual(truck_route.route.stops[0], truck_route.truck.depot)
+            for i, stop_packages in enumerate(truck_route.packages):
+                for package_id in stop_packages:
+                    delivery_time = self.loader.hashtable.lookup(package_id).delivery_time
+                    self.assertAlmostEqual(delivery_time.total_seconds(), truck_route.route.arrivals[i], places=3)
+
+    def test_change_address(self):
+        truck_route = self.router.routes[1]
+        package_id = truck_route.packages[-1][0]
+        package = self.loader.hashtable.lookup(package_id)
+        old_address = package.address
+        etas = self.router.change_address(MORNING, package_id, '1060 Dalton Ave S', '84104')
+
+        self.assertEqual(package.address, '1060 Dalton Ave S')
+        position = truck_route.position_of(package_id)
+        self.assertEqual(truck_route.route.stops[position], self.loader.get_address_id(package_id))
+        self.assertIn(package_id, etas)
+        self.assert_published(truck_route, etas)
+        timeline = self.context.timeline
+        self.assertEqual(timeline.package_state(package_id, MORNING - timedelta(minutes=1)).address, old_address)
+        self.assertEqual(timeline.package_state(package_id, MORNING).address, '1060 Dalton Ave S')
+
+    def test_change_address_errors(self):
+        truck_route = self.router.routes[3]
+        delivered_id = truck_route.packages[1][0]
+        address = self.loader.hashtable.lookup(delivered_id).address
+        with self.assertRaises(ValueError):
+            self.router.change_address(MORNING, delivered_id, '1060 Dalton Ave S', '84104')
+        self.assertEqual(self.loader.hashtable.lookup(delivered_id).address, address)
+        with self.assertRaises(ValueError):
+            self.router.change_address(MORNING, self.router.routes[1].packages[-1][0], '1 Nowhere Rd')
+
+    # A truck at the hub takes a package only within its capacity and weight limit
+    def test_add_package_limits(self):
+        full_truck = self.router.routes[2].truck
+        self.assertEqual(len(full_truck.loaded_packages), full_truck.capacity)
+        with self.assertRaises(ValueError):
+            self.router.add_package(BEFORE_DEPARTURE, new_package(41), truck_id=2)
+
+        light_truck = self.router.routes[1].truck
+        light_truck.max_weight = light_truck.loaded_weight + 1
+        with self.assertRaises(ValueError):
+            self.router.add_package(BEFORE_DEPARTURE, new_package(41), truck_id=1)
+        self.router.routes[3].truck.capacity = len(self.router.routes[3].truck.loaded_packages)
+        with self.assertRaises(ValueError):
+            self.router.add_package(BEFORE_DEPARTURE, new_package(41))
+        self.assertIsNone(self.loader.hashtable.lookup(41))
+
+        etas = self.router.add_package(BEFORE_DEPARTURE, new_package(41, weight=1.0), truck_id=1)
+        self.assertIn(41, light_truck.loaded_packages)
+        self.assert_published(self.router.routes[1], etas)
+
+    # A truck that is out comes back to its depot for a new package, and only the packages it still carries count
+    # against its capacity
+    def test_add_package_after_departure(self):
+        truck_route = self.router.routes[3]
+        truck = truck_route.truck
+        capacity = truck.capacity
+        self.assertEqual(len(truck.loaded_packages), capacity)
+        time = timedelta(seconds=truck_route.route.arrivals[2]) + timedelta(minutes=1)
+        first_position, depot_position = truck_route.pickup_position(time)
+        truck.capacity = sum(map(len, truck_route.packages[first_position + (depot_position is None):]))
+        self.assertLess(truck.capacity, capacity)
+        with self.assertRaises(ValueError):
+            self.router.add_package(time, new_package(41), truck_id=3)
+
+        truck.capacity = capacity
+        etas = self.router.add_package(time, new_package(41, deadline=timedelta(hours=17)), truck_id=3)
+
+        position = truck_route.position_of(41)
+        depot_position = max(i for i in range(position) if truck_route.route.stops[i] == truck.depot)
+        self.assertGreater(depot_position, truck_route.first_open_position(time))
+        self.assertGreater(etas[41], timedelta(seconds=truck_route.route.arrivals[depot_position]))
+        self.assertEqual(len(truck.loaded_packages), capacity + 1)
+        self.assert_published(truck_route, etas)
+
+    def test_remove_package(self):
+        truck_route = self.router.routes[1]
+        package_id = truck_route.packages[-1][0]
+        etas = self.router.remove_package(MORNING, package_id)
+
+        self.assertIsNone(self.loader.hashtable.lookup(package_id))
+        self.assertNotIn(package_id, truck_route.truck.loaded_packages)
+        self.assertNotIn(package_id, self.context.timeline.snapshot(timedelta(hours=23)))
+        self.assertNotIn(package_id, etas)
+        self.assert_published(truck_route, etas)
+
+    # A package the truck has delivered or is driving to can't be removed any more
+    def test_remove_picked_up_package(self):
+        truck_route = self.router.routes[3]
+        first_position = truck_route.first_open_position(MORNING)
+        self.assertGreater(first_position, 0)
+        for position in (1, first_position):
+            package_id = truck_route.packages[position][0]
+            with self.assertRaises(ValueError):
+                self.router.remove_package(MORNING, package_id)
+            self.assertIsNotNone(self.loader.hashtable.lookup(package_id))
+            self.assertIn(package_id, truck_route.truck.loaded_packages)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import os
+import unittest
+from context import RoutingContext
+from status_server import StatusServer, plan_snapshot
+
+
+# Sends raw request bytes to a local server, returns (status code, headers, JSON body) of every response
+# Time-Complexity: O(l) / Space-Complexity: O(l)
+# Where l is the length of the responses. Reads until the server closes the connection, so the last request has to ask
+# for 'Connection: close' (or be HTTP/1.0).
+async def exchange(port, data):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(data)
+    await writer.drain()
+    responses = []
+    while not reader.at_eof():
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError:
+            break
+        status_line, *header_lines = head.decode('latin-1').strip().split('\r\n')
+        headers = {name.lower(): value.strip() for name, _, value in (line.partition(':') for line in header_lines)}
+        body = await reader.readexactly(int(headers['content-length']))
+        responses.append((int(status_line.split()[1]), headers, json.loads(body)))
+    writer.close()
+    return responses
+
+
+# Sends one HTTP/1.0 request to a local server, returns (status code, JSON body)
+# Time-Complexity: O(l) / Space-Complexity: O(l)
+async def request(port, method, target):
+    (status, _, body), = await exchange(port, f'{method} {target} HTTP/1.0\r\n\r\n'.encode())
+    return status, body
+
+
+class StatusServerTest(unittest.IsolatedAsyncioTestCase):
+
+    # Plans the sample day once, every test serves it from its own server on a free loopback port
+    @classmethod
+    def setUpClass(cls):
+        files = RoutingContext()
+        cls.files = (files.packages_file, files.addresses_file, files.distances_file)
+        cls.snapshot = plan_snapshot(cls.files, 0)
+
+    async def asyncSetUp(self):
+        self.server = StatusServer(self.snapshot, self.files)
+        await self.server.start(port=0)
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    async def test_package_query(self):
+        status, body = await request(self.server.port, 'GET', '/packages/9?time=09:00:00')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['package_id'], 9)
+        status, body = await request(self.server.port, 'GET', '/packages/9')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['address'], '410 S State St')
+
+    async def test_snapshot_query(self):
+        status, body = await request(self.server.port, 'GET', '/snapshot?time=10:00:00&package=1&package=2')
+        self.assertEqual(status, 200)
+        self.assertEqual([row['package_id'] for row in body['packages']], [1, 2])
+        status, _ = await request(self.server.port, 'GET', '/snapshot?time=1%20day,%2009:00:00')
+        self.assertEqual(status, 200)
+
+    async def test_errors(self):
+        self.assertEqual((await request(self.server.port, 'GET', '/packages/999'))[0], 404)
+        self.assertEqual((await request(self.server.port, 'GET', '/packages/x'))[0], 400)
+        self.assertEqual((await request(self.server.port, 'GET', '/snapshot?time=25:00:00'))[0], 400)
+        self.assertEqual((await request(self.server.port, 'GET', '/snapshot'))[0], 400)
+        self.assertEqual((await request(self.server.port, 'DELETE', '/trucks'))[0], 405)
+        self.assertEqual((await request(self.server.port, 'GET', '/nowhere'))[0], 404)
+
+    # A request line that isn't 'METHOD TARGET HTTP/1.x' gets a 400 and the connection is closed
+    async def test_malformed_request(self):
+        for data in (b'GET\r\n\r\n', b'GET / HTTP/1.1 extra\r\n\r\n', b'hello\r\n',
+                     b'GET /trucks HTTP/1.1\r\nno colon\r\n\r\n', b'GET /trucks HTTP/1.1\r\nContent-Length: x\r\n\r\n',
+                     b'GET /' + b'a' * 10000 + b' HTTP/1.1\r\n\r\n'):
+            (status, headers, body), = await exchange(self.server.port, data)
+            self.assertEqual(status, 400)
+            self.assertEqual(headers['connection'], 'close')
+            self.assertIn('Malformed request', body['error'])
+
+    # Several requests on one HTTP/1.1 connection are answered in order
+    async def test_keep_alive(self):
+        responses = await exchange(self.server.port, b'GET /packages/1 HTTP/1.1\r\n\r\n'
+                                                     b'GET /trucks HTTP/1.1\r\n\r\n'
+                                                     b'GET /status HTTP/1.1\r\nConnection: close\r\n\r\n')
+        self.assertEqual([status for status, _, _ in responses], [200, 200, 200])
+        self.assertEqual([headers['connection'] for _, headers, _ in responses], ['keep-alive', 'keep-alive', 'close'])
+        self.assertEqual(responses[1][2], self.snapshot.truck_rows)
+
+    # A replan swaps in the next generation, and the worker that planned it doesn't hold any of the server's sockets
+    async def test_replan(self):
+        status, body = await request(self.server.port, 'POST', '/replan')
+        self.assertEqual((status, body), (202, {'generation': 1}))
+        await self.server.replan_task
+        status, body = await request(self.server.port, 'GET', '/status')
+        self.assertEqual(body['generation'], 1)
+        self.assertFalse(body['replanning'])
+        self.assertIsNone(body['replan_error'])
+        self.assertEqual((await request(self.server.port, 'GET', '/trucks'))[1], self.snapshot.truck_rows)
+        if os.path.isdir('/proc/self/fd'):
+            listening = {f'socket:[{os.fstat(sock.fileno()).st_ino}]' for sock in self.server.server.sockets}
+            for pid in self.server.executor._processes:
+                worker_fds = {os.readlink(f'/proc/{pid}/fd/{fd}') for fd in os.listdir(f'/proc/{pid}/fd')}
+                self.assertFalse(listening & worker_fds)
+
+
+if __name__ == '__main__':
+    unittest.main()
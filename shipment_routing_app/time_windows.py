@@ -0,0 +1,312 @@
+from bisect import bisect_left
+from datetime import timedelta
+from functools import partial
+from math import inf
+
+# Smallest amount of seconds that counts as being late (guards against floating point noise)
+EPSILON = 1e-6
+
+
+class TimeWindowRoute:
+
+    # Method for initializing a route that only holds the truck's starting stop
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # The route is kept in parallel arrays: the stops in order, the arrival time at each stop and its deadline (seconds
+    # since midnight, inf for EOD), and the forward time slack of each stop. slacks[i] is how many seconds the arrival
+    # at stop i (and so at every later stop) can be pushed back before some stop from i on misses its deadline, i.e.
+    # the smallest 'deadline - arrival' from i to the end of the route. With it, checking whether inserting a stop
+    # keeps every later deadline is a single comparison instead of a walk down the rest of the route.
+    def __init__(self, start_stop, departure_time, travel_speed, distance_matrix):
+        self.distance_matrix = distance_matrix
+        self.seconds_per_mile = 3600 / travel_speed
+        self.stops = [start_stop]
+        self.arrivals = [departure_time]
+        self.deadlines = [inf]
+        self.slacks = [inf]
+
+    # Returns (seconds the stop itself would be late, seconds the most pressed later stop would be late, extra miles)
+    # for inserting the stop after position i
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # The insertion delays every later stop by the same amount, so comparing it to the next stop's slack is enough.
+    def insertion_cost(self, i, stop, deadline):
+        row = self.distance_matrix[stop]
+        previous_stop = self.stops[i]
+        added_distance = row[previous_stop]
+        lateness = max(self.arrivals[i] + added_distance * self.seconds_per_mile - deadline, 0)
+        later_lateness = 0
+        if i + 1 < len(self.stops):
+            next_stop = self.stops[i + 1]
+            added_distance += row[next_stop] - self.distance_matrix[previous_stop][next_stop]
+            later_lateness = max(added_distance * self.seconds_per_mile - self.slacks[i + 1], 0)
+        return lateness, later_lateness, added_distance
+
+    # Finds the position to insert a stop after that adds the fewest miles while every stop stays on time
+    # Time-Complexity: O(n) / Space-Complexity: O(1)
+    # Where n is the number of stops on the route, each position is checked in O(1) with insertion_cost. Returns None
+    # if there's no such position. With allow_late=True the stop itself may be late: it goes where it is the least late
+    # without making any other stop late (or, failing that, where it delays the other stops the least). Positions before
+    # first_position are skipped (e.g. the part of the route the truck has already driven).
+    def best_insertion(self, stop, deadline, allow_late=False, first_position=0):
+        best_position = None
+        best_cost = None
+        for i in range(first_position, len(self.stops)):
+            lateness, later_lateness, added_distance = self.insertion_cost(i, stop, deadline)
+            if allow_late:
+                cost = (later_lateness > EPSILON, later_lateness, lateness, added_distance)
+            elif lateness > EPSILON or later_lateness > EPSILON:
+                continue
+            else:
+                cost = added_distance
+            if best_cost is None or cost < best_cost:
+                best_position, best_cost = i, cost
+        return best_position
+
+    # Creates a route that follows the given stops in order (e.g. a route that was already planned)
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    # deadlines holds each stop's deadline in the same order (inf for EOD), the first stop is where the truck starts.
+    @classmethod
+    def from_stops(cls, stops, deadlines, departure_time, travel_speed, distance_matrix):
+        route = cls(stops[0], departure_time, travel_speed, distance_matrix)
+        route.stops = list(stops)
+        route.deadlines = [inf] + list(deadlines[1:])
+        route.arrivals = [departure_time] * len(stops)
+        route.slacks = [inf] * len(stops)
+        route.update_from(1)
+        return route
+
+    # Returns a copy of the route that can be changed without changing this one
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    def copy(self):
+        route = TimeWindowRoute.__new__(TimeWindowRoute)
+        route.distance_matrix = self.distance_matrix
+        route.seconds_per_mile = self.seconds_per_mile
+        route.stops = list(self.stops)
+        route.arrivals = list(self.arrivals)
+        route.deadlines = list(self.deadlines)
+        route.slacks = list(self.slacks)
+        return route
+
+    # Brings the arrival times from position on, and the slacks up to position, up to date after a change at position
+    # Time-Complexity: O(n) / Space-Complexity: O(1)
+    # Arrival times only change from the changed stop on and slacks only from the end back to it (and then only as far
+    # as they actually change), so both are updated in one pass each over the affected part of the arrays.
+    def update_from(self, position):
+        stops = self.stops
+        arrivals = self.arrivals
+        for j in range(max(position, 1), len(stops)):
+            arrivals[j] = arrivals[j - 1] + self.distance_matrix[stops[j - 1]][stops[j]] * self.seconds_per_mile
+
+        slacks = self.slacks
+        deadlines = self.deadlines
+        slack = inf
+        for j in range(len(stops) - 1, -1, -1):
+            slack = min(slack, deadlines[j] - arrivals[j])
+            if j < position and slacks[j] == slack:
+                # Arrivals before the changed stop didn't change, so once a slack is unchanged so are all before it
+                break
+            slacks[j] = slack
+
+    # Inserts a stop after position i and brings the arrival times and slacks up to date
+    # Time-Complexity: O(n) / Space-Complexity: O(1) amortized
+    def insert(self, i, stop, deadline):
+        position = i + 1
+        self.stops.insert(position, stop)
+        self.deadlines.insert(position, deadline)
+        self.arrivals.insert(position, 0)
+        self.slacks.insert(position, 0)
+        self.update_from(position)
+
+    # Removes the stop at position i (never the starting stop) and brings the arrival times and slacks up to date
+    # Time-Complexity: O(n) / Space-Complexity: O(1)
+    def remove(self, i):
+        del self.stops[i], self.deadlines[i], self.arrivals[i], self.slacks[i]
+        self.update_from(i)
+
+    # Changes the deadline of the stop at position i (e.g. when its packages changed)
+    # Time-Complexity: O(n) / Space-Complexity: O(1)
+    def set_deadline(self, i, deadline):
+        self.deadlines[i] = deadline
+        self.update_from(i)
+
+    # Returns the total distance of the route in miles
+    # Time-Complexity: O(n) / Space-Complexity: O(1)
+    def distance(self):
+        return sum(self.distance_matrix[a][b] for a, b in zip(self.stops, self.stops[1:]))
+
+    # Returns the positions of the stops that are reached after their deadline
+    # Time-Complexity: O(n) / Space-Complexity: O(n)
+    def late_positions(self):
+        return [i for i in range(len(self.stops)) if self.arrivals[i] > self.deadlines[i] + EPSILON]
+
+
+# Inserts stops into a route one at a time where they add the fewest miles without making any stop late
+# Time-Complexity: O(k * s) / Space-Complexity: O(k)
+# Where k is the number of stops to insert and s the length of the route. Each insertion checks every position in O(1)
+# against the forward slack arrays and updates them in O(s). Stops that can't be placed on time anywhere are inserted
+# after all the others, where they are the least late, so they don't take the slack of stops that still can.
+def insert_stops(route, stops, stop_deadlines):
+    late_stops = []
+    for stop in stops:
+        deadline = stop_deadlines.get(stop, inf)
+        position = route.best_insertion(stop, deadline)
+        if position is None:
+            late_stops.append(stop)
+        else:
+            route.insert(position, stop, deadline)
+    for stop in late_stops:
+        deadline = stop_deadlines[stop]
+        route.insert(route.best_insertion(stop, deadline, allow_late=True), stop, deadline)
+    return route
+
+
+# Builds a route by inserting every stop, the earliest deadlines first
+# Time-Complexity: O(s^2) / Space-Complexity: O(s)
+# Stops with the earliest deadlines are placed first, then the stops due at EOD from the farthest to the nearest
+# (farthest insertion sketches the outline of the route first and fills it in with the stops close to it).
+def build_insertion_route(route, stops, stop_deadlines):
+    start_row = route.distance_matrix[route.stops[0]]
+    return insert_stops(route, sorted(stops, key=lambda stop: (stop_deadlines.get(stop, inf), -start_row[stop])),
+                        stop_deadlines)
+
+
+# Builds a route that drives to the stops with a deadline nearest neighbor first, then inserts the stops due at EOD
+# Time-Complexity: O(s^2) / Space-Complexity: O(s)
+# Deadline stops are ordered the way deadline-first nearest neighbor routing orders them, which keeps the morning drive
+# short, and every deadline counts the same however early it is. With skip_unreachable, a stop that can no longer be
+# reached by its deadline from where the truck is is passed over and visited after the stops that still can, so a
+# lost cause doesn't make the others late too. The EOD stops then go in with insert_stops, which keeps every stop that
+# is on time on time.
+def build_nearest_deadline_route(route, stops, stop_deadlines, skip_unreachable=False):
+    distance_matrix = route.distance_matrix
+    current_stop = route.stops[0]
+    time = route.arrivals[0]
+    remaining = {stop for stop in stops if stop in stop_deadlines}
+    unreachable = []
+    while remaining:
+        row = distance_matrix[current_stop]
+        candidates = remaining
+        if skip_unreachable:
+            candidates = [stop for stop in remaining
+                          if time + row[stop] * route.seconds_per_mile <= stop_deadlines[stop] + EPSILON]
+            if not candidates:
+                unreachable.extend(remaining)
+                break
+        next_stop = min(candidates, key=lambda stop: (row[stop], stop))
+        remaining.remove(next_stop)
+        route.insert(len(route.stops) - 1, next_stop, stop_deadlines[next_stop])
+        current_stop, time = next_stop, route.arrivals[-1]
+
+    # The stops that were out of reach are late anyway, they follow nearest neighbor too
+    while unreachable:
+        row = distance_matrix[current_stop]
+        current_stop = min(unreachable, key=lambda stop: (row[stop], stop))
+        unreachable.remove(current_stop)
+        route.insert(len(route.stops) - 1, current_stop, stop_deadlines[current_stop])
+
+    start_row = distance_matrix[route.stops[0]]
+    return insert_stops(route, sorted((stop for stop in stops if stop not in stop_deadlines),
+                                      key=lambda stop: -start_row[stop]), stop_deadlines)
+
+
+# Returns the number of packages a route delivers after their deadline
+# Time-Complexity: O(s + l log p) / Space-Complexity: O(1)
+# Where l is the number of late stops and p the number of packages at a stop. package_deadlines maps a stop to the
+# sorted deadlines of its packages; without it every late stop counts as one package.
+def late_package_count(route, package_deadlines=None):
+    late_count = 0
+    for i in route.late_positions():
+        if package_deadlines is None:
+            late_count += 1
+        else:
+            late_count += bisect_left(package_deadlines[route.stops[i]], route.arrivals[i] - EPSILON)
+    return late_count
+
+
+# Ways of building a time window route, see build_time_window_route
+ROUTE_BUILDERS = (build_insertion_route, build_nearest_deadline_route,
+                  partial(build_nearest_deadline_route, skip_unreachable=True))
+
+
+# Builds a route over stops that misses as few deadlines as it can, and is as short as it can be while doing so
+# Time-Complexity: O(s^2) / Space-Complexity: O(s)
+# Where s is the number of stops. Each of ROUTE_BUILDERS builds a route (cheapest insertion by deadline, and nearest
+# neighbor over the deadline stops with and without passing over the unreachable ones) and the one with the fewest
+# late packages, then the fewest miles, is kept. No single order wins on every load: inserting by deadline keeps
+# tight deadlines that nearest neighbor misses, but on long routes its detours make more packages late than they save.
+# stop_deadlines maps a stop to its earliest deadline in seconds since midnight, stops without one are due at EOD, and
+# package_deadlines (see late_package_count) is how late packages are counted.
+def build_time_window_route(start_stop, stops, stop_deadlines, distance_matrix, departure_time, travel_speed,
+                            package_deadlines=None):
+    stops = [stop for stop in dict.fromkeys(stops) if stop != start_stop]
+    best_route = best_cost = None
+    for build_route in ROUTE_BUILDERS:
+        route = build_route(TimeWindowRoute(start_stop, departure_time, travel_speed, distance_matrix), stops,
+                            stop_deadlines)
+        cost = (late_package_count(route, package_deadlines), route.distance())
+        if best_cost is None or cost < best_cost:
+            best_route, best_cost = route, cost
+    return best_route
+
+
+# Returns (stops, total distance) of build_time_window_route, the shape the route cache stores
+# Time-Complexity: O(s^2) / Space-Complexity: O(s)
+def build_route_stops(start_stop, stops, stop_deadlines, distance_matrix, departure_time, travel_speed,
+                      package_deadlines=None):
+    route = build_time_window_route(start_stop, stops, stop_deadlines, distance_matrix, departure_time, travel_speed,
+                                    package_deadlines)
+    return route.stops, route.distance()
+
+
+# Deadline-aware routing for a truck's loaded packages
+# Time-Complexity: O(n + s^2) / Space-Complexity: O(n)
+# N is the number of packages and s the number of distinct stops. Packages are grouped by stop (with the earliest
+# deadline of the stop's packages), the stops are ordered by build_time_window_route using the truck's travel speed and
+# hub departure time, and the stops are expanded back into package ids. Returns (route, total_distance, late_packages),
+# where the route starts with the truck's current location like calculate_shortest_route, and late_packages lists
+# (package id, arrival time, deadline) for every package that would still miss its delivery commitment time.
+# With a route_cache (see route_cache.RouteCache) the stop order of a load that was routed before with the same
+# deadlines, departure time and speed is reused, only its arrival times are recomputed. The late packages are those of
+# the route built here, route_optimizer.improve_truck_routes and exact_routing can still change them (see
+# delivery_times.late_deliveries for those of the final routes).
+def calculate_time_window_route(truck, loader, nodes=None, route_cache=None):
+    if nodes is None:
+        nodes = truck.loaded_packages
+    packages_by_stop = {}
+    package_deadlines = {}
+    for node in nodes:
+        stop = loader.get_address_id(node)
+        packages_by_stop.setdefault(stop, []).append(node)
+        deadline = loader.get_deadline(node)
+        if deadline is not None:
+            package_deadlines.setdefault(stop, []).append(deadline)
+    for deadlines in package_deadlines.values():
+        deadlines.sort()
+    stop_deadlines = {stop: deadlines[0] for stop, deadlines in package_deadlines.items()}
+
+    start_stop = loader.get_address_id(truck.current_location)
+    departure_time = truck.hub_departure_time.total_seconds()
+    if route_cache is None:
+        route = build_time_window_route(start_stop, packages_by_stop, stop_deadlines, loader.distances,
+                                        departure_time, truck.travel_speed, package_deadlines)
+    else:
+        options = ('time_window', departure_time, truck.travel_speed,
+                   frozenset((stop, tuple(deadlines)) for stop, deadlines in package_deadlines.items()))
+        stops, _ = route_cache.get_or_calculate(
+            start_stop, packages_by_stop, options,
+            lambda start_stop, stops: build_route_stops(start_stop, stops, stop_deadlines, loader.distances,
+                                                        departure_time, truck.travel_speed, package_deadlines))
+        route = TimeWindowRoute.from_stops(stops, [stop_deadlines.get(stop, inf) for stop in stops], departure_time,
+                                           truck.travel_speed, loader.distances)
+
+    package_route = [truck.current_location]
+    for stop in route.stops:
+        package_route.extend(packages_by_stop.get(stop, ()))
+
+    late_packages = []
+    for i in route.late_positions():
+        arrival = timedelta(seconds=route.arrivals[i])
+        for package_id in packages_by_stop[route.stops[i]]:
+            deadline = loader.hashtable.lookup(package_id).delivery_commitment_time
+            if deadline is not None and arrival > deadline:
+                late_packages.append((package_id, arrival, deadline))
+    return package_route, route.distance(), late_packages
@@ -1,10 +1,47 @@
-class Truck:
-    # Method for initializing instances of the Truck class
-    # Time-Complexity: O(1) / Space-Complexity: O(1)
-    def __init__(self, id, loaded_packages, hub_departure_time):
-        self.id = id
-        self.loaded_packages = loaded_packages  # Loaded packages (yet to be delivered)
-        self.current_location = 0  # Assuming truck starts at hub
-        self.travel_speed = 18
-        self.hub_departure_time = hub_departure_time
-        self.distance_traveled = 0
+# Packages a truck carries by default
+TRUCK_CAPACITY = 16
+
+
+class Truck:
+    # Fixed attribute slots instead of a per-object __dict__
+    __slots__ = ('id', 'loaded_packages', 'current_location', 'travel_speed', 'hub_departure_time',
+                 'distance_traveled', 'depot', 'day', 'capacity', 'max_weight', 'loaded_weight')
+
+    # Method for initializing instances of the Truck class
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # depot is the address id of the hub the truck starts from and day the index of the day it drives on (both only
+    # differ from 0 in fleet plans, see fleet_planner). capacity is the most packages and max_weight the most kilos
+    # (None for no limit) the truck carries, loaded_weight the kilos of the loaded packages.
+    def __init__(self, id, loaded_packages, hub_departure_time, depot=0, day=0, capacity=TRUCK_CAPACITY,
+                 max_weight=None, loaded_weight=0):
+        self.id = id
+        self.loaded_packages = loaded_packages  # Loaded packages (yet to be delivered)
+        self.current_location = 0  # Assuming truck starts at hub
+        self.travel_speed = 18
+        self.hub_departure_time = hub_departure_time
+        self.distance_traveled = 0
+        self.depot = depot
+        self.day = day
+        self.capacity = capacity
+        self.max_weight = max_weight
+        self.loaded_weight = loaded_weight
+
+    # Returns True if the truck has room for package_count more packages weighing 'weight' kilos
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # The package count and the weight are kept up to date by load / unload, so nothing is summed here.
+    def fits(self, package_count, weight):
+        if len(self.loaded_packages) + package_count > self.capacity:
+            return False
+        return self.max_weight is None or self.loaded_weight + weight <= self.max_weight
+
+    # Loads a package onto the truck
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def load(self, package):
+        self.loaded_packages.append(package.id)
+        self.loaded_weight += package.weight
+
+    # Unloads a package from the truck
+    # Time-Complexity: O(n) / Space-Complexity: O(1)
+    def unload(self, package):
+        self.loaded_packages.remove(package.id)
+        self.loaded_weight -= package.weight
@@ -0,0 +1,247 @@
+from datetime import timedelta
+from itertools import accumulate
+from math import ceil, inf
+from assignment import build_groups
+from nearest_neighbor import calculate_shortest_stop_route
+from truck import TRUCK_CAPACITY, Truck
+
+# How trucks are loaded: 'assign' fills a fixed number of trucks (see assignment.assign_packages), 'pack' uses as few
+# trucks as the capacities allow (see pack_packages)
+LOADINGS = ('assign', 'pack')
+
+
+class PackedLoad:
+    # Running totals of the packages of one truck while they are packed
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    # Count, kilos and departure window are kept as they grow, so whether one more group fits is checked in O(1) no
+    # matter how many packages the truck already has. A load has the same attributes as a PackageGroup (ready_time
+    # being the time the truck can leave), so a whole load can be checked against and added to another one. 'groups'
+    # holds the package groups in the load.
+    def __init__(self, day_start):
+        self.groups = []
+        self.package_ids = []
+        self.weight = 0
+        self.stops = set()
+        self.ready_time = day_start
+        self.latest_departure = None
+        self.required_truck = None
+
+    # Returns True if the group (or load) fits next to the packages already in the load, and those of 'pending' (a
+    # load of groups about to be added) if given
+    # Time-Complexity: O(1) / Space-Complexity: O(1)
+    def accepts(self, group, capacity, max_weight, pending=None):
+        package_count, weight = len(self.package_ids), self.weight
+        ready_time, latest_departure, required_truck = self.ready_time, self.latest_departure, self.required_truck
+        if pending is not None:
+            package_count += len(pending.package_ids)
+            weight += pending.weight
+            ready_time = max(ready_time, pending.ready_time)
+            if pending.latest_departure is not None and (latest_departure is None
+                                                         or pending.latest_departure < latest_departure):
+                latest_departure = pending.latest_departure
+            if pending.required_truck is not None:
+                required_truck = pending.required_truck
+        if group.required_truck is not None and required_truck not in (None, group.required_truck):
+            return False
+        return fits(package_count, weight, ready_time, latest_departure, group, capacity, max_weight)
+
+    # Adds the group (or load) to the load and updates the running totals
+    # Time-Complexity: O(g) / Space-Complexity: O(g)
+    # Where g is the number of packages and stops of the group.
+    def add(self, group):
+        if isinstance(group, PackedLoad):
+            self.groups.extend(group.groups)
+        else:
+            self.groups.append(group)
+        self.package_ids.extend(group.package_ids)
+        self.weight += group.weight
+        self.stops.update(group.stops)
+        self.ready_time = max(self.ready_time, group.ready_time)
+        if group.latest_departure is not None and (self.latest_departure is None
+                                                   or group.latest_departure < self.latest_departure):
+            self.latest_departure = group.latest_departure
+        if group.required_truck is not None:
+            self.required_truck = group.required_truck
+
+
+# Returns True if a group fits a load with the given package count, kilos and departure window
+# Time-Complexity: O(1) / Space-Complexity: O(1)
+# The truck leaves once its last package is at the hub, which has to be no later than any of its packages' latest
+# departures. max_weight is None for no weight limit.
+def fits(package_count, weight, departure_time, latest_departure, group, capacity, max_weight):
+    if package_count + len(group.package_ids) > capacity:
+        return False
+    if max_weight is not None and weight + group.weight > max_weight:
+        return False
+    departure_time = max(departure_time, group.ready_time)
+    for latest in (latest_departure, group.latest_departure):
+        if latest is not None and departure_time > latest:
+            return False
+    return True
+
+
+# Returns the fewest trucks any loading of the packages can use, from their count and total weight alone
+# Time-Complexity: O(n) / Space-Complexity: O(1)
+def truck_lower_bound(packages, capacity, max_weight=None):
+    trucks = ceil(len(packages) / capacity)
+    if max_weight is not None:
+        trucks = max(trucks, ceil(sum(package.weight for package in packages) / max_weight))
+    return trucks
+
+
+# Splits the groups, in giant tour order, into consecutive truck loads with the fewest trucks and then the fewest miles
+# Time-Complexity: O(g * c) / Space-Complexity: O(g)
+# Where g is the number of groups and c the capacity. The optimal split of the tour is a shortest path over the
+# positions between groups: position j is reached with trucks[j] trucks and miles[j] miles by the best split of the
+# first j groups, and a truck taking groups i..j-1 drives from the hub to group i and then along the tour to group j-1.
+# Package counts, kilos and tour miles are prefix sums, so any candidate truck's load and mileage are O(1) to read,
+# and its departure window grows with running max / min as the truck is extended one group at a time. The scan from i
+# stops at the first group that doesn't fit, which is at most c groups on. The truck count is compared first and the
+# mileage second. A truck takes at most one group limited to a truck (see pack_packages). 'legs' holds the tour
+# distance from the previous group to each group and 'hub_legs' the distance from the hub to each group.
+def split_tour(groups, legs, hub_legs, capacity, max_weight, day_start):
+    g = len(groups)
+    counts = list(accumulate((len(group.package_ids) for group in groups), initial=0))
+    weights = list(accumulate((group.weight for group in groups), initial=0))
+    tour_miles = list(accumulate(legs))
+    ready_times = [group.ready_time.total_seconds() for group in groups]
+    latest_departures = [inf if group.latest_departure is None else group.latest_departure.total_seconds()
+                         for group in groups]
+    required = [group.required_truck is not None for group in groups]
+    max_weight = inf if max_weight is None else max_weight
+    start = day_start.total_seconds()
+
+    trucks = [0] + [inf] * g
+    miles = [0.0] + [inf] * g
+    previous = [0] * (g + 1)
+    for i in range(g):
+        truck_count = trucks[i] + 1
+        base_miles = miles[i] + hub_legs[i] - tour_miles[i]
+        departure_time, latest_departure, has_required = start, inf, False
+        for j in range(i, g):
+            if counts[j + 1] - counts[i] > capacity or weights[j + 1] - weights[i] > max_weight:
+                break
+            if ready_times[j] > departure_time:
+                departure_time = ready_times[j]
+            if latest_departures[j] < latest_departure:
+                latest_departure = latest_departures[j]
+            if departure_time > latest_departure:
+                break
+            if required[j]:
+                if has_required:
+                    break
+                has_required = True
+            if truck_count < trucks[j + 1] or (truck_count == trucks[j + 1]
+                                               and base_miles + tour_miles[j] < miles[j + 1]):
+                trucks[j + 1] = truck_count
+                miles[j + 1] = base_miles + tour_miles[j]
+                previous[j + 1] = i
+
+    loads = []
+    j = g
+    while j > 0:
+        i = previous[j]
+        load = PackedLoad(day_start)
+        for group in groups[i:j]:
+            load.add(group)
+        loads.append(load)
+        j = i
+    loads.reverse()
+    return loads
+
+
+# Empties loads into the other loads where that's possible, smallest loads first, returns the remaining loads
+# Time-Complexity: O(l * (l log l + g)) average-case / Space-Complexity: O(l + g)
+# Where l is the number of loads and g the number of groups. split_tour can only cut the tour into consecutive pieces,
+# so two half-empty loads far apart in the tour order (e.g. one with a deadline, one without, or two limited to
+# different trucks) are never put together. Each load, from the smallest up, tries to hand every one of its groups to
+# another load, nearest on the tour first ('centers' holds the mean tour position of each load's stops). The groups
+# handed to a load so far are collected in a pending load, so every check is O(1) and nothing changes unless the
+# whole load can be emptied, which saves a truck. A load limited to a truck is only moved as a whole.
+def eliminate_loads(loads, centers, capacity, max_weight, day_start):
+    remaining = sorted(loads, key=lambda load: len(load.package_ids))
+    for load in list(remaining):
+        others = sorted((other for other in remaining if other is not load),
+                        key=lambda other: abs(centers[other] - centers[load]))
+        pending = {}
+        # A load limited to a truck can only move as a whole, its packages can't be spread over several trucks
+        for group in load.groups if load.required_truck is None else [load]:
+            for other in others:
+                if other.accepts(group, capacity, max_weight, pending.get(other)):
+                    if other not in pending:
+                        pending[other] = PackedLoad(day_start)
+                    pending[other].add(group)
+                    break
+            else:
+                break
+        else:
+            for other, groups in pending.items():
+                stop_count = len(other.stops)
+                other.add(groups)
+                centers[other] = (centers[other] * stop_count + centers[load] * len(load.stops)) / len(other.stops)
+            remaining.remove(load)
+    return remaining
+
+
+# Packs the given packages (all packages by default) onto as few trucks as possible, then keeps their mileage low
+# Time-Complexity: O(s^2 + g log g + g * c) / Space-Complexity: O(n + s)
+# Where s is the number of stops, g the number of package groups (see assignment.build_groups) and c the capacity.
+# Route first, cluster second: all stops are ordered into one giant nearest neighbor tour from the hub (with the
+# coordinate backend it uses the spatial grid instead of scanning every stop), and the groups are cut into consecutive
+# truck loads by split_tour, which minimizes the number of trucks and then the miles of the pieces. The groups are
+# ordered with the groups that have a deadline before those without, then by the time they are at the hub, then by their
+# place on the tour: packages that can leave together are next to each other, the groups due at EOD can fill up any load
+# (they can leave as late as need be), and within that consecutive stops are close together. Groups limited to a truck
+# by their notes are first packed into one load per truck id, which then takes part in the split as a single unit. Every
+# truck gets capacity packages and max_weight kilos (None for no limit), and leaves once all of its packages are at the
+# hub. Raises a ValueError if a group can't fit on any truck. Returns the trucks, numbered from 1 with the required
+# truck ids kept.
+def pack_packages(loader, capacity=TRUCK_CAPACITY, max_weight=None, packages=None, travel_speed=18,
+                  day_start=timedelta(hours=8), address_correction_time=timedelta(hours=10, minutes=20)):
+    if packages is None:
+        # Packages whose address couldn't be resolved can't be routed, see Loader.unresolved_packages
+        packages = [loader.hashtable.lookup(package_id) for package_id, node_id in loader.package_nodes.items()
+                    if node_id is not None]
+    units = []
+    required_loads = {}
+    for group in build_groups(packages, loader, travel_speed, day_start, address_correction_time):
+        if group.required_truck is None:
+            load = group
+        else:
+            load = required_loads.get(group.required_truck)
+            if load is None:
+                load = required_loads[group.required_truck] = PackedLoad(day_start)
+                units.append(load)
+            if not load.accepts(group, capacity, max_weight):
+                raise ValueError(f'Packages limited to truck {group.required_truck} do not fit on a single truck')
+            load.add(group)
+            continue
+        if not fits(0, 0, day_start, None, group, capacity, max_weight):
+            raise ValueError(f'Package group {sorted(group.package_ids)} does not fit on a single truck')
+        units.append(group)
+
+    distances = loader.distances
+    hub = loader.get_address_id(0)
+    tour, _ = calculate_shortest_stop_route(hub, {stop for unit in units for stop in unit.stops}, distances)
+    positions = {stop: position for position, stop in enumerate(tour)}
+    # A unit with several stops is placed at the one that comes first on the tour
+    first_stops = [min(unit.stops, key=positions.__getitem__) for unit in units]
+    order = sorted(range(len(units)), key=lambda i: (units[i].latest_departure is None, units[i].ready_time,
+                                                      positions[first_stops[i]]))
+    units = [units[i] for i in order]
+    first_stops = [first_stops[i] for i in order]
+    legs = [0.0] + [distances[a][b] for a, b in zip(first_stops, first_stops[1:])]
+    hub_legs = [distances[hub][stop] for stop in first_stops]
+    loads = split_tour(units, legs, hub_legs, capacity, max_weight, day_start)
+    loads = eliminate_loads(loads, {load: sum(map(positions.__getitem__, load.stops)) / len(load.stops)
+                                    for load in loads}, capacity, max_weight, day_start)
+
+    truck_ids = iter(truck_id for truck_id in range(1, len(loads) + len(required_loads) + 1)
+                     if truck_id not in required_loads)
+    trucks = []
+    for load in loads:
+        truck_id = load.required_truck if load.required_truck is not None else next(truck_ids)
+        trucks.append(Truck(truck_id, load.package_ids, load.ready_time, capacity=capacity, max_weight=max_weight,
+                            loaded_weight=load.weight))
+    trucks.sort(key=lambda truck: truck.id)
+    return trucks